@@ -1,42 +1,138 @@
+import argparse
+import json
+import time
 import subprocess
-import os
 import logging
-
-logging.basicConfig(level=logging.info)
+from gpu_telemetry import sample_gpu_records
 
 # Clocks Throttle Reason Codes: https://docs.nvidia.com/deploy/nvml-api/group__nvmlClocksThrottleReasons.html
 
-GPU_THROTTLE_QUERY = "clocks_event_reasons.active"
-GPU_CLOCKS_THROTTLE_REASON = {
-   '0x0000000000000008': 'HW_SLOWDOWN',
-   '0x000000000000004': 'HW_THERMAL_SLOWDOWN',
-   '0x0000000000000002': 'APPLICATIONS_CLOCK_SETTINGS',
-   '0x0000000000000100': 'DISPLAY_SETTINGS',
-   '0x0000000000000001': 'GPU_IDLE',
-   '0x0000000000000080': 'POWER_BRAKE_SLOWDOWN',
-   '0x0000000000000000': 'NONE',
-   '0x0000000000000004': 'SW_POWER_CAP',
-   '0x0000000000000020': 'SW_THERMAL_SLOWDOWN',
-   '0x0000000000000010': 'SYNC_BOOST'
+# Bit values of the clock event reason mask (nvmlClocksEventReasons)
+GPU_CLOCKS_THROTTLE_REASON_BITS = {
+   0x0000000000000001: 'GPU_IDLE',
+   0x0000000000000002: 'APPLICATIONS_CLOCK_SETTINGS',
+   0x0000000000000004: 'SW_POWER_CAP',
+   0x0000000000000008: 'HW_SLOWDOWN',
+   0x0000000000000010: 'SYNC_BOOST',
+   0x0000000000000020: 'SW_THERMAL_SLOWDOWN',
+   0x0000000000000040: 'HW_THERMAL_SLOWDOWN',
+   0x0000000000000080: 'POWER_BRAKE_SLOWDOWN',
+   0x0000000000000100: 'DISPLAY_SETTINGS',
 }
 
-def gather_gpu_clock_throttle_data():
-   gpu_clock_throttle_query_out = subprocess.check_output(['nvidia-smi', '--query-gpu=' + GPU_THROTTLE_QUERY, '--format=csv,noheader,nounits']).decode().strip()
-   gpu_clock_throttle_out_lines = gpu_clock_throttle_query_out.split('\n')
-   return gpu_clock_throttle_out_lines
-
-def check_gpu_clock_throttling():
-   gpu_clock_throttle_out_lines = gather_gpu_clock_throttle_data()
-   for i, line in enumerate(gpu_clock_throttle_out_lines):
-      gpu_clock_throttle_out_line = line.split(', ')
-      if gpu_clock_throttle_out_line[0] != GPU_CLOCKS_THROTTLE_REASON['0x0000000000000001'] and \
-         gpu_clock_throttle_out_line[0] != GPU_CLOCKS_THROTTLE_REASON['0x0000000000000000'] \
-         and gpu_clock_throttle_out_line[0] != GPU_CLOCKS_THROTTLE_REASON['0x0000000000000004']:
-         if gpu_clock_throttle_out_line[0] in GPU_CLOCKS_THROTTLE_REASON:
-            logging.debug(f"GPU {i} not throttled, reason={GPU_CLOCKS_THROTTLE_REASON[gpu_clock_throttle_out_line[0]]}")
-         else:
-            logging.debug(f"GPU {i} not throttled, reason={gpu_clock_throttle_out_line[0]}")
-      else:
-         logging.debug(f"GPU {i} not throttled, reason={gpu_clock_throttle_out_line[0]}")
+# Clocks held down by the hardware or by thermals: a GPU that shows these
+# persistently will drag every collective it takes part in
+GPU_THROTTLE_FAIL_REASONS = {'HW_SLOWDOWN', 'HW_THERMAL_SLOWDOWN', 'POWER_BRAKE_SLOWDOWN', 'SW_THERMAL_SLOWDOWN'}
+# Expected at the power limit under load, only worth a warning on an idle node
+GPU_THROTTLE_WARN_REASONS = {'SW_POWER_CAP', 'SYNC_BOOST'}
+
+def decode_throttle_reasons(mask):
+   """Names of every reason set in a clock event reason bitmask, ['NONE'] for 0."""
+   if isinstance(mask, str):
+      mask = int(mask, 16)
+   reasons = [name for bit, name in sorted(GPU_CLOCKS_THROTTLE_REASON_BITS.items()) if mask & bit]
+   unknown = mask & ~sum(GPU_CLOCKS_THROTTLE_REASON_BITS)
+   if unknown:
+      reasons.append(f"0x{unknown:x}")
+   return reasons or ['NONE']
+
+def sample_gpu_throttle(duration=5.0, interval=0.5):
+   """
+   Poll the clock event reasons of every GPU for duration seconds.
+   Returns ({gpu: [mask, ...]}, {gpu: GpuRecord}) with the last record seen
+   for each GPU.
+   """
+   masks = {}
+   records = {}
+   deadline = time.time() + duration
+   while True:
+      for gpu in sample_gpu_records():
+         records[gpu.index] = gpu
+         if gpu.clocks_event_reasons is not None:
+            masks.setdefault(gpu.index, []).append(gpu.clocks_event_reasons)
+      if time.time() + interval > deadline:
+         break
+      time.sleep(interval)
+   return masks, records
+
+def classify_throttle_reasons(masks, persistent_fraction=0.8):
+   """
+   {reason: {"fraction", "state"}} for every reason set in at least one
+   sample. A reason active in persistent_fraction of the samples or more is
+   "persistent", otherwise "transient".
+   """
+   reasons = {}
+   for mask in masks:
+      for reason in decode_throttle_reasons(mask):
+         reasons[reason] = reasons.get(reason, 0) + 1
+   results = {}
+   for reason, count in sorted(reasons.items()):
+      fraction = count / len(masks)
+      results[reason] = {"fraction": round(fraction, 3),
+                         "state": "persistent" if fraction >= persistent_fraction else "transient"}
+   return results
+
+def throttle_severity(reason, state):
+   """"Failed", "Warning" or None for a reason seen persistent/transient."""
+   if reason in GPU_THROTTLE_FAIL_REASONS:
+      return "Failed" if state == "persistent" else "Warning"
+   if reason in GPU_THROTTLE_WARN_REASONS and state == "persistent":
+      return "Warning"
+   return None
+
+def check_gpu_clock_throttling(duration=5.0, interval=0.5, persistent_fraction=0.8):
+   """
+   Sample the GPUs and return {"status": "Passed"|"Warning"|"Failed",
+   "results": {gpu: {...}}, "issues": [...]}. A GPU fails when a hardware or
+   thermal slowdown is persistent, and warns when one is transient or the
+   power cap is persistent.
+   """
+   masks, records = sample_gpu_throttle(duration, interval)
+   results = {}
+   issues = []
+   status = "Passed"
+   for gpu, record in sorted(records.items()):
+      gpu_masks = masks.get(gpu, [])
+      if not gpu_masks:
+         results[gpu] = {"pci": record.pci_bus_id, "serial": record.serial, "samples": 0, "reasons": {}, "status": "Unknown"}
+         logging.warning(f"GPU {gpu}: clock event reasons are not available")
+         continue
+      reasons = classify_throttle_reasons(gpu_masks, persistent_fraction)
+      gpu_status = "Passed"
+      for reason, info in reasons.items():
+         severity = throttle_severity(reason, info["state"])
+         if severity is None:
+            continue
+         if severity == "Failed" or gpu_status == "Passed":
+            gpu_status = severity
+         issues.append(f"GPU {gpu} ({record.pci_bus_id}): {reason} {info['state']} ({info['fraction']:.0%} of {len(gpu_masks)} samples)")
+      results[gpu] = {"pci": record.pci_bus_id, "serial": record.serial, "samples": len(gpu_masks),
+                      "sm_clock": record.clocks_sm, "max_sm_clock": record.clocks_max_sm,
+                      "reasons": reasons, "status": gpu_status}
+      if gpu_status == "Failed" or (gpu_status == "Warning" and status == "Passed"):
+         status = gpu_status
+      logging.debug(f"GPU {gpu}: {gpu_status}, reasons={reasons}")
+
+   return {"status": status, "results": results, "issues": issues}
+
 if __name__ == "__main__":
-   check_gpu_clock_throttling()
\ No newline at end of file
+   parser = argparse.ArgumentParser(description="Check the GPUs for clock throttling")
+   parser.add_argument("-l", "--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], default="INFO", help="Set the logging level default: INFO")
+   parser.add_argument("--duration", type=float, default=5.0, help="Seconds to sample the clock event reasons (default: %(default)s)")
+   parser.add_argument("--interval", type=float, default=0.5, help="Seconds between samples (default: %(default)s)")
+   parser.add_argument("--persistent-fraction", dest="persistent_fraction", type=float, default=0.8, help="Fraction of samples a reason must be active in to count as persistent (default: %(default)s)")
+   parser.add_argument("--json", action="store_true", help="Print the results as a single JSON line")
+   args = parser.parse_args()
+
+   logging.basicConfig(level=args.log_level)
+   try:
+      results = check_gpu_clock_throttling(args.duration, args.interval, args.persistent_fraction)
+   except (OSError, subprocess.CalledProcessError) as e:
+      logging.error(f"Unable to read the GPU clock event reasons: {e}")
+      results = {"status": "Unknown", "results": {}, "issues": [str(e)]}
+   if args.json:
+      print(json.dumps(results))
+   else:
+      for issue in results["issues"]:
+         logging.warning(issue)
+      logging.info(f"GPU Throttle Test: {results['status']}")
@@ -3,15 +3,23 @@
 import subprocess
 import re
 import argparse
+import concurrent.futures
 from datetime import datetime
 from shared_logging import logger
 from gpu_bw_test import BandwidthTest
 from rdma_link_flapping import LinkFlappingTest
 from xid_checker import XidChecker
+from check_runner import CheckRunner
+from gpu_telemetry import get_gpu_records, get_gpu_count
+from check_gpu_throttle import check_gpu_clock_throttling, throttle_severity
+from result_store import make_result, record, DEFAULT_DB
 import platform
 import os
 import requests
 
+# mlxreg/mlxlink calls in flight at once for the per-device checks
+MAX_DEVICE_WORKERS = 8
+
 def get_metadata():
     """ Make a request to metadata endpoint """
     headers = { 'Authorization' : 'Bearer Oracle' }
@@ -75,23 +83,29 @@ def get_oca_version():
         # Return the version
         return version
 
-def check_rttcc_status():
+def get_rttcc_device_status(device):
+    if not is_user_root():
+        command = ['sudo', 'mlxreg', '-d', device, '-y', '--get', '--reg_name=PPCC', '--indexes=local_port=1,pnat=0,lp_msb=0,algo_slot=0,algo_param_index=0']   
+    else:
+        command = ['mlxreg', '-d', device, '-y', '--set', 'cmd_type=3', '--reg_name=PPCC', '--indexes=local_port=1,pnat=0,lp_msb=0,algo_slot=0,algo_param_index=0']
+    result = subprocess.run(command, stdout=subprocess.PIPE)
+    output = result.stdout.decode('utf-8')
+    filtered_output = [line for line in output.split('\n') if line.startswith('value')]
+    for line in filtered_output:
+        logger.debug(line)
+        if "0x00000001" in line:
+            return "enabled"
+    return None
+
+def check_rttcc_status(max_workers=MAX_DEVICE_WORKERS):
     link_status = []
     devices = ["mlx5_0", "mlx5_1", "mlx5_3", "mlx5_4", "mlx5_5", "mlx5_6", "mlx5_7", "mlx5_8", "mlx5_9", "mlx5_10", "mlx5_12", "mlx5_13", "mlx5_14", "mlx5_15", "mlx5_16", "mlx5_17"]
     status = "disabled"
     status_dict = {"devices": {}}
-    for device in devices:
-        if not is_user_root():
-            command = ['sudo', 'mlxreg', '-d', device, '-y', '--get', '--reg_name=PPCC', '--indexes=local_port=1,pnat=0,lp_msb=0,algo_slot=0,algo_param_index=0']   
-        else:
-            command = ['mlxreg', '-d', device, '-y', '--set', 'cmd_type=3', '--reg_name=PPCC', '--indexes=local_port=1,pnat=0,lp_msb=0,algo_slot=0,algo_param_index=0']
-        result = subprocess.run(command, stdout=subprocess.PIPE)
-        output = result.stdout.decode('utf-8')
-        filtered_output = [line for line in output.split('\n') if line.startswith('value')]
-        for line in filtered_output:
-            logger.debug(line)
-            if "0x00000001" in line:
-                status_dict["devices"][device] = "enabled"
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for device, device_status in zip(devices, executor.map(get_rttcc_device_status, devices)):
+            if device_status:
+                status_dict["devices"][device] = device_status
     
     for device in status_dict["devices"]:
         if status_dict["devices"][device] == "enabled":
@@ -110,41 +124,22 @@ def check_rttcc_status():
 def check_ecc_errors():
     ecc_issues = []
     try:
-        # Run the nvidia-smi -q command
-        result = subprocess.run(['nvidia-smi', '-q'], stdout=subprocess.PIPE)
+        gpus = get_gpu_records()
     except FileNotFoundError:
         logger.warning("Skipping SRAM/DRAM ECC Test: nvidia-smi command not found")
         return []
-    
-    # Decode the output from bytes to string
-    output = result.stdout.decode('utf-8')
-
-    # Find the lines containing "SRAM Correctable" and "DRAM Correctable"
-    sram_matches = re.findall(r'SRAM Uncorrectable\s+:\s+(\d+)', output)
-    if len(sram_matches)==0:
-        sram_matches = re.findall(r'SRAM Uncorrectable Parity\s+:\s+(\d+)', output)
-    dram_matches = re.findall(r'DRAM Uncorrectable\s+:\s+(\d+)', output)
-    gpu_matches = re.findall(r'\nGPU\s+(.*)\n', output)
-    vol_sram_line = sram_matches[0::2]
-    vol_dram_line = dram_matches[0::2]
-    agg_sram_line = sram_matches[1::2]
-    agg_dram_line = dram_matches[1::2]
-
-    for i, gpu in enumerate(gpu_matches):
-        logger.debug(f"GPU: {gpu}")
-        if vol_sram_line[i] != "0":
-            logger.debug(f"Volatile SRAM Uncorrectable: {vol_sram_line[i]}")
-            ecc_issues.append(f"{gpu_matches[i]} - Volatile SRAM Uncorrectable: {vol_sram_line[i]}")
-        if vol_dram_line[i] != "0":
-            logger.debug(f"Volatile DRAM Uncorrectable: {vol_dram_line[i]}")
-            ecc_issues.append(f"{gpu_matches[i]} - Volatile DRAM Uncorrectable: {vol_dram_line[i]}")
-        if agg_sram_line[i] != "0":
-            logger.debug(f"Aggregate SRAM Uncorrectable: {agg_sram_line[i]}")
-            ecc_issues.append(f"{gpu_matches[i]} - Aggregate SRAM Uncorrectable: {agg_sram_line[i]}")
-        if agg_dram_line[i] != "0":
-            logger.debug(f"Aggregate DRAM Uncorrectable: {agg_dram_line[i]}")
-            ecc_issues.append(f"{gpu_matches[i]} - Aggregate DRAM Uncorrectable: {agg_dram_line[i]}")
 
+    counters = [("ecc_volatile_sram_uncorrectable", "Volatile SRAM Uncorrectable"),
+                ("ecc_volatile_dram_uncorrectable", "Volatile DRAM Uncorrectable"),
+                ("ecc_aggregate_sram_uncorrectable", "Aggregate SRAM Uncorrectable"),
+                ("ecc_aggregate_dram_uncorrectable", "Aggregate DRAM Uncorrectable")]
+    for gpu in gpus:
+        logger.debug(f"GPU: {gpu.pci_bus_id}")
+        for attr, label in counters:
+            value = getattr(gpu, attr)
+            if value:
+                logger.debug(f"{label}: {value}")
+                ecc_issues.append(f"{gpu.pci_bus_id} - {label}: {value}")
 
     # Check if there are ecc_issues
     if len(ecc_issues) == 0:
@@ -157,36 +152,25 @@ def check_ecc_errors():
 def check_row_remap_errors():
     remap_issues = []
     try:
-        # Run the nvidia-smi -q command
-        result = subprocess.run(['nvidia-smi', '--query-remapped-rows=remapped_rows.pending,remapped_rows.failure,remapped_rows.uncorrectable', '--format=csv,noheader'], stdout=subprocess.PIPE)
-    
-        if result.returncode != 0:
-            logger.debug(f"Check row remap command exited with error code: {result.returncode}")
-    
+        gpus = get_gpu_records()
     except FileNotFoundError:
         logger.warning("Skipping Row Remap Test: nvidia-smi command not found")
         return []
     
-    # Decode the output from bytes to string
-    output = result.stdout.decode('utf-8')
-    logger.debug("Output: {}".format(output))
-    for i, line in enumerate(output.split('\n')):
-        if line == "":
-            continue
-        tmp_data = line.split(",")
-        tmp_data = [x.strip() for x in tmp_data]
-        if tmp_data[0] != "0":
-            logger.debug(f"GPU: {i} - Row Remap Pending: {tmp_data[0]}")
-            remap_issues.append(f"GPU: {i} Row Remap Pending: {tmp_data[0]}")
-        if tmp_data[1] != "0":
-            logger.debug(f"GPU: {i} - Row Remap Failure: {tmp_data[1]}")
-            #remap_issues.append(f"GPU: {i} Row Remap Failure: {tmp_data[1]}")
-        if tmp_data[2] != "0":
-            logger.debug(f"GPU: {i} - Row Remap Uncorrectable: {tmp_data[2]}")
-            if int(tmp_data[2]) > 512:
-                remap_issues.append(f"GPU: {i} - Row Remap Uncorrectable >512: {tmp_data[2]}")
+    for gpu in gpus:
+        i = gpu.index
+        if gpu.remapped_rows_pending:
+            logger.debug(f"GPU: {i} - Row Remap Pending: {gpu.remapped_rows_pending}")
+            remap_issues.append(f"GPU: {i} Row Remap Pending: {gpu.remapped_rows_pending}")
+        if gpu.remapped_rows_failure:
+            logger.debug(f"GPU: {i} - Row Remap Failure: {gpu.remapped_rows_failure}")
+            #remap_issues.append(f"GPU: {i} Row Remap Failure: {gpu.remapped_rows_failure}")
+        if gpu.remapped_rows_uncorrectable:
+            logger.debug(f"GPU: {i} - Row Remap Uncorrectable: {gpu.remapped_rows_uncorrectable}")
+            if gpu.remapped_rows_uncorrectable > 512:
+                remap_issues.append(f"GPU: {i} - Row Remap Uncorrectable >512: {gpu.remapped_rows_uncorrectable}")
             else:
-                remap_issues.append(f"GPU: {i} - Row Remap Uncorrectable <512: {tmp_data[2]}")# Check if there are ecc_issues
+                remap_issues.append(f"GPU: {i} - Row Remap Uncorrectable <512: {gpu.remapped_rows_uncorrectable}")
     
     if len(remap_issues) == 0:
         logger.info("GPU Remap Test: Passed")
@@ -195,7 +179,57 @@ def check_row_remap_errors():
     
     return remap_issues
 
-def check_rdma_link_status():
+def get_rdma_link_device_issues(device):
+    status = True
+    link_issues = []
+    # Run the mlxlink command
+    if not is_user_root():
+        command = ['sudo', 'mlxlink', '-d', device, '-m', '-c', '-e']
+    else:
+        command = ['mlxlink', '-d', device, '-m', '-c', '-e']
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # Decode the output from bytes to string
+    output = result.stdout.decode('utf-8')
+    stderr = result.stderr.decode('utf-8')
+
+    if stderr and stderr.find("-E-") != -1:
+        stderr = stderr.split("\n")
+        stderr_line = ", ".join(stderr)
+        logger.debug(f"{device}: {stderr_line}")
+        link_issues.append(f"{device}: {stderr[0]}")
+        return False, link_issues
+
+    # Find the line containing "Recommendation"
+    color_pattern = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+    link_state = re.search(r'\nState.*', output).group().split(":")[1].strip()
+    recommendation = re.search(r'Recommendation.*', output).group().split(":")[1].strip()
+    vendor_serial_num = re.search(r'Vendor Serial Number.*', output).group().split(":")[1].strip()
+    nic_fw_version = re.search(r'Firmware Version.*', output).group().split(":")[1].strip()
+    cable_fw_version = re.search(r'FW Version.*', output).group().split(":")[1].strip()
+
+    # Remove hidden characters from the output
+    link_state = re.sub(color_pattern, '', link_state)
+    nic_fw_version = re.sub(color_pattern, '', nic_fw_version)
+    recommendation = re.sub(color_pattern, '', recommendation)
+
+    logger.debug(f"{device}: {vendor_serial_num} - {cable_fw_version} - {nic_fw_version} - {link_state} - {recommendation}")
+
+    # Extract the part after the ":" and print it along with the device name
+    if link_state != "Active":
+        logger.debug(f"{device}: {link_state}")
+        link_issues.append(f"{device} - {vendor_serial_num} - {cable_fw_version} - {nic_fw_version}: {link_state}")
+        status = False
+    if recommendation != "No issue was observed":
+        logger.debug(f"{device}: {recommendation}")
+        link_issues.append(f"{device} - {vendor_serial_num} - {cable_fw_version} - {nic_fw_version}: {recommendation}")
+        status = False
+    else:
+        logger.debug(f"{device}: {recommendation}")
+
+    return status, link_issues
+
+def check_rdma_link_status(max_workers=MAX_DEVICE_WORKERS):
     status = True
     metadata=get_metadata()
     shape=metadata['shape']
@@ -206,52 +240,11 @@ def check_rdma_link_status():
     elif shape == "BM.GPU4.8":
         devices = ["mlx5_0", "mlx5_1", "mlx5_2", "mlx5_3", "mlx5_6", "mlx5_7", "mlx5_8", "mlx5_9", "mlx5_10", "mlx5_11", "mlx5_12", "mlx5_13", "mlx5_14", "mlx5_15", "mlx5_16", "mlx5_17"]
     link_issues = []
-    for device in devices:
-        # Run the mlxlink command
-        if not is_user_root():
-            command = ['sudo', 'mlxlink', '-d', device, '-m', '-c', '-e']
-        else:
-            command = ['mlxlink', '-d', device, '-m', '-c', '-e']
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        # Decode the output from bytes to string
-        output = result.stdout.decode('utf-8')
-        stderr = result.stderr.decode('utf-8')
-
-        if stderr and stderr.find("-E-") != -1:
-            stderr = stderr.split("\n")
-            stderr_line = ", ".join(stderr)
-            logger.debug(f"{device}: {stderr_line}")
-            link_issues.append(f"{device}: {stderr[0]}")
-            status = "False"
-            continue
-
-        # Find the line containing "Recommendation"
-        color_pattern = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        link_state = re.search(r'\nState.*', output).group().split(":")[1].strip()
-        recommendation = re.search(r'Recommendation.*', output).group().split(":")[1].strip()
-        vendor_serial_num = re.search(r'Vendor Serial Number.*', output).group().split(":")[1].strip()
-        nic_fw_version = re.search(r'Firmware Version.*', output).group().split(":")[1].strip()
-        cable_fw_version = re.search(r'FW Version.*', output).group().split(":")[1].strip()
-
-        # Remove hidden characters from the output
-        link_state = re.sub(color_pattern, '', link_state)
-        nic_fw_version = re.sub(color_pattern, '', nic_fw_version)
-        recommendation = re.sub(color_pattern, '', recommendation)
-
-        logger.debug(f"{device}: {vendor_serial_num} - {cable_fw_version} - {nic_fw_version} - {link_state} - {recommendation}")
-
-        # Extract the part after the ":" and print it along with the device name
-        if link_state != "Active":
-            logger.debug(f"{device}: {link_state}")
-            link_issues.append(f"{device} - {vendor_serial_num} - {cable_fw_version} - {nic_fw_version}: {link_state}")
-            status = False
-        if recommendation != "No issue was observed":
-            logger.debug(f"{device}: {recommendation}")
-            link_issues.append(f"{device} - {vendor_serial_num} - {cable_fw_version} - {nic_fw_version}: {recommendation}")
-            status = False
-        else:
-            logger.debug(f"{device}: {recommendation}")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for device_status, device_issues in executor.map(get_rdma_link_device_issues, devices):
+            if not device_status:
+                status = False
+            link_issues.extend(device_issues)
 
     if status:
         logger.info(f"RDMA Link Status Check: Passed")
@@ -307,17 +300,13 @@ def check_gpu_count():
 
     # Check the number of GPUs
     try:
-        result = subprocess.run(['nvidia-smi', '--list-gpus'], stdout=subprocess.PIPE)
-        output = result.stdout.decode('utf-8')
-        lines = output.split('\n')
+        gpu_count = get_gpu_count()
         tmp_results = []
-        # remove empty lines
-        lines = [line for line in lines if line]
-        if len(lines) == 8:
+        if gpu_count == 8:
             logger.info("GPU Count Test: Passed")
         else:
             logger.warning("GPU Count Test: Failed")
-            tmp_results.append(f"Expected 8 GPUs, found {len(lines)} using nvidia-smi command")
+            tmp_results.append(f"Expected 8 GPUs, found {gpu_count} using nvidia-smi command")
         return tmp_results
 
     except FileNotFoundError:
@@ -347,130 +336,117 @@ def check_gpu_count():
             logger.warning("Skipping GPU count test: nvidia-smi and lspci commands not found")
             return None
 
+def check_link_flapping(lf_interval):
+    lft = LinkFlappingTest(time_interval=lf_interval)
+    lft.get_rdma_link_failures()
+    return lft.process_rdma_link_flapping()
+
+def check_xid(xid_interval):
+    xc = XidChecker(time_interval=xid_interval)
+    return xc.check_gpu_xid()
+
+def check_gpu_bw(bw_test_exe=None, mode="numa"):
+    if bw_test_exe:
+        bwt = BandwidthTest(bw_test_exe=bw_test_exe, mode=mode)
+    else:
+        bwt = BandwidthTest(mode=mode)
+    bwt.measure_gpu_bw()
+    return bwt.validate_results()
+
+def check_throttle(duration=5.0):
+    return check_gpu_clock_throttling(duration=duration)
+
 def slurm_reason(message):
     global slurm_drain_reason
     global slurm_error_count
     slurm_drain_reason+=(message+"\n")
     slurm_error_count+=1
 
+def add_result(check, metric, verdict, component=None, value=None, detail=None):
+    global db_results
+    db_results.append(make_result(check, metric, value, verdict, component, host_serial=host_serial, detail=detail))
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Check Host setup')
     parser.add_argument("-l", "--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], default="INFO", help="Set the logging level default: INFO")
     parser.add_argument('--bw-test', dest='bw_test', action='store_true', default=False, help='Run GPU bandwidth test (default: False)')
     parser.add_argument('--bw-test-exe', dest='bw_test_exe', help='Location to cuda-sampels bandwidthTest')
+    parser.add_argument('--bw-test-mode', dest='bw_test_mode', choices=['numa', 'all', 'serial'], default='numa', help='GPU bandwidth test scheduling: one GPU per NUMA node at a time, all GPUs at once, or serial (default: numa)')
     parser.add_argument('--lf-interval', dest='lf_interval', default=6, type=int, help='Link flapping interval with no flapping or link down events (default: 6 (hours))')
+    parser.add_argument('--xid-interval', dest='xid_interval', default=None, type=float, help='Only report GPU Xids logged in the last N hours (default: since boot)')
+    parser.add_argument('--throttle-duration', dest='throttle_duration', default=5.0, type=float, help='Seconds to sample the GPU clock throttle reasons (default: 5)')
+    parser.add_argument('--max-workers', dest='max_workers', default=None, type=int, help='Maximum number of checks to run at once (default: all independent checks)')
+    parser.add_argument('--max-device-workers', dest='max_device_workers', default=MAX_DEVICE_WORKERS, type=int, help=f'Maximum concurrent mlxreg/mlxlink calls per check (default: {MAX_DEVICE_WORKERS})')
     parser.add_argument('-a','--all', dest='run_all', action='store_true', default=False, help='Run all checks (default: False)')
     parser.add_argument('-slurm','--slurm', dest='slurm', action='store_true', default=False, help='Add a Slurm message')
+    parser.add_argument('--results-db', dest='results_db', default=DEFAULT_DB, help=f'Result database to add the findings to, empty to disable (default: {DEFAULT_DB})')
     args = parser.parse_args()
 
     logger.setLevel(args.log_level)
 
     datetime_str = datetime.now().strftime('%Y-%m-%d-%H%M%S')
     logger.info(f"Started GPU host setup check at: {datetime_str}")
-    try:
-        oca_version = get_oca_version()
-    except Exception as e:
-        logger.warning(f"Failed to get Oracle Cloud Agent version with error: {e}")
-        oca_version = "Unknown"
-    try:
-        rttcc_issues = check_rttcc_status()
-    except Exception as e:
-        logger.warning(f"Failed to check RTTCC status with error: {e}")
-        rttcc_issues = []
-
-    # Check for ECC errors
-    try:
-        ecc_issues = check_ecc_errors()
-    except Exception as e:
-        logger.warning(f"Failed to check ECC errors with error: {e}")
-        ecc_issues = []
-    
-    # Check for row remap errors
-    try:
-        remap_results = check_row_remap_errors()
-    except Exception as e:
-        logger.warning(f"Failed to check row remap errors with error: {e}")
-        remap_results = []
-
-    # Check RDMA link status
-    try:
-        rdma_link_issues = check_rdma_link_status()
-    except Exception as e:
-        logger.warning(f"Failed to check RDMA link status with error: {e}")
-        rdma_link_issues = []
-    
-    # Check for RDMA link flapping
-    try:
-        lft = LinkFlappingTest(time_interval=args.lf_interval)
-        lft.get_rdma_link_failures()
-        lft_issues = lft.process_rdma_link_flapping()
-    except Exception as e:
-        logger.warning(f"Failed to check RDMA link flapping with error: {e}")
-        lft_issues = {"failures": [], "link_down": []}
-
-    # Check for GPU Xid errors
-    try:
-        xc = XidChecker()
-        xid_results = xc.check_gpu_xid()
-    except Exception as e:
-        logger.warning(f"Failed to check GPU Xid errors with error: {e}")
-        xid_results = {"status": "None", "results": {}}
-
-    # Check GPU bandwidth
-    bwt_results = None
-    try:
-        if args.bw_test == True or args.run_all == True:
-            if args.bw_test_exe:
-                bwt = BandwidthTest(bw_test_exe=args.bw_test_exe)
-            else:
-                bwt = BandwidthTest()
-            bwt.measure_gpu_bw()
-            bwt_results = bwt.validate_results()
-    except Exception as e:
-        logger.warning(f"Failed to check GPU bandwidth with error: {e}")
-        bwt_results = None
-
-    # Check the bus
-    try:
-        bus_results = check_bus()
-    except Exception as e:
-        logger.warning(f"Failed to check the bus with error: {e}")
-        bus_results = None
-    
-    # Check the number of GPUs
-    try:
-        gpu_results = check_gpu_count()
-    except Exception as e:
-        logger.warning(f"Failed to check the number of GPUs with error: {e}")
-        gpu_results = None
-
-    # Summarize the results
-    try:
-        host_serial = get_host_serial()
-    except Exception as e:
-        logger.warning(f"Failed to get host serial number with error: {e}")
-        host_serial = "Unknown"
+    # Checks that share no resource run concurrently:
+    #   mlx5_reg - mlxreg/mlxlink register access to the NICs
+    #   gpu      - nvidia-smi queries use it, the bandwidth test needs the GPUs to itself
+    runner = CheckRunner(max_workers=args.max_workers)
+    runner.add("oca_version", get_oca_version, default="Unknown", description="get Oracle Cloud Agent version")
+    runner.add("rttcc", check_rttcc_status, args.max_device_workers, locks=["mlx5_reg"], default=[], description="check RTTCC status")
+    runner.add("ecc", check_ecc_errors, uses=["gpu"], default=[], description="check ECC errors")
+    runner.add("remap", check_row_remap_errors, uses=["gpu"], default=[], description="check row remap errors")
+    runner.add("rdma_link", check_rdma_link_status, args.max_device_workers, locks=["mlx5_reg"], default=[], description="check RDMA link status")
+    runner.add("link_flapping", check_link_flapping, args.lf_interval, default={"failures": [], "link_down": []}, description="check RDMA link flapping")
+    runner.add("xid", check_xid, args.xid_interval, default={"status": "None", "results": {}}, description="check GPU Xid errors")
+    if args.bw_test == True or args.run_all == True:
+        runner.add("bw_test", check_gpu_bw, args.bw_test_exe, args.bw_test_mode, locks=["gpu"], default=None, description="check GPU bandwidth")
+    runner.add("throttle", check_throttle, args.throttle_duration, uses=["gpu"], default=None, description="check GPU clock throttling")
+    runner.add("bus", check_bus, default=None, description="check the bus")
+    runner.add("gpu_count", check_gpu_count, uses=["gpu"], default=None, description="check the number of GPUs")
+    runner.add("host_serial", get_host_serial, default="Unknown", description="get host serial number")
+    results = runner.run()
+    for name, duration in runner.durations.items():
+        logger.debug(f"Check {name} took {duration:.1f}s")
+
+    oca_version = results["oca_version"]
+    rttcc_issues = results["rttcc"]
+    ecc_issues = results["ecc"]
+    remap_results = results["remap"]
+    rdma_link_issues = results["rdma_link"]
+    lft_issues = results["link_flapping"]
+    xid_results = results["xid"]
+    bwt_results = results.get("bw_test")
+    throttle_results = results["throttle"]
+    bus_results = results["bus"]
+    gpu_results = results["gpu_count"]
+    host_serial = results["host_serial"]
 
     slurm_drain_reason = ""
     slurm_error_count = 0
+    db_results = []
 
     logger.info(f"--------- Summary of Host setup check for {host_serial} ---------")
     if oca_version < "1.39.0":
         logger.error(f"Oracle Cloud Agent: {oca_version} needs to be updated to 1.39.0 or higher")
         slurm_reason("OCA version Error")
+        add_result("oca_version", "version", "Failed", detail=oca_version)
     if len(rttcc_issues) > 0:
         logger.error(f"RTTCC issues: {rttcc_issues}")
         slurm_reason("RTTCC Error")
+        for issue in rttcc_issues:
+            add_result("rttcc", "rttcc_enabled", "Failed", detail=str(issue))
     if len(ecc_issues) > 0:
         ecc_error=False
         for issue in ecc_issues:
             if "Skipped" in issue:
                 logger.warning(f"{host_serial} - {issue}")
+                add_result("ecc", "ecc_errors", "Warning", detail=issue)
             else:
                 if "Aggregate" in issue:
                     logger.warning(f"{host_serial} - ECC issues: {issue}")
+                    add_result("ecc", "ecc_errors", "Warning", detail=issue)
                 else:
                     logger.error(f"{host_serial} - ECC issues: {issue}")
+                    add_result("ecc", "ecc_errors", "Failed", detail=issue)
                     ecc_error=True
         if ecc_error:
             slurm_reason("ECC Error")
@@ -479,8 +455,10 @@ if __name__ == '__main__':
         for issue in remap_results:
             if "<512" in issue:
                 logger.warning(f"{host_serial} - {issue}")
+                add_result("remap", "row_remap", "Warning", detail=issue)
             else:
                 logger.error(f"{host_serial} - {issue}")
+                add_result("remap", "row_remap", "Failed", detail=issue)
                 remap_error=True
         if remap_error:
             slurm_reason("Remap Error")
@@ -489,30 +467,60 @@ if __name__ == '__main__':
             for pci in xid_results["results"][xid]["results"]:
                 logger.error(f"{host_serial} - GPU Xid {xid} device: {pci}, {xid_results['results'][xid]['description']}")
                 slurm_reason("XID Error")
+                add_result("xid", f"xid_{xid}", "Failed", component=pci, detail=xid_results['results'][xid]['description'])
     if len(rdma_link_issues) > 0:
         for issue in rdma_link_issues:
             logger.error(f"{host_serial} - RDMA link issues: {issue}")
             slurm_reason("RDMA Link Error")
+            add_result("rdma_link", "link_state", "Failed", component=str(issue).split(" ")[0], detail=str(issue))
     if len(lft_issues["failures"]) > 0 or len(lft_issues["link_down"]) > 0:
         if len(lft_issues["failures"]) > 0:
             for issue in lft_issues["failures"]:
                 logger.error(f"{host_serial} - RDMA link flapping issues: {issue}")
                 slurm_reason("RDMA Link Flapping Error")
+                add_result("link_flapping", "link_flaps", "Failed", detail=str(issue))
         if len(lft_issues["link_down"]) > 0:
             for issue in lft_issues["link_down"]:
                 logger.error(f"{host_serial} - RDMA link down issues: {issue}")
                 slurm_reason("RDMA Link Down Error")
+                add_result("link_flapping", "link_down", "Failed", detail=str(issue))
     if bwt_results != None:
         if bwt_results["status"] == "Failed":
             for issue in bwt_results["issues"]:
                 logger.error(f"{host_serial} - GPU bandwidth issues: {issue}")
                 slurm_reason("GPU Bwt Error")
+                add_result("bw_test", "gpu_bandwidth", "Failed", detail=str(issue))
+    if throttle_results != None:
+        for gpu, gpu_throttle in throttle_results["results"].items():
+            for reason, info in gpu_throttle["reasons"].items():
+                severity = throttle_severity(reason, info["state"])
+                message = f"{host_serial} - GPU throttle issues: GPU {gpu} ({gpu_throttle['pci']}) {reason} {info['state']} ({info['fraction']:.0%} of samples)"
+                if severity == "Failed":
+                    logger.error(message)
+                elif severity == "Warning":
+                    logger.warning(message)
+                if severity:
+                    add_result("throttle", reason, severity, component=f"GPU{gpu}", value=info["fraction"], detail=info["state"])
+        if throttle_results["status"] == "Failed":
+            slurm_reason("GPU Throttle Error")
     if bus_results:
         logger.error(f"{host_serial} - Bus issues: {bus_results}")
         slurm_reason("GPU Bus Error")
+        add_result("bus", "gpu_bus", "Failed", detail=str(bus_results))
     if gpu_results:
         logger.error(f"{host_serial} - Missing GPU(s): {gpu_results}")
         slurm_reason("Missing GPU Error")
+        add_result("gpu_count", "missing_gpus", "Failed", detail=str(gpu_results))
+
+    # Checks that could not run are recorded as warnings, checks without findings as passed
+    for name in results:
+        if name == "host_serial" or any(r["check_name"] == name for r in db_results):
+            continue
+        if name in runner.errors:
+            add_result(name, "error", "Warning", detail=runner.errors[name])
+        else:
+            add_result(name, "issues", "Passed", value=0)
+    record(db_results, args.results_db)
 
     datetime_str = datetime.now().strftime('%Y-%m-%d-%H%M%S')
     logger.info(f"Finished GPU host setup check at: {datetime_str}")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# Run independent health checks concurrently.
+#
+# Every check declares the node resources it touches. Checks that share
+# nothing run at the same time; a check that `locks` a resource runs alone on
+# it, while checks that only `use` a resource may overlap with each other.
+# E.g. the GPU bandwidth test locks "gpu" so nvidia-smi queries (which use
+# "gpu") never run during the measurement, but ECC, row remap and GPU count
+# queries still run in parallel with one another.
+
+import concurrent.futures
+import time
+from shared_logging import logger
+
+
+class Check:
+    def __init__(self, name, func, args=(), kwargs=None, uses=(), locks=(), default=None, description=None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.uses = set(uses)
+        self.locks = set(locks)
+        self.default = default
+        self.description = description or name
+
+    def run(self):
+        return self.func(*self.args, **self.kwargs)
+
+
+class CheckRunner:
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self.checks = []
+        self.durations = {}
+        self.errors = {}
+
+    def add(self, name, func, *args, uses=(), locks=(), default=None, description=None, **kwargs):
+        self.checks.append(Check(name, func, args, kwargs, uses, locks, default, description))
+
+    @staticmethod
+    def _can_start(check, running):
+        for other in running:
+            if check.locks & (other.locks | other.uses):
+                return False
+            if check.uses & other.locks:
+                return False
+        return True
+
+    def run(self):
+        """
+        Run all checks and return {name: result}. A check that raises is
+        logged and reported with its default result, like the sequential
+        try/except blocks this replaces.
+        """
+        results = {}
+        pending = list(self.checks)
+        running = {}
+        started = {}
+        max_workers = self.max_workers or max(len(self.checks), 1)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                # Start checks in declaration order as soon as their resources are free
+                for check in list(pending):
+                    if len(running) >= max_workers:
+                        break
+                    if self._can_start(check, running.values()):
+                        pending.remove(check)
+                        logger.debug(f"Starting check: {check.name}")
+                        started[check.name] = time.time()
+                        running[executor.submit(check.run)] = check
+
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    check = running.pop(future)
+                    self.durations[check.name] = time.time() - started[check.name]
+                    try:
+                        results[check.name] = future.result()
+                    except Exception as e:
+                        logger.warning(f"Failed to {check.description} with error: {e}")
+                        self.errors[check.name] = str(e)
+                        results[check.name] = check.default
+                    logger.debug(f"Finished check: {check.name} in {self.durations[check.name]:.1f}s")
+        return results
@@ -4,6 +4,9 @@
 
 import os, sys
 import subprocess
+import json
+import signal
+import time
 import pandas as pd
 import numpy as np
 import logging
@@ -14,6 +17,9 @@ from natsort import index_natsorted
 import argparse
 import socket
 import logging.config
+from gpu_telemetry import get_gpu_count, get_gpu_records
+from gpu_sampler import TelemetrySampler
+from result_store import make_result, record, DEFAULT_DB
 
 logging.config.fileConfig('logging.conf')
 
@@ -78,27 +84,164 @@ def install_gpu_burn():
     
     return True
 
-def run_gpu_burn(gpu_burn_dir, gpu_id):
-    # Run GPU burn
+# gpu_burn progress line, e.g. "50.0%  proc'd: 2345 (45678 Gflop/s)   errors: 0   temps: 60 C"
+PROGRESS_PATTERN = re.compile(r"(\d+\.\d+)%.+?(\d+) Gflop/s.+?errors: (\d+).*?temps: (\d+) C")
+
+# Samples from the first part of the run (clocks and temperature ramping up)
+# are ignored for collapse detection and the sustained throughput statistics
+WARMUP_FRACTION = 0.1
+# Abort when Gflop/s stays below this fraction of the peak for this many samples
+COLLAPSE_FRACTION = 0.5
+COLLAPSE_SAMPLES = 3
+
+
+# Burn profiles per GPU model. "default" is the original 15 second check,
+# "smoke" a 10 second prolog screen and "soak" an acceptance burn-in.
+#   duration        - seconds passed to gpu_burn
+#   doubles         - gpu_burn -d (FP64 GEMM), otherwise FP32
+#   tensor_cores    - gpu_burn -tc
+#   gflops_threshold- minimum sustained (p10) Gflop/s per GPU
+#   temp_threshold  - maximum GPU temperature in C
+#   pass_curve      - [(progress %, fraction of gflops_threshold)]: the median
+#                     Gflop/s between consecutive points must stay above the
+#                     fraction, so slow decay over a long burn is caught
+BURN_PROFILES = {
+    "H100": {
+        "default": {"duration": 15, "doubles": True, "tensor_cores": False, "gflops_threshold": 40000, "temp_threshold": 80, "pass_curve": []},
+        "smoke": {"duration": 10, "doubles": True, "tensor_cores": False, "gflops_threshold": 40000, "temp_threshold": 80, "pass_curve": [(100, 1.0)]},
+        "soak": {"duration": 1800, "doubles": True, "tensor_cores": True, "gflops_threshold": 40000, "temp_threshold": 85, "pass_curve": [(25, 1.0), (50, 0.98), (100, 0.95)]},
+    },
+    "H200": {
+        "default": {"duration": 15, "doubles": True, "tensor_cores": False, "gflops_threshold": 42000, "temp_threshold": 80, "pass_curve": []},
+        "smoke": {"duration": 10, "doubles": True, "tensor_cores": False, "gflops_threshold": 42000, "temp_threshold": 80, "pass_curve": [(100, 1.0)]},
+        "soak": {"duration": 1800, "doubles": True, "tensor_cores": True, "gflops_threshold": 42000, "temp_threshold": 85, "pass_curve": [(25, 1.0), (50, 0.98), (100, 0.95)]},
+    },
+    "B200": {
+        "default": {"duration": 15, "doubles": True, "tensor_cores": False, "gflops_threshold": 30000, "temp_threshold": 85, "pass_curve": []},
+        "smoke": {"duration": 10, "doubles": True, "tensor_cores": False, "gflops_threshold": 30000, "temp_threshold": 85, "pass_curve": [(100, 1.0)]},
+        "soak": {"duration": 1800, "doubles": True, "tensor_cores": True, "gflops_threshold": 30000, "temp_threshold": 90, "pass_curve": [(25, 1.0), (50, 0.98), (100, 0.95)]},
+    },
+    "GB200": {
+        "default": {"duration": 15, "doubles": True, "tensor_cores": False, "gflops_threshold": 34000, "temp_threshold": 80, "pass_curve": []},
+        "smoke": {"duration": 10, "doubles": True, "tensor_cores": False, "gflops_threshold": 34000, "temp_threshold": 80, "pass_curve": [(100, 1.0)]},
+        "soak": {"duration": 1800, "doubles": True, "tensor_cores": True, "gflops_threshold": 34000, "temp_threshold": 85, "pass_curve": [(25, 1.0), (50, 0.98), (100, 0.95)]},
+    },
+}
+
+SHAPE_GPU_MODELS = {
+    "BM.GPU.H100.8": "H100",
+    "BM.GPU.H200.8": "H200",
+    "BM.GPU.B200.8": "B200",
+    "BM.GPU.GB200.4": "GB200",
+}
+
+
+def get_gpu_model(shape=None):
+    """GPU model key of BURN_PROFILES from the shape name, else from the nvidia-smi GPU name."""
+    if shape:
+        if shape not in SHAPE_GPU_MODELS:
+            raise ValueError(f"Unknown shape: {shape}")
+        return SHAPE_GPU_MODELS[shape]
+    names = [gpu.name or "" for gpu in get_gpu_records()]
+    # GB200 before B200, the GPU name of both contains "B200"
+    for model in ("GB200", "B200", "H200", "H100"):
+        if any(model in name for name in names):
+            return model
+    logging.warning(f"No burn profile for GPU {names[0] if names else 'Unknown'}, using H100 profiles")
+    return "H100"
+
+
+def get_burn_profile(profile="default", model=None, shape=None, **overrides):
+    """Copy of BURN_PROFILES[model][profile] with any non-None overrides applied."""
+    model = model or get_gpu_model(shape)
+    if profile not in BURN_PROFILES[model]:
+        raise ValueError(f"Unknown burn profile: {profile}")
+    settings = dict(BURN_PROFILES[model][profile], model=model, profile=profile)
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    return settings
+
+
+def check_pass_curve(series, profile):
+    """Return a failure reason when a pass_curve segment falls below its floor, else ""."""
+    start = 0.0
+    for progress, fraction in profile.get("pass_curve", []):
+        segment = [sample["gflops"] for sample in series
+                   if start < sample["progress"] <= progress and sample["progress"] >= WARMUP_FRACTION * 100]
+        floor = fraction * profile["gflops_threshold"]
+        if segment and np.median(segment) < floor:
+            return f"Median {np.median(segment):.0f} Gflop/s at {start:.0f}-{progress:.0f}% < {floor:.0f}"
+        start = progress
+    return ""
+
+
+def stop_gpu_burn(proc):
+    # gpu_burn forks a worker per GPU, so signal the whole process group
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+    except ProcessLookupError:
+        pass
+
+
+def run_gpu_burn(gpu_burn_dir, gpu_id, duration=15, doubles=True, tensor_cores=False):
+    """
+    Run gpu_burn on one GPU and follow its progress lines as they are printed.
+    Returns the raw output plus a time series of {time, progress, gflops, temp,
+    errors}; the run is stopped early on compute errors or a Gflop/s collapse.
+    """
     logging.info(f"Running GPU burn on GPU {gpu_id} in {gpu_burn_dir}")
-    #os.chdir(gpu_burn_dir)
-    cmd = f"{gpu_burn_dir}/gpu_burn -i {gpu_id} -d -stts 1 -c {gpu_burn_dir}/compare.ptx 15"
-    logging.debug(cmd)
-    output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-    
+    cmd = [f"{gpu_burn_dir}/gpu_burn", "-i", str(gpu_id)]
+    if doubles:
+        cmd.append("-d")
+    if tensor_cores:
+        cmd.append("-tc")
+    cmd += ["-stts", "1", "-c", f"{gpu_burn_dir}/compare.ptx", str(duration)]
+    logging.debug(" ".join(cmd))
+    # universal_newlines also splits on the \r gpu_burn uses between progress updates
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, start_new_session=True)
+
+    start = time.time()
+    output = []
+    series = []
+    aborted = None
+    peak = 0.0
+    low_count = 0
+    for line in proc.stdout:
+        output.append(line)
+        m = PROGRESS_PATTERN.search(line)
+        if not m:
+            continue
+        progress, gflops, errors, temp = float(m.group(1)), float(m.group(2)), int(m.group(3)), int(m.group(4))
+        series.append({"time": round(time.time() - start, 2), "progress": progress, "gflops": gflops, "temp": temp, "errors": errors})
+
+        if errors > 0:
+            aborted = f"{errors} compute errors"
+        elif progress >= WARMUP_FRACTION * 100:
+            peak = max(peak, gflops)
+            low_count = low_count + 1 if gflops < COLLAPSE_FRACTION * peak else 0
+            if low_count >= COLLAPSE_SAMPLES:
+                aborted = f"Gflop/s collapsed to {gflops:.0f} from {peak:.0f}"
+        if aborted:
+            logging.error(f"Aborting GPU burn on GPU {gpu_id}: {aborted}")
+            stop_gpu_burn(proc)
+            break
+    proc.wait()
+    output = "".join(output)
+
     # Write the output to a file
     with open(f"gpu_burn_{gpu_id}.log", "w") as f:
-        f.write(output.stdout)
+        f.write(output)
 
-    if output.returncode != 0:
+    if proc.returncode != 0 and not aborted:
         logging.error(f"Error running GPU burn on GPU {gpu_id}")
-        logging.error(f"stdout: {output.stdout}")
-        logging.error(f"stderr: {output.stderr}")
-        return False
-    else:
-        return {"gpu_id": gpu_id, "output": output.stdout}
+        logging.error(f"output: {output}")
+        aborted = f"gpu_burn exited with {proc.returncode}"
+    return {"gpu_id": gpu_id, "output": output, "series": series, "aborted": aborted}
     
-def parse_gpu_burn_output(input, host_info):
+def parse_gpu_burn_output(input, host_info, profile=None):
     # Parse GPU burn output
     #logging.debug(f"output: {input['output']}")
 
@@ -108,54 +251,75 @@ def parse_gpu_burn_output(input, host_info):
     # Get the output
     output = input["output"]
 
-    # Find all of the Gflops and temperatures values
-    pattern = r"(\d+.\d+)%.+?(\d+) Gflop/s.+?temps: (\d+) C"
-
-    matches = re.findall(pattern, output)
+    # Progress samples collected while gpu_burn ran, or parsed from the captured output
+    series = input.get("series")
+    if series is None:
+        series = []
+        for m in PROGRESS_PATTERN.finditer(output):
+            series.append({"progress": float(m.group(1)), "gflops": float(m.group(2)), "errors": int(m.group(3)), "temp": int(m.group(4))})
 
     # Create a dictionary to store the values
     results = {"host": host_info["serial"], "hostname": host_info["hostname"],"gpu_id": [gpu_id]}
 
-    # Loop through the matches and store the values
-    gflops = []
-    temps = []
-    for match in matches:
-        gflops.append(float(match[1]))
-        temps.append(int(match[2]))
-    
-    results["max_gflops"] = np.max(gflops)
-    results["max_temp"] = np.max(temps)
-    results["status"] = "Passed"
+    gflops = [sample["gflops"] for sample in series]
+    temps = [sample["temp"] for sample in series]
+    # Sustained throughput: ignore the warm up samples unless that is all there is
+    sustained = [sample["gflops"] for sample in series if sample["progress"] >= WARMUP_FRACTION * 100] or gflops
+
+    results["max_gflops"] = np.max(gflops) if gflops else 0.0
+    results["p10_gflops"] = np.percentile(sustained, 10) if sustained else 0.0
+    results["median_gflops"] = np.median(sustained) if sustained else 0.0
+    results["max_temp"] = np.max(temps) if temps else 0
+    results["errors"] = max([sample["errors"] for sample in series], default=0)
+    results["samples"] = len(series)
+    results["aborted"] = input.get("aborted") or ""
+    results["curve"] = check_pass_curve(series, profile) if profile else ""
+    if input.get("aborted"):
+        results["status"] = f"Failed - {input['aborted']}"
+    elif "FAULTY" in output:
+        results["status"] = "Failed - FAULTY"
+    else:
+        results["status"] = "Passed"
 
     logging.debug(f"results: {results}")
     df = pd.DataFrame(results)
     return df
 
-def execute_gpu_burn(gpu_burn_dir, host_info):
-    # Get the number of GPUs from NVIDIA SMI
-    cmd = "nvidia-smi --query-gpu=count --format=csv,noheader"
-    output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+def execute_gpu_burn(gpu_burn_dir, host_info, series=None, profile=None, sampler=None):
+    if profile is None:
+        profile = get_burn_profile()
 
-    if output.returncode != 0:
+    # Get the number of GPUs
+    try:
+        gpu_count = get_gpu_count()
+    except (OSError, subprocess.CalledProcessError) as e:
         logging.error(f"Error getting GPU count")
-        logging.error(f"stdout: {output.stdout}")
-        logging.error(f"stderr: {output.stderr}")
+        logging.error(f"error: {e}")
         return False
-    
-    # Get the GPU count
-    gpu_count = int(output.stdout.strip().count('\n') + 1)
 
     # run GPU burn on all GPUs in parallel
     results = pd.DataFrame()
+    if sampler is not None:
+        sampler.start()
     with concurrent.futures.ThreadPoolExecutor(max_workers=gpu_count) as executor:
-        futures = {executor.submit(run_gpu_burn, gpu_burn_dir, i): i for i in range(gpu_count)}
+        futures = {executor.submit(run_gpu_burn, gpu_burn_dir, i, profile["duration"], profile["doubles"], profile["tensor_cores"]): i for i in range(gpu_count)}
 
         results = pd.DataFrame()
         for future in concurrent.futures.as_completed(futures):
-            data = parse_gpu_burn_output(future.result(), host_info)
+            result = future.result()
+            if series is not None:
+                series[result["gpu_id"]] = result["series"]
+            data = parse_gpu_burn_output(result, host_info, profile)
             #logging.debug(f"data: {data}")
             results = pd.concat([results,data], ignore_index=True)
 
+    # Attach what the GPUs did while burning: throttle reasons, clocks, power and error counters
+    if sampler is not None:
+        sampler.stop()
+        telemetry = sampler.summary()
+        for column in ["throttled", "sm_clock_median", "power_mean", "ecc_delta", "pcie_replays"]:
+            results[column] = [telemetry.get(gpu_id, {}).get(column) for gpu_id in results["gpu_id"]]
+
     # Sort the results by GPU ID
     results = results.sort_values(by="gpu_id")
 
@@ -163,23 +327,45 @@ def execute_gpu_burn(gpu_burn_dir, host_info):
 
     return results
 
-def check_gpu_burn_results(df):
+def check_gpu_burn_results(df, profile):
 
-    max_gflops_threshold = 40000
-    avg_temp_threshold = 80
+    max_gflops_threshold = profile["gflops_threshold"]
+    avg_temp_threshold = profile["temp_threshold"]
 
-    # Check GPU burn results
-    df.loc[df['max_gflops'] < max_gflops_threshold, 'status'] = f'Failed - GFlops > {max_gflops_threshold}'
-    df.loc[df['max_temp'] > avg_temp_threshold, 'status'] = f'Failed - Temp > {avg_temp_threshold}'
+    # Check GPU burn results against the sustained (p10) throughput, not the peak.
+    # Each rule only applies to GPUs still passing, so the first failure reason is kept
+    df.loc[(df['status'] == 'Passed') & (df['p10_gflops'] < max_gflops_threshold), 'status'] = f'Failed - GFlops < {max_gflops_threshold}'
+    df.loc[(df['status'] == 'Passed') & (df['max_temp'] > avg_temp_threshold), 'status'] = f'Failed - Temp > {avg_temp_threshold}'
+    df.loc[(df['status'] == 'Passed') & (df['curve'] != ''), 'status'] = 'Failed - ' + df['curve']
 
     return df
 
+# Per-GPU columns stored in the result database, each with the verdict of its GPU
+BURN_METRICS = ["p10_gflops", "median_gflops", "max_gflops", "max_temp", "errors",
+                "sm_clock_median", "power_mean", "ecc_delta", "pcie_replays"]
+
+def burn_results(df, host_info):
+    rows = []
+    for row in df.to_dict('records'):
+        for metric in BURN_METRICS:
+            if metric in row:
+                rows.append(make_result("gpu_burn", metric, row[metric], row['status'], component=f"GPU{row['gpu_id']}",
+                                        host_serial=host_info['serial'], hostname=host_info['hostname'],
+                                        detail=row['status'] if row['status'] != 'Passed' else None))
+    return rows
+
 def main(args,gpu_burn_dir,host_info):
+    profile = get_burn_profile(args.profile, model=args.gpu_model, shape=args.shape,
+                               duration=args.duration, gflops_threshold=args.gflops_threshold)
+    logging.info(f"GPU burn profile: {profile}")
+
     # Execute GPU burn
-    results = execute_gpu_burn(gpu_burn_dir, host_info)
+    series = {}
+    sampler = TelemetrySampler(args.sample_interval) if args.sample_interval > 0 else None
+    results = execute_gpu_burn(gpu_burn_dir, host_info, series, profile, sampler)
 
     # Check GPU burn results
-    df = check_gpu_burn_results(results)
+    df = check_gpu_burn_results(results, profile)
 
     # Tabulate the df
     # Filter the dataframe
@@ -212,6 +398,19 @@ def main(args,gpu_burn_dir,host_info):
     else:
         logging.error(f"Invalid file format: {args.file_format}")
 
+    # Per-GPU Gflop/s and temperature time series
+    with open(f"gpu_burn_{host_info['serial']}_series_{args.date_stamp}.json", "w") as f:
+        json.dump({str(gpu_id): samples for gpu_id, samples in sorted(series.items())}, f)
+
+    # Telemetry sampled during the burn
+    if sampler is not None and len(sampler):
+        try:
+            sampler.write(f"gpu_burn_{host_info['serial']}_telemetry_{args.date_stamp}.parquet")
+        except ImportError:
+            sampler.write(f"gpu_burn_{host_info['serial']}_telemetry_{args.date_stamp}.csv")
+
+    record(burn_results(df, host_info), args.results_db)
+
     return results
 
 if __name__ == "__main__":
@@ -225,9 +424,15 @@ if __name__ == "__main__":
     parser.add_argument('-q', '--quiet', action='store_true', help='Suppress output to the console (default: %(default)s)')
     parser.add_argument('--gpu_burn_dir', default='/opt/oci-hpc/gpu-burn', help='Set the GPU burn directory (default: %(default)s)')
     parser.add_argument('--file_format', default='json', help='Set the output file format: csv,json (default: %(default)s')
-    parser.add_argument('--gflops_threshold', type=int, default=40000, help='Set the GFlops threshold (default: %(default)s)')
+    parser.add_argument('--gflops_threshold', type=int, default=None, help='Override the sustained GFlops threshold of the profile')
+    parser.add_argument('--profile', choices=['default', 'smoke', 'soak'], default='default', help='Burn profile: default (15s), smoke (10s prolog screen) or soak (long burn-in) (default: %(default)s)')
+    parser.add_argument('--duration', type=int, default=None, help='Override the burn duration of the profile in seconds')
+    parser.add_argument('--gpu_model', choices=sorted(BURN_PROFILES), default=None, help='GPU model profiles to use (default: detected from nvidia-smi)')
+    parser.add_argument('--shape', choices=sorted(SHAPE_GPU_MODELS), default=None, help='Select the GPU model profiles by shape')
+    parser.add_argument('--sample_interval', type=float, default=1.0, help='Seconds between GPU telemetry samples during the burn, 0 to disable (default: %(default)s)')
     parser.add_argument('--date_stamp', type=str, help='The date stamp to use')
     parser.add_argument('--output_dir', type=str, help='The output directory to use')
+    parser.add_argument('--results_db', default=DEFAULT_DB, help='Result database to add the results to, empty to disable (default: %(default)s)')
 
     # Execute the parse_args() method
     args = parser.parse_args()
@@ -258,6 +463,7 @@ if __name__ == "__main__":
         logging.basicConfig(level=numeric_level)
 
     # Install GPU burn if not found
+    gpu_burn_dir = args.gpu_burn_dir
     if not os.path.exists(args.gpu_burn_dir):
         test_dir = "/tmp"
         os.chdir(test_dir)
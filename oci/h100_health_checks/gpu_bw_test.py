@@ -1,20 +1,60 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
+import fcntl
+import re
+import statistics
 import subprocess
 import os
 import socket
 import time
 import json
 from shared_logging import logger
-import re
+from gpu_telemetry import get_gpu_count, get_gpu_numa_nodes, get_gpu_processes
+
+
+# Prefix of the JSON lines printed with --stream, read by run_gpu_bw_test.py
+STREAM_PREFIX = "BW_RESULT "
+
+# One row of a bandwidthTest result table: "   32000000\t\t\t53.6"
+BW_ROW_PATTERN = re.compile(r"^\s+(\d+)\s+(\d+(?:\.\d+)?)\s*$", re.MULTILINE)
+
+
+def robust_stats(values):
+    """(median, MAD) of values, ignoring failed (-1) samples."""
+    values = [v for v in values if v >= 0]
+    if not values:
+        return None, None
+    med = statistics.median(values)
+    return med, statistics.median([abs(v - med) for v in values])
+
+
+def parse_bw_output(output):
+    """{transfer_size: GB/s} for every row of a bandwidthTest result table."""
+    curve = {}
+    for m in BW_ROW_PATTERN.finditer(output):
+        curve[int(m.group(1))] = float(m.group(2))
+    return curve
 
 
 class BandwidthTest:
-    def __init__(self, iteration=1, size=32000000, bw_test_exe="/opt/oci-hpc/cuda-samples/bin/x86_64/linux/release/bandwidthTest"):
+    def __init__(self, iteration=1, size=32000000, bw_test_exe="/opt/oci-hpc/cuda-samples/bin/x86_64/linux/release/bandwidthTest", mode="numa", sweep=None, history_file=None, stream=False):
         self.iteration = iteration
         self.size = size
         self.bw_test_exe = bw_test_exe
+        self.mode = mode
+        # (start, end, increment) in bytes for a bandwidthTest --mode=range sweep
+        self.sweep = sweep
+        # JSON lines file with per-GPU medians from other hosts (fleet history)
+        self.history_file = history_file
+        # Print every measurement to stdout as soon as it completes
+        self.stream = stream
+        # A GPU is an outlier when it is more than mad_threshold scaled MADs and
+        # min_drop (fraction) below the median of its peers
+        self.mad_threshold = 3.5
+        self.min_drop = 0.10
+        self.min_fleet_samples = 16
         self.results = None
         self.dtoh_threshold = 52.0
         self.htod_threshold = 52.0
@@ -26,16 +66,83 @@ class BandwidthTest:
         return int(filtered_output[0].split()[1].strip())
 
     def get_gpus(self):
-        result = subprocess.run(['nvidia-smi', '-L'], stdout=subprocess.PIPE)
-        output = result.stdout.decode('utf-8')
-        filtered_output = [line for line in output.split('\n') if line.startswith('GPU')]
-        return len(filtered_output)
+        return get_gpu_count()
+
+    def get_gpu_numa_map(self, gpus, gpus_per_numa):
+        """{device: numa_node}, from sysfs when available, else the old device // gpus_per_numa layout."""
+        try:
+            numa_map = get_gpu_numa_nodes()
+        except (OSError, subprocess.CalledProcessError):
+            numa_map = {}
+        if len(numa_map) != gpus or any(numa < 0 for numa in numa_map.values()):
+            numa_map = {device: device // gpus_per_numa for device in range(gpus)}
+        return numa_map
+
+    def get_schedule(self, numa_map):
+        """
+        Rounds of devices to test concurrently. "numa" runs one GPU per NUMA node
+        at a time so transfers never share a root complex, "all" runs every GPU
+        at once to expose shared PCIe switch saturation, "serial" one at a time.
+        """
+        devices = sorted(numa_map)
+        if self.mode == "all":
+            return [devices]
+        if self.mode == "serial":
+            return [[device] for device in devices]
+        by_numa = {}
+        for device in devices:
+            by_numa.setdefault(numa_map[device], []).append(device)
+        rounds = []
+        for r in range(max((len(v) for v in by_numa.values()), default=0)):
+            rounds.append([numa_devices[r] for numa_devices in by_numa.values() if r < len(numa_devices)])
+        return rounds
+
+    def get_bw_test_args(self, size):
+        if self.sweep:
+            start, end, increment = self.sweep
+        else:
+            start, end, increment = size, size, size
+        return ["--mode=range", "--start=" + str(start), "--end=" + str(end), "--increment=" + str(increment)]
+
+    def run_bw_test(self, device, numa, direction, size):
+        cmd = ["numactl", "-N" + str(numa), "-m" + str(numa), self.bw_test_exe, direction] + self.get_bw_test_args(size)
+        # nvidia-smi and sysfs number the GPUs in PCI bus order, make CUDA use the
+        # same order so the device matches the NUMA node it is bound to
+        env = dict(os.environ, CUDA_DEVICE_ORDER="PCI_BUS_ID", CUDA_VISIBLE_DEVICES=str(device))
+        logger.debug("CUDA_DEVICE_ORDER=PCI_BUS_ID CUDA_VISIBLE_DEVICES={} CMD: {}".format(device, cmd))
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, env=env)
+        logger.debug("Output: {}".format(result.stdout))
+        logger.debug("Error: {}".format(result.stderr))
+        return result.stdout
+
+    def measure_device(self, device, numa, size):
+        dtoh_curve = parse_bw_output(self.run_bw_test(device, numa, "-dtoh", size))
+        if dtoh_curve:
+            htod_curve = parse_bw_output(self.run_bw_test(device, numa, "-htod", size))
+        else:
+            htod_curve = {}
+        return dtoh_curve, htod_curve
+
+    @staticmethod
+    def curve_value(curve, size):
+        """Bandwidth at the requested size, or at the largest swept size if it was not part of the sweep."""
+        if not curve:
+            return -1.0
+        return curve.get(int(size), curve[max(curve)])
+
+    def stream_result(self, hostname, iteration, device, dtoh_curve, htod_curve):
+        # A failed run still produces a row so the collector knows the GPU was tested
+        for direction, curve in (("dtoh", dtoh_curve), ("htod", htod_curve)):
+            for transfer_size, value in (curve or {int(self.size): -1.0}).items():
+                record = {"host": hostname, "device": device, "iteration": iteration, "mode": self.mode,
+                          "direction": direction, "size": transfer_size, "bandwidth": value}
+                print(STREAM_PREFIX + json.dumps(record), flush=True)
 
     def measure_gpu_bw(self):
         numas = 2
         gpus = 8
-        iterations = 1
-        size = "32000000"
+        iterations = int(self.iteration)
+        size = str(self.size)
 
         gpus = self.get_gpus()
         numas = self.get_numa_nodes()
@@ -50,61 +157,45 @@ class BandwidthTest:
         results = {"gpus": {}, "host": hostname}
 
         # Check if any processes are running on the GPUs before running the test
-        result = subprocess.run(["nvidia-smi", "-q", "-d", "PIDS"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        # Define the regular expression pattern for the GPU ID and the Processes
-        pattern = r'\nGPU\s(.*)\s+Processes\s+:\s+(.*)'
-
-        # Find all matches in the output
-        matches = re.findall(pattern, result.stdout)
-
-        # For each match, extract the GPU ID and the number of processes
         gpu_idle_count = 0
-        for match in matches:
-            gpu_id, processes = match
-            # If processes is 'None', set it to 0
-            if processes == 'None':
+        for gpu_id, pids in get_gpu_processes().items():
+            if not pids:
                 gpu_idle_count += 1
             else:
                 logger.debug("GPU {} has processes running on it".format(gpu_id))
-            
 
         logger.debug("GPU Idle Count: {}".format(gpu_idle_count))
-        if gpu_idle_count != 8:
+        if gpu_idle_count != gpus:
             logger.error("GPU processes are running on the host. Please make sure no processes are running on the GPU before you re-test")
             self.results = None
             return self.results
 
+        numa_map = self.get_gpu_numa_map(gpus, gpus_per_numa)
+        schedule = self.get_schedule(numa_map)
+        logger.debug("Mode: {} Schedule: {}".format(self.mode, schedule))
+        results["mode"] = self.mode
+        results["sweep"] = self.sweep
+
         for i in range(iterations):
-            for device in range(gpus):
-                os.environ["CUDA_VISIBLE_DEVICES"] = str(device)
-                logger.debug("ENV: {}".format(os.environ["CUDA_VISIBLE_DEVICES"]))
-                logger.debug("Iteration: {} Device: {} gpus_per_numa: {}".format(i, device, gpus_per_numa))
-                logger.debug("CMD: {}".format(["numactl", "-N" + str(device // gpus_per_numa), "-m" + str(device // gpus_per_numa), self.bw_test_exe, "-dtoh"]))
-                result = subprocess.run(["numactl", "-N" + str(device // gpus_per_numa), "-m" + str(device // gpus_per_numa), self.bw_test_exe, "-dtoh"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-                logger.debug("Output: {}".format(result.stdout))
-                logger.debug("Error: {}".format(result.stderr))
-                if result.stdout.find(size) != -1:
-                    result = result.stdout.split("\n")
-                    tmp = [x for x in result if size in x]
-                    tmp = tmp[0].split()
-                    dtoh = float(tmp[1])
-
-                    result = subprocess.run(["numactl", "-N" + str(device // gpus_per_numa), "-m" + str(device // gpus_per_numa), self.bw_test_exe, "-htod"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-                    result = result.stdout.split("\n")
-                    tmp = [x for x in result if size in x]
-                    tmp = tmp[0].split()
-                    htod = float(tmp[1])
-                else:
-                    dtoh = -1.0
-                    htod = -1.0
-
-                if device not in results["gpus"]:
-                    results["gpus"][device] = {"dtoh": [dtoh], "htod": [htod]}
-                else:
-                    results["gpus"][device]["dtoh"].append(dtoh)
-                    results["gpus"][device]["htod"].append(htod)
-
-            logger.debug(str(i) + " : " +str(device) + " : " + str(dtoh) + " : " + str(htod))
+            for devices in schedule:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=len(devices)) as executor:
+                    futures = {device: executor.submit(self.measure_device, device, numa_map[device], size) for device in devices}
+                for device in devices:
+                    dtoh_curve, htod_curve = futures[device].result()
+                    dtoh = self.curve_value(dtoh_curve, size)
+                    htod = self.curve_value(htod_curve, size)
+                    logger.debug(str(i) + " : " + str(device) + " : " + str(dtoh) + " : " + str(htod))
+
+                    if device not in results["gpus"]:
+                        results["gpus"][device] = {"dtoh": [dtoh], "htod": [htod], "dtoh_curve": {}, "htod_curve": {}}
+                    else:
+                        results["gpus"][device]["dtoh"].append(dtoh)
+                        results["gpus"][device]["htod"].append(htod)
+                    for direction, curve in (("dtoh", dtoh_curve), ("htod", htod_curve)):
+                        for transfer_size, value in curve.items():
+                            results["gpus"][device][direction + "_curve"].setdefault(transfer_size, []).append(value)
+                    if self.stream:
+                        self.stream_result(hostname, i, device, dtoh_curve, htod_curve)
         
             if i > 1 and i != iterations - 1:
                  # Sleep for 5 seconds and rerun
@@ -113,6 +204,86 @@ class BandwidthTest:
         logger.debug(json.dumps(results))
         self.results = results
 
+    def get_curve_medians(self):
+        """{(direction, size): {device: median GB/s}} over all iterations."""
+        medians = {}
+        for device, data in self.results["gpus"].items():
+            for direction in ("dtoh", "htod"):
+                for transfer_size, values in data.get(direction + "_curve", {}).items():
+                    med, _ = robust_stats(values)
+                    if med is not None:
+                        medians.setdefault((direction, int(transfer_size)), {})[device] = med
+        return medians
+
+    def is_outlier(self, value, reference):
+        med, mad = robust_stats(reference)
+        if med is None:
+            return False, med
+        floor = max(self.mad_threshold * 1.4826 * mad, self.min_drop * med)
+        return med - value > floor, med
+
+    def find_outliers(self):
+        """
+        Compare every GPU's median curve against its peers on this host and, if
+        a history file is set, against the fleet. Returns one issue per GPU and
+        direction at the size with the largest deficit.
+        """
+        medians = self.get_curve_medians()
+        fleet = self.load_fleet_history()
+        worst = {}
+        for (direction, transfer_size), device_medians in sorted(medians.items()):
+            peers = list(device_medians.values())
+            fleet_values = fleet.get((direction, transfer_size), [])
+            for device, value in device_medians.items():
+                checks = [("peer", peers)]
+                if len(fleet_values) >= self.min_fleet_samples:
+                    checks.append(("fleet", fleet_values))
+                for name, reference in checks:
+                    outlier, med = self.is_outlier(value, reference)
+                    if not outlier:
+                        continue
+                    deficit = (med - value) / med
+                    key = (device, direction, name)
+                    if key not in worst or deficit > worst[key][0]:
+                        worst[key] = (deficit, transfer_size, value, med)
+        issues = []
+        for (device, direction, name), (deficit, transfer_size, value, med) in sorted(worst.items()):
+            issues.append("Device: {} {}: {:.2f} GB/s at {} bytes is {:.0f}% below {} median {:.2f}".format(
+                device, "DtoH" if direction == "dtoh" else "HtoD", value, transfer_size, deficit * 100, name, med))
+        return issues
+
+    def load_fleet_history(self):
+        """{(direction, size): [median, ...]} recorded by other hosts."""
+        fleet = {}
+        if not self.history_file or not os.path.exists(self.history_file):
+            return fleet
+        hostname = self.results["host"]
+        with open(self.history_file, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("host") == hostname:
+                    continue
+                fleet.setdefault((entry["direction"], int(entry["size"])), []).append(entry["value"])
+        return fleet
+
+    def save_fleet_history(self):
+        """Append this host's median curves to the history file. Only called for passing runs, so a bad GPU never becomes part of the fleet reference."""
+        if not self.history_file:
+            return
+        medians = self.get_curve_medians()
+        timestamp = time.time()
+        lines = []
+        for (direction, transfer_size), device_medians in medians.items():
+            for device, value in device_medians.items():
+                lines.append(json.dumps({"host": self.results["host"], "device": device, "direction": direction,
+                                         "size": transfer_size, "value": value, "timestamp": timestamp}))
+        with open(self.history_file, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write("\n".join(lines) + "\n")
+
     def validate_results(self):
         gpu_issues = {"status": "Passed", "issues": []}
         if self.results == None:
@@ -123,8 +294,10 @@ class BandwidthTest:
         for device in self.results["gpus"]:
             dtoh = self.results["gpus"][device]["dtoh"]
             htod = self.results["gpus"][device]["htod"]
-            dtoh_avg = sum(dtoh) / len(dtoh)
-            htod_avg = sum(htod) / len(htod)
+            dtoh_avg, _ = robust_stats(dtoh)
+            htod_avg, _ = robust_stats(htod)
+            dtoh_avg = -1.0 if dtoh_avg is None else dtoh_avg
+            htod_avg = -1.0 if htod_avg is None else htod_avg
             logger.debug("Device: {} DtoH: {} HtoD: {}".format(device, dtoh_avg, htod_avg))
             if dtoh_avg < self.dtoh_threshold:
                 logger.debug("Device: {} DtoH: {} is below threshold: {}".format(device, dtoh_avg, self.dtoh_threshold))
@@ -134,6 +307,11 @@ class BandwidthTest:
                 logger.debug("Device: {} HtoD: {} is below threshold: {}".format(device, htod_avg, self.htod_threshold))
                 gpu_issues["issues"].append("Device: {} HtoD: {} is below threshold: {}".format(device, htod_avg, self.htod_threshold))
                 gpu_issues["status"] = "Failed"
+        outliers = self.find_outliers()
+        for issue in outliers:
+            logger.debug(issue)
+            gpu_issues["issues"].append(issue)
+            gpu_issues["status"] = "Failed"
         if gpu_issues["status"] == "Passed":
             logger.info("GPU bandwidth test passed")
         return gpu_issues
@@ -144,6 +322,10 @@ if __name__ == '__main__':
     parser.add_argument("-l", "--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], default="INFO", help="Set the logging level default: INFO")
     parser.add_argument('-i', dest='iterations', default='1', help='Number of iterations to run Ex. -i 3')
     parser.add_argument('-s', dest='size', default='32000000', help='Message size to run Ex. -s 32000000')
+    parser.add_argument('--mode', dest='mode', choices=['numa', 'all', 'serial'], default='numa', help='numa: one GPU per NUMA node at a time, all: every GPU at once, serial: one GPU at a time (default: numa)')
+    parser.add_argument('--sweep', dest='sweep', nargs=3, type=int, metavar=('START', 'END', 'INCREMENT'), help='Sweep transfer sizes in bytes with bandwidthTest range mode Ex. --sweep 1000000 64000000 1000000')
+    parser.add_argument('--history', dest='history_file', help='JSON lines file with fleet results to compare against (passing runs are appended)')
+    parser.add_argument('--stream', dest='stream', action='store_true', default=False, help='Print each measurement as a JSON line on stdout as soon as it completes')
     parser.add_argument('--bw-test-exe', dest='bw_test_exe', default='/opt/oci-hpc/cuda-samples/bin/x86_64/linux/release/bandwidthTest', help='Path to the bw_test executable')
     args = parser.parse_args()
 
@@ -155,11 +337,12 @@ if __name__ == '__main__':
     if args.bw_test_exe != 'NONE':
         bw_test_exe = args.bw_test_exe
 
-    bwt = BandwidthTest(iteration=iterations, size=size, bw_test_exe=bw_test_exe)
+    bwt = BandwidthTest(iteration=iterations, size=size, bw_test_exe=bw_test_exe, mode=args.mode, sweep=args.sweep, history_file=args.history_file, stream=args.stream)
     bwt.measure_gpu_bw()
     bwt_results = bwt.validate_results()
     if bwt_results["status"] == "Passed":
         logger.info("GPU bandwidth test passed")
+        bwt.save_fleet_history()
     else:
         logger.error("GPU bandwidth test failed")
         for issue in bwt_results["issues"]:
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# Background GPU telemetry sampler.
+#
+# A daemon thread polls every GPU at a fixed interval (NVML when available,
+# otherwise one nvidia-smi --query-gpu call per sample) while a load such as
+# gpu_burn or an NCCL test runs. Samples are kept column-wise, one list per
+# metric, and written as Parquet (or CSV without pyarrow) so a long soak does
+# not produce a pile of per-sample JSON. summary() reduces the series to one
+# row per GPU: how often each clock event (throttle) reason was active, the
+# SM clock and power it actually ran at, and how much the ECC and PCIe replay
+# counters moved during the run.
+#
+# Run standalone on each node next to a multi-node job, e.g.
+#   python3 gpu_sampler.py --interval 1 --output nccl_telemetry.parquet
+# and stop it with Ctrl-C / SIGTERM when the job finishes.
+
+import argparse
+import csv
+import json
+import signal
+import statistics
+import subprocess
+import threading
+import time
+
+from gpu_telemetry import sample_gpu_records
+from check_gpu_throttle import GPU_CLOCKS_THROTTLE_REASON_BITS, GPU_THROTTLE_FAIL_REASONS, GPU_THROTTLE_WARN_REASONS
+
+SAMPLE_COLUMNS = [
+    "time",
+    "gpu",
+    "power_draw",
+    "temperature",
+    "clocks_sm",
+    "clocks_mem",
+    "clocks_event_reasons",
+    "ecc_volatile_sram_uncorrectable",
+    "ecc_volatile_dram_uncorrectable",
+    "pcie_replay_counter",
+]
+
+
+def _delta(values):
+    values = [v for v in values if v is not None]
+    if len(values) < 2:
+        return None
+    return values[-1] - values[0]
+
+
+class TelemetrySampler:
+    def __init__(self, interval=1.0, use_nvml=True):
+        self.interval = interval
+        self.use_nvml = use_nvml
+        self.columns = {name: [] for name in SAMPLE_COLUMNS}
+        self.errors = 0
+        self.start_time = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.start_time = time.time()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="gpu-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        # Fixed rate: the next sample is due interval seconds after the previous
+        # one was due, not after the (variable length) query returned
+        next_sample = time.time()
+        while not self._stop_event.is_set():
+            self.sample()
+            next_sample += self.interval
+            self._stop_event.wait(max(0.0, next_sample - time.time()))
+
+    def sample(self):
+        try:
+            records = sample_gpu_records(self.use_nvml)
+        except (OSError, subprocess.CalledProcessError):
+            self.errors += 1
+            return
+        now = round(time.time() - self.start_time, 3)
+        for record in records:
+            self.columns["time"].append(now)
+            self.columns["gpu"].append(record.index)
+            for name in SAMPLE_COLUMNS[2:]:
+                self.columns[name].append(getattr(record, name))
+
+    def __len__(self):
+        return len(self.columns["time"])
+
+    def gpu_series(self):
+        """{gpu: {column: [values]}}"""
+        series = {}
+        for i, gpu in enumerate(self.columns["gpu"]):
+            gpu_columns = series.setdefault(gpu, {name: [] for name in SAMPLE_COLUMNS if name != "gpu"})
+            for name, values in gpu_columns.items():
+                values.append(self.columns[name][i])
+        return series
+
+    def summary(self):
+        """
+        One dict per GPU: samples, throttle ({reason: fraction of samples}),
+        throttled (the power, thermal and hardware reasons as a "REASON 97%"
+        string), SM clock median/min, mean/max power, max temperature and the
+        ECC and PCIe replay counter deltas over the sampled window.
+        """
+        summary = {}
+        for gpu, series in sorted(self.gpu_series().items()):
+            masks = [m for m in series["clocks_event_reasons"] if m is not None]
+            throttle = {}
+            for bit, name in sorted(GPU_CLOCKS_THROTTLE_REASON_BITS.items()):
+                active = sum(1 for m in masks if m & bit)
+                if active:
+                    throttle[name] = round(active / len(masks), 3)
+            clocks = [c for c in series["clocks_sm"] if c is not None]
+            power = [p for p in series["power_draw"] if p is not None]
+            temps = [t for t in series["temperature"] if t is not None]
+            ecc = [_delta(series["ecc_volatile_sram_uncorrectable"]), _delta(series["ecc_volatile_dram_uncorrectable"])]
+            ecc = [d for d in ecc if d is not None]
+            summary[gpu] = {
+                "samples": len(series["time"]),
+                "throttle": throttle,
+                "throttled": ", ".join(f"{name} {fraction:.0%}" for name, fraction in throttle.items()
+                                       if name in GPU_THROTTLE_FAIL_REASONS | GPU_THROTTLE_WARN_REASONS),
+                "sm_clock_median": statistics.median(clocks) if clocks else None,
+                "sm_clock_min": min(clocks) if clocks else None,
+                "power_mean": round(statistics.mean(power), 1) if power else None,
+                "power_max": max(power) if power else None,
+                "temp_max": max(temps) if temps else None,
+                "ecc_delta": sum(ecc) if ecc else None,
+                "pcie_replays": _delta(series["pcie_replay_counter"]),
+            }
+        return summary
+
+    def write(self, path):
+        """Write the time series to path, Parquet for *.parquet, otherwise CSV."""
+        if path.endswith(".parquet"):
+            import pandas as pd
+            pd.DataFrame(self.columns).to_parquet(path, index=False)
+            return path
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(SAMPLE_COLUMNS)
+            writer.writerows(zip(*(self.columns[name] for name in SAMPLE_COLUMNS)))
+        return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sample GPU telemetry until the duration expires or the process is stopped")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between samples (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds (default: run until SIGINT/SIGTERM)")
+    parser.add_argument("-o", "--output", default="gpu_telemetry.csv", help="Time series output, .parquet or .csv (default: %(default)s)")
+    parser.add_argument("--no-nvml", action="store_true", help="Sample with nvidia-smi even if pynvml is installed")
+    args = parser.parse_args()
+
+    done = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: done.set())
+
+    sampler = TelemetrySampler(args.interval, use_nvml=not args.no_nvml)
+    sampler.start()
+    try:
+        done.wait(args.duration)
+    except KeyboardInterrupt:
+        pass
+    sampler.stop()
+
+    sampler.write(args.output)
+    print(json.dumps(sampler.summary(), indent=4))
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+# Structured GPU telemetry shared by the health checks.
+#
+# Instead of every check starting its own nvidia-smi (and `nvidia-smi -q`
+# dumping every section just to scrape a few ECC lines), all GPU state is
+# collected once into a list of GpuRecord objects. NVML (the nvidia-ml-py
+# `pynvml` module) is used when it is installed, otherwise a single
+# `nvidia-smi --query-gpu=... --format=csv` call plus one
+# `--query-remapped-rows` call. Records are cached for the life of the
+# process, so one health-check run queries the GPUs once; pass refresh=True
+# for live values (e.g. while sampling under load).
+
+import os
+import re
+import subprocess
+import threading
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional
+
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+
+@dataclass
+class GpuRecord:
+    index: int
+    name: Optional[str] = None
+    serial: Optional[str] = None
+    uuid: Optional[str] = None
+    pci_bus_id: Optional[str] = None
+    temperature: Optional[int] = None
+    power_draw: Optional[float] = None
+    power_limit: Optional[float] = None
+    clocks_sm: Optional[int] = None
+    clocks_mem: Optional[int] = None
+    clocks_max_sm: Optional[int] = None
+    clocks_event_reasons: Optional[int] = None
+    pcie_link_gen: Optional[int] = None
+    pcie_link_width: Optional[int] = None
+    # NVML only, nvidia-smi --query-gpu has no replay counter field
+    pcie_replay_counter: Optional[int] = None
+    ecc_volatile_sram_uncorrectable: Optional[int] = None
+    ecc_volatile_dram_uncorrectable: Optional[int] = None
+    ecc_aggregate_sram_uncorrectable: Optional[int] = None
+    ecc_aggregate_dram_uncorrectable: Optional[int] = None
+    remapped_rows_correctable: Optional[int] = None
+    remapped_rows_uncorrectable: Optional[int] = None
+    remapped_rows_pending: Optional[bool] = None
+    remapped_rows_failure: Optional[bool] = None
+    source: str = "nvidia-smi"
+
+    def to_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+# --query-gpu field -> GpuRecord attribute. Fields an older driver does not
+# know are dropped and the query retried, so the attribute is left as None.
+QUERY_GPU_FIELDS = {
+    "index": "index",
+    "name": "name",
+    "serial": "serial",
+    "uuid": "uuid",
+    "pci.bus_id": "pci_bus_id",
+    "temperature.gpu": "temperature",
+    "power.draw": "power_draw",
+    "power.limit": "power_limit",
+    "clocks.sm": "clocks_sm",
+    "clocks.mem": "clocks_mem",
+    "clocks.max.sm": "clocks_max_sm",
+    "clocks_event_reasons.active": "clocks_event_reasons",
+    "clocks_throttle_reasons.active": "clocks_event_reasons",
+    "pcie.link.gen.current": "pcie_link_gen",
+    "pcie.link.width.current": "pcie_link_width",
+    "ecc.errors.uncorrected.volatile.sram": "ecc_volatile_sram_uncorrectable",
+    "ecc.errors.uncorrected.volatile.dram": "ecc_volatile_dram_uncorrectable",
+    "ecc.errors.uncorrected.aggregate.sram": "ecc_aggregate_sram_uncorrectable",
+    "ecc.errors.uncorrected.aggregate.dram": "ecc_aggregate_dram_uncorrectable",
+}
+
+QUERY_REMAPPED_ROWS_FIELDS = {
+    "gpu_bus_id": "pci_bus_id",
+    "remapped_rows.correctable": "remapped_rows_correctable",
+    "remapped_rows.uncorrectable": "remapped_rows_uncorrectable",
+    "remapped_rows.pending": "remapped_rows_pending",
+    "remapped_rows.failure": "remapped_rows_failure",
+}
+
+INVALID_FIELD_PATTERN = re.compile(r'Field "([^"]+)" is not a valid field to query')
+
+_records_cache = {}
+_records_lock = threading.Lock()
+_valid_fields = {}
+
+
+def _parse_value(attr, value):
+    value = value.strip()
+    if value == "" or value.startswith("[") or value in ("N/A", "Not Supported"):
+        return None
+    hint = GpuRecord.__dataclass_fields__[attr].type
+    try:
+        if hint == Optional[bool]:
+            return value.lower() in ("1", "yes", "true")
+        if hint == Optional[int] or hint == int:
+            return int(value, 16) if value.startswith("0x") else int(float(value))
+        if hint == Optional[float]:
+            return float(value)
+    except ValueError:
+        return None
+    return value
+
+
+def _query_csv(option, field_map):
+    """
+    Run `nvidia-smi --<option>=<fields> --format=csv,noheader,nounits` and
+    return one {attr: value} dict per line.
+    """
+    query_fields = _valid_fields.get(option, list(field_map))
+    while True:
+        command = ["nvidia-smi", f"--{option}=" + ",".join(query_fields), "--format=csv,noheader,nounits"]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        invalid = INVALID_FIELD_PATTERN.search(result.stdout)
+        if result.returncode == 0 or not invalid or invalid.group(1) not in query_fields:
+            break
+        query_fields = [f for f in query_fields if f != invalid.group(1)]
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, command, result.stdout)
+    _valid_fields[option] = query_fields
+
+    rows = []
+    for line in result.stdout.splitlines():
+        if not line.strip():
+            continue
+        row = {}
+        for query_field, value in zip(query_fields, line.split(",")):
+            attr = field_map[query_field]
+            parsed = _parse_value(attr, value)
+            if row.get(attr) is None:
+                row[attr] = parsed
+        rows.append(row)
+    return rows
+
+
+def _records_from_nvidia_smi(remapped_rows=True):
+    records = [GpuRecord(**row) for row in _query_csv("query-gpu", QUERY_GPU_FIELDS)]
+    if not remapped_rows:
+        return records
+    by_bus_id = {r.pci_bus_id: r for r in records}
+    try:
+        remapped = _query_csv("query-remapped-rows", QUERY_REMAPPED_ROWS_FIELDS)
+    except subprocess.CalledProcessError:
+        # Pre-Ampere GPUs have no row remapper
+        remapped = []
+    for row in remapped:
+        record = by_bus_id.get(row.pop("pci_bus_id"))
+        if record:
+            for attr, value in row.items():
+                setattr(record, attr, value)
+    return records
+
+
+def _nvml(func, *args):
+    try:
+        value = func(*args)
+    except (pynvml.NVMLError, AttributeError):
+        return None
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _records_from_nvml():
+    pynvml.nvmlInit()
+    try:
+        records = []
+        sram = getattr(pynvml, "NVML_MEMORY_LOCATION_SRAM", 7)
+        dram = getattr(pynvml, "NVML_MEMORY_LOCATION_DRAM", 2)
+        uncorrected = pynvml.NVML_MEMORY_ERROR_TYPE_UNCORRECTED
+        event_reasons = getattr(pynvml, "nvmlDeviceGetCurrentClocksEventReasons", None) or \
+            pynvml.nvmlDeviceGetCurrentClocksThrottleReasons
+        for i in range(pynvml.nvmlDeviceGetCount()):
+            h = pynvml.nvmlDeviceGetHandleByIndex(i)
+            pci = _nvml(pynvml.nvmlDeviceGetPciInfo, h)
+            power = _nvml(pynvml.nvmlDeviceGetPowerUsage, h)
+            power_limit = _nvml(pynvml.nvmlDeviceGetEnforcedPowerLimit, h)
+            remapped = _nvml(pynvml.nvmlDeviceGetRemappedRows, h) or (None, None, None, None)
+            bus_id = pci.busId if pci else None
+            records.append(GpuRecord(
+                index=i,
+                name=_nvml(pynvml.nvmlDeviceGetName, h),
+                serial=_nvml(pynvml.nvmlDeviceGetSerial, h),
+                uuid=_nvml(pynvml.nvmlDeviceGetUUID, h),
+                pci_bus_id=bus_id.decode() if isinstance(bus_id, bytes) else bus_id,
+                temperature=_nvml(pynvml.nvmlDeviceGetTemperature, h, pynvml.NVML_TEMPERATURE_GPU),
+                power_draw=power / 1000.0 if power is not None else None,
+                power_limit=power_limit / 1000.0 if power_limit is not None else None,
+                clocks_sm=_nvml(pynvml.nvmlDeviceGetClockInfo, h, pynvml.NVML_CLOCK_SM),
+                clocks_mem=_nvml(pynvml.nvmlDeviceGetClockInfo, h, pynvml.NVML_CLOCK_MEM),
+                clocks_max_sm=_nvml(pynvml.nvmlDeviceGetMaxClockInfo, h, pynvml.NVML_CLOCK_SM),
+                clocks_event_reasons=_nvml(event_reasons, h),
+                pcie_link_gen=_nvml(pynvml.nvmlDeviceGetCurrPcieLinkGeneration, h),
+                pcie_link_width=_nvml(pynvml.nvmlDeviceGetCurrPcieLinkWidth, h),
+                pcie_replay_counter=_nvml(pynvml.nvmlDeviceGetPcieReplayCounter, h),
+                ecc_volatile_sram_uncorrectable=_nvml(pynvml.nvmlDeviceGetMemoryErrorCounter, h, uncorrected, pynvml.NVML_VOLATILE_ECC, sram),
+                ecc_volatile_dram_uncorrectable=_nvml(pynvml.nvmlDeviceGetMemoryErrorCounter, h, uncorrected, pynvml.NVML_VOLATILE_ECC, dram),
+                ecc_aggregate_sram_uncorrectable=_nvml(pynvml.nvmlDeviceGetMemoryErrorCounter, h, uncorrected, pynvml.NVML_AGGREGATE_ECC, sram),
+                ecc_aggregate_dram_uncorrectable=_nvml(pynvml.nvmlDeviceGetMemoryErrorCounter, h, uncorrected, pynvml.NVML_AGGREGATE_ECC, dram),
+                remapped_rows_correctable=remapped[0],
+                remapped_rows_uncorrectable=remapped[1],
+                remapped_rows_pending=bool(remapped[2]) if remapped[2] is not None else None,
+                remapped_rows_failure=bool(remapped[3]) if remapped[3] is not None else None,
+                source="nvml",
+            ))
+        return records
+    finally:
+        pynvml.nvmlShutdown()
+
+
+def get_gpu_records(refresh=False, use_nvml=True) -> List[GpuRecord]:
+    """
+    Cached per-GPU records, ordered by GPU index. Raises FileNotFoundError
+    when neither NVML nor nvidia-smi is available.
+    """
+    # Checks running concurrently share one query instead of racing to fill the cache
+    with _records_lock:
+        if refresh or "records" not in _records_cache:
+            records = None
+            if use_nvml and pynvml is not None:
+                try:
+                    records = _records_from_nvml()
+                except pynvml.NVMLError:
+                    records = None
+            if records is None:
+                records = _records_from_nvidia_smi()
+            _records_cache["records"] = sorted(records, key=lambda r: r.index)
+        return _records_cache["records"]
+
+
+def sample_gpu_records(use_nvml=True) -> List[GpuRecord]:
+    """
+    Fresh records for periodic sampling. Bypasses the cache and, on the
+    nvidia-smi path, skips the remapped rows query.
+    """
+    if use_nvml and pynvml is not None:
+        try:
+            return _records_from_nvml()
+        except pynvml.NVMLError:
+            pass
+    return _records_from_nvidia_smi(remapped_rows=False)
+
+
+def get_gpu_count(refresh=False):
+    return len(get_gpu_records(refresh=refresh))
+
+
+def get_gpu_numa_nodes(sysfs_pci="/sys/bus/pci/devices") -> Dict[int, int]:
+    """{gpu_index: numa_node} from sysfs; -1 when the platform reports none."""
+    numa_nodes = {}
+    for r in get_gpu_records():
+        numa_nodes[r.index] = -1
+        if not r.pci_bus_id:
+            continue
+        # nvidia-smi uses an 8 digit PCI domain, sysfs uses 4
+        domain, rest = r.pci_bus_id.lower().split(":", 1)
+        try:
+            with open(os.path.join(sysfs_pci, f"{domain[-4:]}:{rest}", "numa_node")) as f:
+                numa_nodes[r.index] = int(f.read().strip())
+        except (OSError, ValueError):
+            pass
+    return numa_nodes
+
+
+def get_gpu_processes() -> Dict[str, List[int]]:
+    """{pci_bus_id: [pid, ...]} of compute processes; never cached."""
+    processes = {r.pci_bus_id: [] for r in get_gpu_records()}
+    result = subprocess.run(
+        ["nvidia-smi", "--query-compute-apps=gpu_bus_id,pid", "--format=csv,noheader"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True,
+    )
+    for line in result.stdout.splitlines():
+        parts = [p.strip() for p in line.split(",")]
+        if len(parts) == 2 and parts[1].isdigit():
+            processes.setdefault(parts[0], []).append(int(parts[1]))
+    return processes
+
+
+def get_nvlink_status() -> Dict[int, Dict[int, str]]:
+    """
+    {gpu_index: {link: "<speed>" or "inactive"}} from one `nvidia-smi nvlink -s`
+    call for all GPUs. GPUs without NVLink have an empty dict.
+    """
+    output = subprocess.check_output(["nvidia-smi", "nvlink", "-s"], universal_newlines=True)
+    status = {}
+    gpu = None
+    for line in output.splitlines():
+        m = re.match(r"GPU (\d+):", line)
+        if m:
+            gpu = int(m.group(1))
+            status[gpu] = {}
+            continue
+        m = re.match(r"\s+Link (\d+): (.*)", line)
+        if m and gpu is not None:
+            state = m.group(2).strip()
+            status[gpu][int(m.group(1))] = "inactive" if "inactive" in state else state
+    return status
+
+
+if __name__ == "__main__":
+    import json
+
+    print(json.dumps([r.to_dict() for r in get_gpu_records()], indent=4))
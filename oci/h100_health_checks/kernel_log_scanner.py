@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+# Incremental kernel log scanner shared by the link flap and Xid checks.
+#
+# Each source is scanned once from where the previous run stopped:
+#   - the kernel ring buffer through /dev/kmsg, resumed by record sequence number
+#     (falls back to `dmesg -r` and a timestamp cursor when /dev/kmsg is not readable)
+#   - /var/log/messages or /var/log/syslog, resumed by inode + byte offset
+# New text goes through one combined compiled pattern and the matching link
+# down, EAP failure and Xid events are appended to a small on-disk index, so a
+# repeated health check only costs the lines written since the last one.
+
+import argparse
+import fcntl
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime
+from glob import glob
+
+SYSLOG_FILES = ["/var/log/messages", "/var/log/syslog"]
+KMSG_DEVICE = "/dev/kmsg"
+BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"
+READ_CHUNK = 16 * 1024 * 1024
+
+EVENT_PATTERN = re.compile(
+    r"mlx5_core (?P<pci>\S+) (?P<netdev>[^\s:]+): Link down"
+    r"|NVRM: Xid \(PCI:(?P<xid_pci>[^)]*)\): (?P<xid>\d+),\s*(?P<xid_msg>.*)"
+    r"|wpa_supplicant(?:\[\d+\])?: (?P<eap_netdev>[^\s:]+): CTRL-EVENT-EAP-FAILURE"
+)
+
+SYSLOG_TIME_PATTERN = re.compile(
+    r"^(?:(?P<iso>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:[+-]\d{2}:?\d{2}|Z)?)"
+    r"|(?P<bsd>\w{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}))"
+)
+DMESG_RAW_PATTERN = re.compile(r"^<(\d+)>\[\s*(\d+)\.(\d+)\]\s?(.*)$")
+
+
+def default_state_dir():
+    if os.geteuid() == 0:
+        return "/var/tmp/oci_hpc_log_scanner"
+    return os.path.join(os.path.expanduser("~"), ".cache", "oci_hpc_log_scanner")
+
+
+def get_boot_id():
+    try:
+        with open(BOOT_ID_FILE, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def get_boot_time():
+    with open("/proc/uptime", "r") as f:
+        uptime = float(f.read().split()[0])
+    return time.time() - uptime
+
+
+def parse_kmsg_record(record):
+    """Split a /dev/kmsg record into (seq, usec, first message line)."""
+    header, _, body = record.decode("utf-8", errors="replace").partition(";")
+    fields = header.split(",")
+    return int(fields[1]), int(fields[2]), body.split("\n", 1)[0]
+
+
+def match_event(message):
+    """Return an event dict (without time/source) if message is a flap/Xid line."""
+    m = EVENT_PATTERN.search(message)
+    if not m:
+        return None
+    return _event_from_match(m)
+
+
+def _event_from_match(m):
+    if m.group("netdev"):
+        return {"type": "link_down", "device": m.group("netdev"), "pci": m.group("pci")}
+    if m.group("xid"):
+        return {
+            "type": "xid",
+            "device": m.group("xid_pci"),
+            "pci": m.group("xid_pci"),
+            "xid": int(m.group("xid")),
+            "message": m.group("xid_msg").strip(),
+        }
+    return {"type": "eap_failure", "device": m.group("eap_netdev"), "pci": None}
+
+
+def parse_syslog_time(line, now=None):
+    m = SYSLOG_TIME_PATTERN.match(line)
+    if not m:
+        return None
+    if m.group("iso"):
+        try:
+            return datetime.fromisoformat(m.group("iso").replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    now = now or datetime.now()
+    try:
+        ts = datetime.strptime(" ".join(m.group("bsd").split()), "%b %d %H:%M:%S")
+    except ValueError:
+        return None
+    # BSD syslog has no year; a month ahead of now belongs to last year
+    ts = ts.replace(year=now.year - 1 if ts.month > now.month else now.year)
+    return ts.timestamp()
+
+
+class KernelLogScanner:
+    def __init__(self, state_dir=None, syslog_files=None, retention_days=30, use_kmsg=True):
+        self.state_dir = state_dir or default_state_dir()
+        self.index_file = os.path.join(self.state_dir, "events.jsonl")
+        self.state_file = os.path.join(self.state_dir, "state.json")
+        self.lock_file = os.path.join(self.state_dir, ".lock")
+        self.syslog_files = syslog_files if syslog_files is not None else [
+            f for f in SYSLOG_FILES if os.path.exists(f)
+        ][:1]
+        self.retention = retention_days * 86400
+        self.use_kmsg = use_kmsg
+        self.boot_id = get_boot_id()
+        self._events = None
+
+    # ---- persistence ----
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"kmsg": {}, "files": {}}
+
+    def _load_events(self):
+        events = []
+        try:
+            with open(self.index_file, "r") as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return events
+
+    def _save(self, state, events):
+        for path, payload in ((self.state_file, json.dumps(state)),
+                              (self.index_file, "".join(json.dumps(e) + "\n" for e in events))):
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+
+    # ---- sources ----
+
+    def _scan_kmsg(self, cursor):
+        """Yield (seq, usec, message) from /dev/kmsg newer than the cursor."""
+        last_seq = cursor.get("seq", -1) if cursor.get("boot_id") == self.boot_id else -1
+        fd = os.open(KMSG_DEVICE, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            while True:
+                try:
+                    record = os.read(fd, 8192)
+                except BlockingIOError:
+                    break
+                except BrokenPipeError:
+                    # record was overwritten while reading; the next read resumes
+                    continue
+                seq, usec, message = parse_kmsg_record(record)
+                if seq <= last_seq:
+                    continue
+                yield seq, usec, message
+        finally:
+            os.close(fd)
+
+    def _scan_dmesg(self, cursor):
+        """Fallback for hosts where /dev/kmsg is not readable; cursor is the last usec seen."""
+        last_usec = cursor.get("usec", -1) if cursor.get("boot_id") == self.boot_id else -1
+        for cmd in (["dmesg", "-r"], ["chroot", "/host", "dmesg", "-r"]):
+            try:
+                output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            except FileNotFoundError:
+                continue
+            if output.returncode == 0:
+                break
+        else:
+            return
+        for line in output.stdout.splitlines():
+            m = DMESG_RAW_PATTERN.match(line)
+            if not m:
+                continue
+            usec = int(m.group(2)) * 1000000 + int(m.group(3).ljust(6, "0")[:6])
+            if usec <= last_usec:
+                continue
+            yield None, usec, m.group(4)
+
+    def _scan_kernel(self, state, new_events):
+        cursor = state.get("kmsg", {})
+        boot_time = get_boot_time()
+        try:
+            if not self.use_kmsg:
+                raise PermissionError
+            records = list(self._scan_kmsg(cursor))
+        except OSError:
+            records = list(self._scan_dmesg(cursor))
+
+        if cursor.get("boot_id") != self.boot_id:
+            cursor = {"boot_id": self.boot_id}
+        for seq, usec, message in records:
+            if seq is not None:
+                cursor["seq"] = seq
+            cursor["usec"] = usec
+            event = match_event(message)
+            if event:
+                event.update({"source": "kmsg", "time": boot_time + usec / 1e6, "boot_id": self.boot_id, "seq": seq})
+                new_events.append(event)
+        state["kmsg"] = cursor
+
+    def _scan_file_range(self, path, offset, new_events, now):
+        with open(path, "rb") as f:
+            f.seek(offset)
+            pending = b""
+            while True:
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    break
+                block = pending + chunk
+                end = block.rfind(b"\n") + 1
+                pending = block[end:]
+                text = block[:end].decode("utf-8", errors="replace")
+                offset += end
+                for m in EVENT_PATTERN.finditer(text):
+                    start = text.rfind("\n", 0, m.start()) + 1
+                    event = _event_from_match(m)
+                    event.update({"source": "syslog", "time": parse_syslog_time(text[start:], now), "boot_id": None})
+                    new_events.append(event)
+        # an unterminated last line is picked up on the next scan
+        return offset
+
+    def _find_rotated(self, path, inode):
+        for candidate in glob(path + "*"):
+            if candidate == path:
+                continue
+            try:
+                if os.stat(candidate).st_ino == inode:
+                    return candidate
+            except OSError:
+                continue
+        return None
+
+    def _scan_syslog(self, state, new_events):
+        now = datetime.now()
+        files = state.setdefault("files", {})
+        for path in self.syslog_files:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            cursor = files.get(path, {})
+            offset = cursor.get("offset", 0)
+            if cursor and cursor.get("inode") != st.st_ino:
+                # rotated since the last scan: finish the tail of the old file first.
+                # It is found by inode, logrotate names it messages.1 or, with
+                # dateext (OL/RHEL), messages-YYYYMMDD
+                rotated = self._find_rotated(path, cursor.get("inode"))
+                if rotated:
+                    self._scan_file_range(rotated, offset, new_events, now)
+                offset = 0
+            elif offset > st.st_size:
+                offset = 0
+            offset = self._scan_file_range(path, offset, new_events, now)
+            files[path] = {"inode": st.st_ino, "offset": offset}
+
+    # ---- public API ----
+
+    def _merge(self, events, new_events):
+        now = time.time()
+        cutoff = now - self.retention
+        seen = set()
+        merged = []
+        for e in events + new_events:
+            if e.get("time") is None:
+                # syslog line without a parsable timestamp: age it out from when it was scanned
+                e["time"] = now
+            if e["time"] < cutoff:
+                continue
+            if e.get("seq") is not None:
+                # the same kmsg record can be picked up by scan() and follow()
+                key = (e["boot_id"], e["seq"])
+                if key in seen:
+                    continue
+                seen.add(key)
+            merged.append(e)
+        return merged
+
+    def scan(self):
+        """Scan all sources for new lines, update the index and return the new events."""
+        os.makedirs(self.state_dir, exist_ok=True)
+        with open(self.lock_file, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state = self._load_state()
+            events = self._load_events()
+            new_events = []
+            self._scan_kernel(state, new_events)
+            self._scan_syslog(state, new_events)
+            events = self._merge(events, new_events)
+            self._save(state, events)
+            self._events = events
+        return new_events
+
+    def _commit_kmsg(self, new_events, cursor):
+        with open(self.lock_file, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state = self._load_state()
+            current = state.get("kmsg", {})
+            if current.get("boot_id") != cursor["boot_id"] or current.get("seq", -1) < cursor["seq"]:
+                state["kmsg"] = cursor
+            events = self._merge(self._load_events(), new_events)
+            self._save(state, events)
+            self._events = events
+
+    def follow(self, types=None):
+        """
+        Block on /dev/kmsg and yield new events as the kernel logs them.
+
+        Reading resumes from the persisted kmsg cursor, and every matched event
+        is committed to the index together with the cursor, so a restarted
+        monitor neither misses nor repeats events.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        cursor = self._load_state().get("kmsg", {})
+        last_seq = cursor.get("seq", -1) if cursor.get("boot_id") == self.boot_id else -1
+        boot_time = get_boot_time()
+        fd = os.open(KMSG_DEVICE, os.O_RDONLY)
+        try:
+            while True:
+                try:
+                    record = os.read(fd, 8192)
+                except BrokenPipeError:
+                    continue
+                seq, usec, message = parse_kmsg_record(record)
+                if seq <= last_seq:
+                    continue
+                last_seq = seq
+                event = match_event(message)
+                if event is None:
+                    continue
+                event.update({"source": "kmsg", "time": boot_time + usec / 1e6, "boot_id": self.boot_id, "seq": seq})
+                self._commit_kmsg([event], {"boot_id": self.boot_id, "seq": seq, "usec": usec})
+                if not types or event["type"] in types:
+                    yield event
+        finally:
+            os.close(fd)
+
+    def events(self, types=None, source=None, since=None, current_boot=False):
+        """Query the index (scanning first if this instance has not scanned yet)."""
+        if self._events is None:
+            self.scan()
+        results = []
+        for e in self._events:
+            if types and e["type"] not in types:
+                continue
+            if source and e["source"] != source:
+                continue
+            if since is not None and (e.get("time") is None or e["time"] < since):
+                continue
+            if current_boot and e.get("boot_id") != self.boot_id:
+                continue
+            results.append(e)
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan kernel logs for link flaps and GPU Xids")
+    parser.add_argument("--state_dir", type=str, help="index/state directory (default: %s)" % default_state_dir())
+    parser.add_argument("--type", dest="types", action="append", choices=["link_down", "eap_failure", "xid"], help="only show these event types")
+    parser.add_argument("--source", choices=["kmsg", "syslog"], help="only show events from this source")
+    parser.add_argument("--since_hours", type=float, help="only show events from the last N hours")
+    parser.add_argument("-f", "--follow", action="store_true", help="keep reading /dev/kmsg and print new events as they arrive")
+    args = parser.parse_args()
+
+    scanner = KernelLogScanner(state_dir=args.state_dir)
+    if args.follow:
+        try:
+            for event in scanner.follow(types=args.types):
+                json.dump(event, sys.stdout)
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    new_events = scanner.scan()
+    since = time.time() - args.since_hours * 3600 if args.since_hours else None
+    for event in scanner.events(types=args.types, source=args.source, since=since):
+        json.dump(event, sys.stdout)
+        sys.stdout.write("\n")
+    print(f"{len(new_events)} new events", file=sys.stderr)
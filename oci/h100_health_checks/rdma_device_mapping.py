@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-import subprocess
+from rdma_topology import pci_to_ibdev
 
 expected_vals = {'0000:0c:00.0': ['mlx5_0'],
                  '0000:0c:00.1': ['mlx5_1'],
@@ -38,22 +38,17 @@ expected_vals = {'0000:0c:00.0': ['mlx5_0'],
                  '0000:86:10.1': ['mlx5_33']
                  }
 
-def run_ibdev2netdev():
-    result = subprocess.run(['ibdev2netdev', '-v'], stdout=subprocess.PIPE, universal_newlines=True)
-    lines = result.stdout.split('\n')
+def get_rdma_device_mapping():
+    # PCI address -> mlx5 device for every function (VFs included), read from sysfs
+    return pci_to_ibdev(short=False, include_vfs=True)
 
-    data = {}
-    for line in lines[1:]:  # Skip the header line
-        if line:  # Skip empty lines
-            parts = line.split()
-            data[parts[0]] = parts[1]  # Map mlx to interface
-
-    return data
-
-data = run_ibdev2netdev()
+data = get_rdma_device_mapping()
 #print(data)
 
 errors = False
+if not data:
+    print("Failed: No RDMA devices found in /sys/class/infiniband")
+    errors = True
 for key in data:
     if data[key] not in expected_vals[key]:
         print("Failed: Expected {} to be {}, not {}".format(key, expected_vals[key], data[key]))
@@ -9,6 +9,7 @@ import argparse
 import socket
 import subprocess
 from shared_logging import logger
+from kernel_log_scanner import KernelLogScanner
 
 
 class LinkFlappingTest:
@@ -26,33 +27,25 @@ class LinkFlappingTest:
 
     def get_rdma_link_failures(self):
 
-        pattern  = r"(\w{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2})\s+\S+\s+wpa_supplicant(?:\[\d+\])?: (\w+): CTRL-EVENT-EAP-FAILURE EAP authentication failed"
-        pattern2 = r"(\w{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2})\s+\S+\s+kernel: (?:\[\d+\.\d+\]\s)?mlx5_core \S+ (\w+): Link down"
-        
+        # EAP failures and link down events from the incremental syslog index;
+        # only lines appended since the previous run are parsed
+        scanner = KernelLogScanner(syslog_files=[self.log_file])
+        scanner.scan()
+
         self.link_data = {}
-        with open(self.log_file, "r") as f:
-            for line in f:
-                match = re.search(pattern, line)
-                if match:
-                    time_str = match.group(1)
-                    interface = match.group(2)
-                    logger.debug(f"time: {time_str}, interface: {interface}")
-                    if interface not in self.link_data:
-                        self.link_data[interface] = {"failures": [time_str], "link_down": []}
-                    else:
-                        self.link_data[interface]["failures"].append(time_str)
+        for event in scanner.events(types=["eap_failure", "link_down"], source="syslog"):
+            if event["time"] is None:
+                continue
+            time_str = datetime.datetime.fromtimestamp(event["time"]).strftime("%b %d %H:%M:%S")
+            interface = event["device"]
+            logger.debug(f"time: {time_str}, interface: {interface}")
+            if interface not in self.link_data:
+                self.link_data[interface] = {"failures": [], "link_down": []}
+            if event["type"] == "eap_failure":
+                self.link_data[interface]["failures"].append(time_str)
+            else:
+                self.link_data[interface]["link_down"].append(time_str)
 
-                
-                match = re.search(pattern2, line)
-                if match:
-                    time_str = match.group(1)
-                    interface = match.group(2)
-                    logger.debug(f"time: {time_str}, interface: {interface}")
-                    if interface not in self.link_data:
-                        self.link_data[interface] = {"failures": [], "link_down": [time_str]}
-                    else:
-                        self.link_data[interface]["link_down"].append(time_str)
-                        
         logger.debug("Link Data: {}".format(self.link_data))
         return self.link_data
 
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+# RDMA device topology discovered straight from sysfs.
+#
+# Replaces parsing `rdma link`, `mst status -v` and `ibdev2netdev -v`: every
+# mlx5 device under /sys/class/infiniband is resolved to its netdev(s), PCI
+# address and NUMA node. The map is cached for the life of the process so all
+# checks in one health-check run share a single discovery pass.
+
+import os
+import re
+
+SYSFS_IB = "sys/class/infiniband"
+
+_topology_cache = {}
+
+
+def get_sysfs_root():
+    """
+    Return the filesystem root to read sysfs from. Containers that mount the
+    host at /host (the same case `chroot /host ...` handles elsewhere) need the
+    host sysfs, since /sys/class/net is network-namespace scoped.
+    """
+    if os.path.isdir(os.path.join("/host", SYSFS_IB)):
+        return "/host"
+    return "/"
+
+
+def _read(path, default=None):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def _state_name(value):
+    # "4: ACTIVE" -> "ACTIVE", "5: LinkUp" -> "LINK_UP" (same spelling as `rdma link`)
+    if not value:
+        return "UNKNOWN"
+    name = value.split(":", 1)[-1].strip()
+    return re.sub(r"(?<=[a-z])(?=[A-Z])", "_", name).upper()
+
+
+def _port_netdevs(ib_path):
+    # netdevs of the PCI function; dev_port tells which IB port each belongs to
+    netdevs = {}
+    net_dir = os.path.join(ib_path, "device", "net")
+    try:
+        names = sorted(os.listdir(net_dir))
+    except OSError:
+        return netdevs
+    for name in names:
+        dev_port = _read(os.path.join(net_dir, name, "dev_port"), "0")
+        try:
+            port = int(dev_port, 0) + 1
+        except ValueError:
+            port = 1
+        netdevs.setdefault(port, name)
+    return netdevs
+
+
+def discover_rdma_devices(sysfs_root=None):
+    """
+    Walk /sys/class/infiniband and return
+    {ibdev: {"ibdev", "pci", "numa_node", "netdev", "is_vf", "ports": {port: {...}}}}
+    """
+    root = sysfs_root or get_sysfs_root()
+    ib_dir = os.path.join(root, SYSFS_IB)
+    devices = {}
+    try:
+        ibdevs = os.listdir(ib_dir)
+    except OSError:
+        return devices
+
+    for ibdev in ibdevs:
+        ib_path = os.path.join(ib_dir, ibdev)
+        device_path = os.path.realpath(os.path.join(ib_path, "device"))
+        numa_node = _read(os.path.join(ib_path, "device", "numa_node"), "-1")
+        try:
+            numa_node = int(numa_node)
+        except ValueError:
+            numa_node = -1
+
+        netdevs = _port_netdevs(ib_path)
+        ports = {}
+        try:
+            port_names = os.listdir(os.path.join(ib_path, "ports"))
+        except OSError:
+            port_names = []
+        for port_name in port_names:
+            port_path = os.path.join(ib_path, "ports", port_name)
+            port = int(port_name)
+            lid = _read(os.path.join(port_path, "lid"), "0")
+            try:
+                lid = int(lid, 0)
+            except ValueError:
+                lid = 0
+            ports[port] = {
+                "state": _state_name(_read(os.path.join(port_path, "state"))),
+                "physical_state": _state_name(_read(os.path.join(port_path, "phys_state"))),
+                "link_layer": _read(os.path.join(port_path, "link_layer"), "Unknown"),
+                "lid": lid,
+                "netdev": netdevs.get(port),
+            }
+
+        devices[ibdev] = {
+            "ibdev": ibdev,
+            "pci": os.path.basename(device_path),
+            "numa_node": numa_node,
+            "netdev": netdevs.get(1),
+            "is_vf": os.path.exists(os.path.join(ib_path, "device", "physfn")),
+            "ports": dict(sorted(ports.items())),
+        }
+
+    return dict(sorted(devices.items(), key=lambda kv: _natural_key(kv[0])))
+
+
+def _natural_key(name):
+    return [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", name)]
+
+
+def get_rdma_topology(refresh=False, sysfs_root=None):
+    """Cached discover_rdma_devices()."""
+    root = sysfs_root or get_sysfs_root()
+    if refresh or root not in _topology_cache:
+        _topology_cache[root] = discover_rdma_devices(root)
+    return _topology_cache[root]
+
+
+def netdev_to_ibdev(topology=None, ib=False):
+    """
+    {netdev: ibdev} for every RDMA port with a netdev, i.e. the map that used to
+    be built from `rdma link`. With ib=True, IB ports without a netdev are keyed
+    as lid_<lid> like the IB `rdma link` parser did.
+    """
+    topology = topology if topology is not None else get_rdma_topology()
+    mapping = {}
+    for ibdev, dev in topology.items():
+        for port in dev["ports"].values():
+            if port["netdev"]:
+                mapping[port["netdev"]] = ibdev
+            elif ib and port["lid"]:
+                mapping[f"lid_{port['lid']}"] = ibdev
+    return mapping
+
+
+def pci_to_ibdev(topology=None, short=None, include_vfs=False):
+    """
+    {pci_address: ibdev}, the map that used to be built from `mst status -v`
+    (physical functions only) or `ibdev2netdev -v` (include_vfs=True).
+
+    Like mst, the PCI domain is dropped when every device is in domain 0000
+    (e.g. "0c:00.0" on H100) and kept otherwise (e.g. "0002:03:00.0" on GB200).
+    Pass short=True/False to force either form.
+    """
+    topology = topology if topology is not None else get_rdma_topology()
+    devices = [dev for dev in topology.values() if include_vfs or not dev["is_vf"]]
+    if short is None:
+        short = all(dev["pci"].startswith("0000:") for dev in devices)
+    mapping = {}
+    for dev in devices:
+        pci = dev["pci"][5:] if short and dev["pci"].startswith("0000:") else dev["pci"]
+        mapping[pci] = dev["ibdev"]
+    return mapping
+
+
+def ibdev_numa_nodes(topology=None):
+    """{ibdev: numa_node}"""
+    topology = topology if topology is not None else get_rdma_topology()
+    return {ibdev: dev["numa_node"] for ibdev, dev in topology.items()}
+
+
+if __name__ == "__main__":
+    import json
+
+    print(json.dumps(get_rdma_topology(), indent=4))
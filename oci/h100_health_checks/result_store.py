@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# Shared result model and local result database of the health checks.
+#
+# Every tool reduces its findings to rows of RESULT_FIELDS: which host
+# (serial and hostname), which check, which part of the host (a GPU, an mlx5
+# port, an NCCL run), the metric, its numeric value and the verdict, plus a
+# free text detail. The rows go into one SQLite file with indexes on host and
+# time, so questions across checks become a single query, e.g. the hosts
+# with both a FEC bin failure and a low NCCL bus bandwidth:
+#
+#   python3 result_store.py failing mlxlink nccl --since 24
+#
+# Fleet runners can pull the databases of their nodes and combine them (rows
+# merged before are skipped, so a node can be pulled again on every run) with
+#   python3 result_store.py merge node1.db node2.db ...
+
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import time
+
+RESULT_FIELDS = ["host_serial", "hostname", "check_name", "component", "metric", "value", "verdict", "timestamp", "detail"]
+
+VERDICTS = ("Passed", "Warning", "Failed")
+
+# Every tool writes here unless told otherwise (--results-db / --results_db)
+DEFAULT_DB = os.environ.get("OCI_HEALTH_DB", os.path.expanduser("~/oci_health_results.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    host_serial TEXT,
+    hostname TEXT,
+    check_name TEXT NOT NULL,
+    component TEXT,
+    metric TEXT NOT NULL,
+    value REAL,
+    verdict TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS results_serial_time ON results (host_serial, timestamp);
+CREATE INDEX IF NOT EXISTS results_hostname_time ON results (hostname, timestamp);
+CREATE INDEX IF NOT EXISTS results_check_verdict ON results (check_name, verdict, timestamp);
+"""
+
+
+def verdict_of(status):
+    """Map the status strings of the tools ("Passed", "Success", "Failed - ...", "Timeout", "Warning") to VERDICTS."""
+    status = str(status)
+    if status.startswith("Fail") or status.startswith("Timeout") or status.startswith("Error"):
+        return "Failed"
+    if status.startswith("Warn"):
+        return "Warning"
+    return "Passed"
+
+
+def make_result(check, metric, value=None, verdict="Passed", component=None, host_serial=None,
+                hostname=None, timestamp=None, detail=None):
+    """One result row. value must be numeric (or None), anything descriptive goes in detail."""
+    if verdict not in VERDICTS:
+        verdict = verdict_of(verdict)
+    try:
+        value = float(value) if value is not None else None
+    except (TypeError, ValueError):
+        detail = detail or str(value)
+        value = None
+    if value != value:
+        # NaN from pandas
+        value = None
+    return {
+        "host_serial": host_serial,
+        "hostname": hostname if hostname is not None else socket.gethostname(),
+        "check_name": check,
+        "component": None if component is None else str(component),
+        "metric": metric,
+        "value": value,
+        "verdict": verdict,
+        "timestamp": timestamp if timestamp is not None else time.time(),
+        "detail": detail,
+    }
+
+
+class ResultStore:
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        # Several tools may write at once; WAL lets readers run alongside
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def insert(self, results):
+        """Insert result rows in one transaction. Returns the number of rows."""
+        rows = [tuple(r.get(field) for field in RESULT_FIELDS) for r in results]
+        if rows:
+            with self.conn:
+                self.conn.executemany(
+                    f"INSERT INTO results ({', '.join(RESULT_FIELDS)}) VALUES ({', '.join('?' * len(RESULT_FIELDS))})", rows)
+        return len(rows)
+
+    def query(self, sql, params=()):
+        """Rows of a query as dicts."""
+        cursor = self.conn.execute(sql, params)
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def failing_in_all(self, checks, since=None, key="hostname"):
+        """
+        The hosts (by hostname or host_serial) with a Failed result in every
+        one of checks, since the given epoch time. Returns
+        [{key, "checks": n, "failures": n, "last": timestamp}].
+        """
+        params = list(checks)
+        where = f"verdict = 'Failed' AND check_name IN ({', '.join('?' * len(checks))})"
+        if since is not None:
+            where += " AND timestamp >= ?"
+            params.append(since)
+        return self.query(
+            f"SELECT {key}, COUNT(DISTINCT check_name) AS checks, COUNT(*) AS failures, MAX(timestamp) AS last "
+            f"FROM results WHERE {where} AND {key} IS NOT NULL GROUP BY {key} "
+            f"HAVING COUNT(DISTINCT check_name) = ? ORDER BY {key}", params + [len(set(checks))])
+
+    def merge(self, path):
+        """
+        Copy the results of another result database into this one. Rows that
+        are already here (same hostname, check, component, metric and
+        timestamp) are skipped, so merging the same source twice is a no-op.
+        Returns the number of rows added.
+        """
+        self.conn.execute("ATTACH DATABASE ? AS other", (path,))
+        try:
+            with self.conn:
+                cursor = self.conn.execute(
+                    f"INSERT INTO results ({', '.join(RESULT_FIELDS)}) "
+                    f"SELECT DISTINCT {', '.join('o.' + f for f in RESULT_FIELDS)} FROM other.results AS o "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM results AS r WHERE r.hostname IS o.hostname "
+                    f"AND r.check_name = o.check_name AND r.component IS o.component "
+                    f"AND r.metric = o.metric AND r.timestamp = o.timestamp)")
+            return cursor.rowcount
+        finally:
+            self.conn.execute("DETACH DATABASE other")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def record(results, path=DEFAULT_DB):
+    """
+    Store results in the database at path, for the tools to call at the end
+    of a run. A falsy path disables it; a database error is logged and never
+    fails the check itself.
+    """
+    if not path:
+        return 0
+    try:
+        with ResultStore(path) as store:
+            count = store.insert(results)
+        logging.debug(f"Stored {count} results in {path}")
+        return count
+    except (sqlite3.Error, OSError) as e:
+        logging.warning(f"Could not store results in {path}: {e}")
+        return 0
+
+
+def format_rows(rows):
+    if not rows:
+        return "(no rows)"
+    header = list(rows[0])
+    table = [[str(r[c]) for c in header] for r in rows]
+    widths = [max(len(x) for x in col) for col in zip(header, *table)]
+    return "\n".join("  ".join(c.ljust(w) for c, w in zip(r, widths)) for r in [header] + table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the local health check result database")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Result database (default: %(default)s, or $OCI_HEALTH_DB)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("failing", help="Hosts with a failure in every one of the given checks")
+    p.add_argument("checks", nargs="+", help="Check names, e.g. mlxlink nccl gpu_burn")
+    p.add_argument("--since", type=float, default=None, help="Only results of the last N hours")
+    p.add_argument("--by", choices=["hostname", "host_serial"], default="hostname", help="Match hosts by (default: %(default)s)")
+    p = sub.add_parser("query", help="Run an SQL query against the results table")
+    p.add_argument("sql")
+    p = sub.add_parser("merge", help="Add the results of other databases to --db")
+    p.add_argument("sources", nargs="+")
+    args = parser.parse_args()
+
+    with ResultStore(args.db) as store:
+        if args.command == "failing":
+            since = time.time() - args.since * 3600 if args.since is not None else None
+            print(format_rows(store.failing_in_all(args.checks, since, args.by)))
+        elif args.command == "query":
+            print(format_rows(store.query(args.sql)))
+        else:
+            for source in args.sources:
+                print(f"{source}: {store.merge(source)} results", file=sys.stderr)
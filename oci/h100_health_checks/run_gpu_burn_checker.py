@@ -18,6 +18,9 @@ logging.config.fileConfig('logging.conf')
 # create logger
 logger = logging.getLogger('simpleExample')
 
+# Files gpu_burn_checker.py needs on the remote host
+SUPPORT_FILES = ["gpu_telemetry.py", "gpu_sampler.py", "check_gpu_throttle.py", "result_store.py", "logging.conf"]
+
 class run_gpu_burn:
     def __init__(self, args):
         self.status_df = pd.DataFrame()
@@ -29,6 +32,7 @@ class run_gpu_burn:
         self.nfs = args.nfs
         self.venv = args.venv
         self.gflops_threshold = args.gflops_threshold
+        self.profile = args.profile
         self.script_directory = args.script_directory
         self.hostfile = args.hostfile
         self.exe_file = args.exe_file
@@ -93,8 +97,9 @@ class run_gpu_burn:
 
 
     def distribute_file_to_host(self, host):
-        logging.debug(f'Distributing {self.exe_file} to {host}')
-        cmd = f'scp -P {self.port} {self.exe_file} {self.user}@{host}:{self.script_directory}'
+        files = " ".join([self.exe_file] + SUPPORT_FILES)
+        logging.debug(f'Distributing {files} to {host}')
+        cmd = f'scp -P {self.port} {files} {self.user}@{host}:{self.script_directory}'
         logging.debug(cmd)
         output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
         if output.returncode != 0:
@@ -107,7 +112,10 @@ class run_gpu_burn:
 
     def execute_file_on_host(self, host):
         logging.debug(f'Executing {self.exe_file} on {host}')
-        cmd = f'ssh -p {self.port} {self.user}@{host} "cd {self.script_directory}; python3 {self.exe_file} --date_stamp {self.date_stamp} --gflops_threshold {self.gflops_threshold}"'
+        options = f'--date_stamp {self.date_stamp} --profile {self.profile}'
+        if self.gflops_threshold:
+            options += f' --gflops_threshold {self.gflops_threshold}'
+        cmd = f'ssh -p {self.port} {self.user}@{host} "cd {self.script_directory}; python3 {self.exe_file} {options}"'
         logging.debug(cmd)
         output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
         if output.returncode != 0:
@@ -191,7 +199,8 @@ if __name__ == '__main__':
     parser.add_argument('--date_stamp', default=None, type=str, help='the date stamp')
     parser.add_argument('--nfs', action='store_true', help='script directory is NFS mounted (default: %(default)s)')
     parser.add_argument('--venv', type=str, default='', help='specify the python virtual environment to use')
-    parser.add_argument('--gflops_threshold', type=str, default='42000', help='specify the GFlops threshold')
+    parser.add_argument('--gflops_threshold', type=str, default=None, help='override the GFlops threshold of the burn profile')
+    parser.add_argument('--profile', choices=['default', 'smoke', 'soak'], default='default', help='gpu_burn_checker.py burn profile (default: %(default)s)')
     parser.add_argument('--max_workers', type=int, default=32, help='specify the maximum number of workers (default: %(default)s)')
     parser.add_argument('-p', '--port', type=int, default=22, help='specify the ssh port number (default: %(default)s)')
 
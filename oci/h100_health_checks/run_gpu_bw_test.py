@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+# Note: sudo pip3 install tabulate pandas numpy Pyarrow
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import os
+import threading
+import pandas as pd
+from  tabulate import tabulate
+import logging
+import subprocess
+import logging.config
+
+logging.config.fileConfig('logging.conf')
+
+# create logger
+logger = logging.getLogger('simpleExample')
+
+# Must match gpu_bw_test.STREAM_PREFIX
+STREAM_PREFIX = "BW_RESULT "
+
+# Files gpu_bw_test.py needs on the remote host
+SUPPORT_FILES = ["shared_logging.py", "gpu_telemetry.py"]
+
+
+class run_gpu_bw_test:
+    def __init__(self, args):
+        self.status_df = pd.DataFrame()
+        self.samples = []
+        self.samples_lock = threading.Lock()
+        if args.date_stamp is None:
+            self.date_stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        else:
+            self.date_stamp = args.date_stamp
+        self.script_directory = args.script_directory
+        self.exe_file = args.exe_file
+        self.bw_test_exe = args.bw_test_exe
+        self.user = args.user
+        self.max_workers = args.max_workers
+        self.port = args.port
+        self.iterations = args.iterations
+        self.size = args.size
+        self.sweep = args.sweep
+        self.mode = args.mode
+        # A GPU/host is an outlier when it is more than mad_threshold scaled MADs
+        # and min_drop (fraction) below the fleet median
+        self.mad_threshold = args.mad_threshold
+        self.min_drop = args.min_drop
+
+
+    def get_date_stamp(self):
+        return self.date_stamp
+
+
+    def setup_host(self, host):
+        logging.debug(f'Setting up {host}')
+        cmd = f'ssh -p {self.port} {self.user}@{host} "mkdir -p {self.script_directory}"'
+        logging.debug(cmd)
+        output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if output.returncode != 0:
+            logging.debug(f'Error setting up {host}')
+            return {'host': host, 'cmd': ['setup_host'], 'status': 'Fail', 'output': output.stderr}
+        else:
+            logging.debug(f'Successfully set up {host}')
+            return {'host': host, 'cmd': ['setup_host'], 'status': 'Pass', 'output': output.stdout}
+
+
+    def distribute_file_to_host(self, host):
+        files = " ".join([self.exe_file] + SUPPORT_FILES)
+        logging.debug(f'Distributing {files} to {host}')
+        cmd = f'scp -P {self.port} {files} {self.user}@{host}:{self.script_directory}'
+        logging.debug(cmd)
+        output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if output.returncode != 0:
+            logging.debug(f'Error distributing {files} to {host}')
+            return {'host': host, 'cmd': ['distribute_file_to_hosts'], 'status': 'Fail', 'output': output.stderr}
+        else:
+            logging.debug(f'Successfully distributed {files} to {host}')
+            return {'host': host, 'cmd': ['distribute_file_to_hosts'], 'status': 'Pass', 'output': output.stdout}
+
+
+    def get_remote_command(self):
+        cmd = f'python3 {self.exe_file} --stream -i {self.iterations} -s {self.size} --mode {self.mode}'
+        if self.sweep:
+            cmd += ' --sweep ' + ' '.join(str(x) for x in self.sweep)
+        if self.bw_test_exe:
+            cmd += f' --bw-test-exe {self.bw_test_exe}'
+        return cmd
+
+
+    def execute_file_on_host(self, host):
+        """
+        Run the bandwidth test on host and collect its per-GPU measurements
+        while it runs, instead of copying result files back afterwards.
+        """
+        logging.debug(f'Executing {self.exe_file} on {host}')
+        cmd = f'ssh -p {self.port} {self.user}@{host} "cd {self.script_directory}; {self.get_remote_command()}"'
+        logging.debug(cmd)
+        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        other_output = []
+        count = 0
+        for line in proc.stdout:
+            if not line.startswith(STREAM_PREFIX):
+                other_output.append(line)
+                continue
+            try:
+                record = json.loads(line[len(STREAM_PREFIX):])
+            except ValueError:
+                other_output.append(line)
+                continue
+            record["ssh_host"] = host
+            with self.samples_lock:
+                self.samples.append(record)
+            count += 1
+            logging.debug(f'{host}: GPU {record["device"]} {record["direction"]} {record["size"]}: {record["bandwidth"]} GB/s')
+        proc.wait()
+        if proc.returncode != 0 or count == 0:
+            logging.debug(f'Error executing {self.exe_file} on {host}')
+            return {'host': host, 'cmd': ['execute_file_on_hosts'], 'status': 'Fail', 'output': "".join(other_output[-20:])}
+        else:
+            logging.info(f'{host}: collected {count} bandwidth measurements')
+            return {'host': host, 'cmd': ['execute_file_on_hosts'], 'status': 'Pass', 'output': f'{count} measurements'}
+
+    def run_executable_on_hosts(self, task, hosts):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_to_task = {executor.submit(task, host): host for host in hosts}
+            for future in concurrent.futures.as_completed(future_to_task):
+                data = future.result()
+                logging.debug(f"Data: {data}")
+                self.status_df = pd.concat([self.status_df, pd.DataFrame(data)], ignore_index=True)
+
+    def find_outliers(self, df, keys):
+        """
+        Flag the rows of df (one bandwidth median per keys + direction + size)
+        that sit below the fleet distribution of the same direction and size.
+        """
+        group = df.groupby(["direction", "size"])["bandwidth"]
+        df = df.assign(fleet_median=group.transform("median"))
+        df["fleet_mad"] = (df["bandwidth"] - df["fleet_median"]).abs().groupby([df["direction"], df["size"]]).transform("median")
+        floor = (self.mad_threshold * 1.4826 * df["fleet_mad"]).clip(lower=self.min_drop * df["fleet_median"])
+        df["deficit_pct"] = ((df["fleet_median"] - df["bandwidth"]) / df["fleet_median"] * 100).round(1)
+        outliers = df[df["fleet_median"] - df["bandwidth"] > floor]
+        # Keep the size with the largest deficit for every GPU/host and direction
+        outliers = outliers.sort_values("deficit_pct", ascending=False).drop_duplicates(subset=keys + ["direction"])
+        return outliers.sort_values(keys + ["direction"]).reset_index(drop=True)
+
+    def process_results(self):
+        if not self.samples:
+            logging.error('No bandwidth measurements were collected')
+            return
+
+        samples = pd.DataFrame(self.samples)
+        valid = samples[samples["bandwidth"] >= 0]
+
+        # Failed runs report -1 for every size
+        failed = samples.groupby(["host", "device", "direction"])["bandwidth"].max().reset_index()
+        failed = failed[failed["bandwidth"] < 0]
+
+        per_gpu = valid.groupby(["host", "device", "direction", "size"])["bandwidth"].median().reset_index()
+        per_host = per_gpu.groupby(["host", "direction", "size"])["bandwidth"].median().reset_index()
+
+        gpu_outliers = self.find_outliers(per_gpu, ["host", "device"])
+        host_outliers = self.find_outliers(per_host, ["host"])
+
+        summary = per_gpu.groupby(["direction", "size"])["bandwidth"].describe(percentiles=[0.01, 0.1, 0.5])
+        logging.info(f"Fleet bandwidth distribution (GB/s)\n{tabulate(summary, headers='keys', tablefmt='simple_outline')}")
+
+        if not failed.empty:
+            logging.info('The following GPUs did not produce a result')
+            logging.info(f"\n{tabulate(failed[['host', 'device', 'direction']], headers='keys', tablefmt='simple_outline', showindex=False)}")
+        if not host_outliers.empty:
+            logging.info('The following hosts are below the fleet distribution')
+            logging.info(f"\n{tabulate(host_outliers, headers='keys', tablefmt='simple_outline', showindex=False)}")
+        if not gpu_outliers.empty:
+            logging.info('The following GPUs are below the fleet distribution')
+            logging.info(f"\n{tabulate(gpu_outliers, headers='keys', tablefmt='simple_outline', showindex=False)}")
+            gpu_outliers.to_csv(f'gpu_bw_outliers_{self.date_stamp}.csv', index=False)
+            gpu_outliers.to_json(f'gpu_bw_outliers_{self.date_stamp}.json', orient='records')
+        if failed.empty and host_outliers.empty and gpu_outliers.empty:
+            logging.info('All GPUs are within the fleet distribution')
+
+        # All raw measurements, one row per host/GPU/iteration/direction/size
+        try:
+            samples.to_parquet(f'run_gpu_bw_{self.date_stamp}.parquet', index=False)
+        except ImportError:
+            logging.warning('pyarrow is not installed, writing the results as CSV')
+            samples.to_csv(f'run_gpu_bw_{self.date_stamp}.csv', index=False)
+
+
+if __name__ == '__main__':
+    # Create the parser
+    parser = argparse.ArgumentParser(description='Run the GPU bandwidth test on a set of hosts and compare them against each other')
+
+    # Add the arguments
+    parser.add_argument('--hostfile', type=str, default='hostfile.txt', help='the hostfile name')
+    parser.add_argument('-f', '--exe_file', type=str, default='gpu_bw_test.py', help='the executable file')
+    parser.add_argument('--script_directory', type=str, default='cloud_scripts/oci/h100_health_checks', help='the script directory')
+    parser.add_argument('-s', '--setup_host', action='store_true', help='create the script directory on the remote hosts')
+    parser.add_argument('-d', '--distribute', action='store_true', help='distribute the executable file to the remote hosts')
+    parser.add_argument('-e', '--execute', action='store_true', help='execute the bandwidth test on the remote hosts and analyze the results')
+    parser.add_argument('-u', '--user', default="ubuntu", type=str, help='the user name')
+    parser.add_argument('--date_stamp', default=None, type=str, help='the date stamp')
+    parser.add_argument('--bw_test_exe', default=None, type=str, help='path to bandwidthTest on the remote hosts')
+    parser.add_argument('-i', '--iterations', type=int, default=3, help='bandwidthTest iterations per GPU (default: %(default)s)')
+    parser.add_argument('--size', type=int, default=32000000, help='transfer size in bytes (default: %(default)s)')
+    parser.add_argument('--sweep', nargs=3, type=int, metavar=('START', 'END', 'INCREMENT'), help='sweep transfer sizes in bytes')
+    parser.add_argument('--mode', choices=['numa', 'all', 'serial'], default='numa', help='GPU scheduling on each host (default: %(default)s)')
+    parser.add_argument('--mad_threshold', type=float, default=3.5, help='scaled MADs below the fleet median to flag (default: %(default)s)')
+    parser.add_argument('--min_drop', type=float, default=0.10, help='minimum fraction below the fleet median to flag (default: %(default)s)')
+    parser.add_argument('--max_workers', type=int, default=32, help='specify the maximum number of workers (default: %(default)s)')
+    parser.add_argument('-p', '--port', type=int, default=22, help='specify the ssh port number (default: %(default)s)')
+
+    # Execute the parse_args() method
+    args = parser.parse_args()
+
+    rbw = run_gpu_bw_test(args)
+
+    # Read the hostfile
+    with open(args.hostfile, 'r') as f:
+        hosts = [x.strip() for x in f.readlines() if x.strip()]
+
+    logging.debug(f'Hosts: {hosts}')
+
+    if args.setup_host:
+        logging.debug('Setting up the hosts')
+        rbw.run_executable_on_hosts(rbw.setup_host, hosts)
+    if args.distribute:
+        logging.debug('Distributing the executable to the hosts')
+        rbw.run_executable_on_hosts(rbw.distribute_file_to_host, hosts)
+    if args.execute:
+        results_directory = f'results_{rbw.get_date_stamp()}'
+        if not os.path.exists(results_directory):
+            os.mkdir(results_directory)
+
+        logging.debug('Executing the bandwidth test on the hosts')
+        rbw.run_executable_on_hosts(rbw.execute_file_on_host, hosts)
+
+        fail_df = rbw.status_df[rbw.status_df['status'] == 'Fail'] if not rbw.status_df.empty else rbw.status_df
+        if not fail_df.empty:
+            logging.info(f"Hosts that failed to run the test\n{tabulate(fail_df[['host', 'output']], headers='keys', tablefmt='simple_outline', showindex=False)}")
+
+        os.chdir(results_directory)
+        print('Processing the results')
+        rbw.process_results()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Note: sudo pip3 install tabulate pandas
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import pandas as pd
+from  tabulate import tabulate
+import logging
+import subprocess
+import logging.config
+from check_gpu_throttle import throttle_severity
+
+logging.config.fileConfig('logging.conf')
+
+# create logger
+logger = logging.getLogger('simpleExample')
+
+# Files check_gpu_throttle.py needs on the remote host
+SUPPORT_FILES = ["gpu_telemetry.py"]
+
+
+class run_gpu_throttle_check:
+    def __init__(self, args):
+        self.status_df = pd.DataFrame()
+        self.rows = []
+        if args.date_stamp is None:
+            self.date_stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        else:
+            self.date_stamp = args.date_stamp
+        self.script_directory = args.script_directory
+        self.exe_file = args.exe_file
+        self.user = args.user
+        self.max_workers = args.max_workers
+        self.port = args.port
+        self.duration = args.duration
+        self.interval = args.interval
+        self.persistent_fraction = args.persistent_fraction
+
+
+    def setup_host(self, host):
+        logging.debug(f'Setting up {host}')
+        cmd = f'ssh -p {self.port} {self.user}@{host} "mkdir -p {self.script_directory}"'
+        output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if output.returncode != 0:
+            return {'host': host, 'cmd': ['setup_host'], 'status': 'Fail', 'output': output.stderr}
+        return {'host': host, 'cmd': ['setup_host'], 'status': 'Pass', 'output': output.stdout}
+
+
+    def distribute_file_to_host(self, host):
+        files = " ".join([self.exe_file] + SUPPORT_FILES)
+        logging.debug(f'Distributing {files} to {host}')
+        cmd = f'scp -P {self.port} {files} {self.user}@{host}:{self.script_directory}'
+        output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if output.returncode != 0:
+            return {'host': host, 'cmd': ['distribute_file_to_hosts'], 'status': 'Fail', 'output': output.stderr}
+        return {'host': host, 'cmd': ['distribute_file_to_hosts'], 'status': 'Pass', 'output': output.stdout}
+
+
+    def execute_file_on_host(self, host):
+        """
+        Sample the throttle reasons on host and turn its JSON result into one
+        row per GPU and reason.
+        """
+        remote = (f'python3 {self.exe_file} --json --duration {self.duration} --interval {self.interval} '
+                  f'--persistent-fraction {self.persistent_fraction}')
+        cmd = f'ssh -p {self.port} {self.user}@{host} "cd {self.script_directory}; {remote}"'
+        logging.debug(cmd)
+        output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        try:
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            return {'host': host, 'cmd': ['execute_file_on_hosts'], 'status': 'Fail', 'output': output.stderr[-2000:]}
+
+        rows = []
+        for gpu, gpu_result in result["results"].items():
+            base = {'host': host, 'gpu': int(gpu), 'pci': gpu_result['pci'], 'serial': gpu_result['serial'],
+                    'gpu_status': gpu_result['status']}
+            if not gpu_result['reasons']:
+                rows.append(dict(base, reason=None, state=None, fraction=None))
+            for reason, info in gpu_result['reasons'].items():
+                rows.append(dict(base, reason=reason, state=info['state'], fraction=info['fraction']))
+        self.rows.extend(rows)
+        return {'host': host, 'cmd': ['execute_file_on_hosts'], 'status': 'Pass', 'output': result['status']}
+
+    def run_executable_on_hosts(self, task, hosts):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_to_task = {executor.submit(task, host): host for host in hosts}
+            for future in concurrent.futures.as_completed(future_to_task):
+                data = future.result()
+                logging.debug(f"Data: {data}")
+                self.status_df = pd.concat([self.status_df, pd.DataFrame(data)], ignore_index=True)
+
+    def process_results(self):
+        if not self.rows:
+            logging.error('No throttle results were collected')
+            return
+
+        df = pd.DataFrame(self.rows).sort_values(['host', 'gpu'])
+        df['severity'] = [throttle_severity(reason, state) for reason, state in zip(df['reason'], df['state'])]
+        df.to_csv(f'gpu_throttle_{self.date_stamp}.csv', index=False)
+
+        # Fleet view: how many GPUs show each reason, and how persistently
+        counts = df.dropna(subset=['reason']).groupby(['reason', 'state'])['gpu'].count().reset_index(name='gpus')
+        logging.info(f"Throttle reasons across the fleet\n{tabulate(counts, headers='keys', tablefmt='simple_outline', showindex=False)}")
+
+        flagged = df[df['severity'].notna()].sort_values(['severity', 'host', 'gpu'])
+        if flagged.empty:
+            logging.info('No GPU is throttled')
+            return
+        logging.info('The following GPUs are throttled')
+        logging.info(f"\n{tabulate(flagged, headers='keys', tablefmt='simple_outline', showindex=False)}")
+        flagged.to_json(f'gpu_throttle_flagged_{self.date_stamp}.json', orient='records')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check a set of hosts for GPU clock throttling')
+    parser.add_argument('--hostfile', type=str, default='hostfile.txt', help='the hostfile name')
+    parser.add_argument('-f', '--exe_file', type=str, default='check_gpu_throttle.py', help='the executable file')
+    parser.add_argument('--script_directory', type=str, default='cloud_scripts/oci/h100_health_checks', help='the script directory')
+    parser.add_argument('-s', '--setup_host', action='store_true', help='create the script directory on the remote hosts')
+    parser.add_argument('-d', '--distribute', action='store_true', help='distribute the executable file to the remote hosts')
+    parser.add_argument('-e', '--execute', action='store_true', help='run the throttle check on the remote hosts and analyze the results')
+    parser.add_argument('-u', '--user', default="ubuntu", type=str, help='the user name')
+    parser.add_argument('--date_stamp', default=None, type=str, help='the date stamp')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds to sample on every host (default: %(default)s)')
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between samples (default: %(default)s)')
+    parser.add_argument('--persistent_fraction', type=float, default=0.8, help='fraction of samples for a reason to be persistent (default: %(default)s)')
+    parser.add_argument('--max_workers', type=int, default=32, help='specify the maximum number of workers (default: %(default)s)')
+    parser.add_argument('-p', '--port', type=int, default=22, help='specify the ssh port number (default: %(default)s)')
+    args = parser.parse_args()
+
+    rtc = run_gpu_throttle_check(args)
+
+    with open(args.hostfile, 'r') as f:
+        hosts = [x.strip() for x in f.readlines() if x.strip()]
+
+    if args.setup_host:
+        rtc.run_executable_on_hosts(rtc.setup_host, hosts)
+    if args.distribute:
+        rtc.run_executable_on_hosts(rtc.distribute_file_to_host, hosts)
+    if args.execute:
+        rtc.run_executable_on_hosts(rtc.execute_file_on_host, hosts)
+
+        fail_df = rtc.status_df[rtc.status_df['status'] == 'Fail'] if not rtc.status_df.empty else rtc.status_df
+        if not fail_df.empty:
+            logging.info(f"Hosts that failed to run the check\n{tabulate(fail_df[['host', 'output']], headers='keys', tablefmt='simple_outline', showindex=False)}")
+
+        rtc.process_results()
@@ -2,19 +2,53 @@
 
 import argparse
 from shared_logging import logger
+from kernel_log_scanner import KernelLogScanner, get_boot_time
 import subprocess
+import shlex
 import sys
 import re
 import os
+import time
+from datetime import datetime
+
+# One pattern for every NVRM Xid line, whatever the Xid number
+XID_PATTERN = re.compile(r"NVRM: Xid \(PCI:(?P<pci>[^)]*)\): (?P<xid>\d+),\s*(?P<message>[^\n]*)")
+DMESG_TIME_PATTERN = re.compile(
+    r"\[\s*(?:(?P<mono>\d+\.\d+)|(?P<wall>\w{3} \w{3}\s+\d{1,2} \d{2}:\d{2}:\d{2} \d{4}))\]"
+)
+
+
+def parse_xid_events(dmesg_output, boot_time=None):
+    """
+    Extract (pci, xid, timestamp, message) tuples from dmesg text in a single pass.
+    Handles both `dmesg` ([seconds since boot]) and `dmesg -T` ([wall clock])
+    prefixes; timestamp is None when the line carries neither.
+    """
+    events = []
+    for m in XID_PATTERN.finditer(dmesg_output):
+        line_start = dmesg_output.rfind("\n", 0, m.start()) + 1
+        ts = None
+        tm = DMESG_TIME_PATTERN.match(dmesg_output, line_start)
+        if tm and tm.group("mono"):
+            if boot_time is None:
+                boot_time = get_boot_time()
+            ts = boot_time + float(tm.group("mono"))
+        elif tm and tm.group("wall"):
+            ts = datetime.strptime(" ".join(tm.group("wall").split()), "%a %b %d %H:%M:%S %Y").timestamp()
+        events.append((m.group("pci"), m.group("xid"), ts, m.group("message").strip()))
+    return events
+
 
 class XidChecker:
-    def __init__(self, dmesg_cmd="dmesg", time_interval=60):
+    def __init__(self, dmesg_cmd="dmesg", time_interval=None):
         # if user is root
         if not os.geteuid() == 0:
             logger.info("The XidChecker script did not run since it must be run as root")
             sys.exit(1)
         self.dmesg_cmd = dmesg_cmd
-       
+        # Only Xids from the last time_interval hours count; None means since boot
+        self.time_interval = time_interval
+
         self.results = {}
 
         # Check for the following GPU Xid errors in dmesg
@@ -173,42 +207,80 @@ class XidChecker:
                 "143": {"description": "GPU Initialization Failure", "severity": "Warn"}
                 }
 
+    def get_xid_events(self):
+        """(pci, xid, timestamp, message) for every Xid logged since boot."""
+        if self.dmesg_cmd == "dmesg":
+            # Incremental kernel log index: only records logged since the last check are parsed
+            scanner = KernelLogScanner()
+            scanner.scan()
+            return [
+                (e["pci"], str(e["xid"]), e["time"], e["message"])
+                for e in scanner.events(types=["xid"], source="kmsg", current_boot=True)
+            ]
+        dmesg_output = subprocess.check_output(shlex.split(self.dmesg_cmd)).decode("utf-8", errors="replace")
+        return parse_xid_events(dmesg_output)
+
     def check_gpu_xid(self):
         status = "Pass"
-        dmesg_output = subprocess.check_output([self.dmesg_cmd]).decode("utf-8")
-        if "NVRM: Xid" in dmesg_output:
-            for XID in self.XID_EC.keys():
-                logger.debug(f"Checking for GPU Xid {XID} error in dmesg")
-                
-                matches = re.findall(f"NVRM: Xid \(PCI:(.*?): {XID},", dmesg_output)
-                tmp_dict = {}
-                for match in matches:
-                    if match not in tmp_dict:
-                        tmp_dict[match] = 1
-                    else:
-                        tmp_dict[match] = tmp_dict[match] + 1
-                for x in tmp_dict.keys():
-                    logger.info(f"{XID} : count: {tmp_dict[x]}, {self.XID_EC[XID]['description']} - PCI: {x}")
-                if not matches:
-                    logger.debug(f"No GPU Xid {XID} error found in dmesg")
-                if tmp_dict != {}:
-                    if self.XID_EC[XID]['severity'] == "Critical":
-                        status = "Failed"
-                    self.results[XID] = {"results": tmp_dict, "description": self.XID_EC[XID]['description']}
-        else:
-            logger.info("Xid Check: Passed")
+        since = time.time() - self.time_interval * 3600 if self.time_interval else None
+
+        xid_counts = {}
+        last_seen = {}
+        for pci, XID, ts, message in self.get_xid_events():
+            if since is not None and ts is not None and ts < since:
+                continue
+            counts = xid_counts.setdefault(XID, {})
+            counts[pci] = counts.get(pci, 0) + 1
+            if ts is not None:
+                last_seen.setdefault(XID, {})[pci] = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+        for XID, tmp_dict in xid_counts.items():
+            xid_ec = self.XID_EC.get(XID, {"description": "Unknown Xid", "severity": "Warn"})
+            for x in tmp_dict.keys():
+                logger.info(f"{XID} : count: {tmp_dict[x]}, {xid_ec['description']} - PCI: {x}")
+            if xid_ec['severity'] == "Critical":
+                status = "Failed"
+            self.results[XID] = {"results": tmp_dict, "description": xid_ec['description'], "last_seen": last_seen.get(XID, {})}
+
+        if not xid_counts:
+            if since is not None:
+                logger.info(f"Xid Check: Passed (no Xids in the last {self.time_interval} hours)")
+            else:
+                logger.info("Xid Check: Passed")
         return {"status": status, "results": self.results}
 
+    def monitor(self):
+        """Follow /dev/kmsg and report Xids as they happen; resumes from the saved cursor."""
+        scanner = KernelLogScanner()
+        for event in scanner.follow(types=["xid"]):
+            XID = str(event["xid"])
+            xid_ec = self.XID_EC.get(XID, {"description": "Unknown Xid", "severity": "Warn"})
+            msg = f"GPU Xid {XID} device: {event['pci']}, {xid_ec['description']} - {event['message']}"
+            if xid_ec['severity'] == "Critical":
+                logger.error(msg)
+            else:
+                logger.warning(msg)
+            yield event
+
 
 if __name__ == '__main__':
     # Argument parsing
     parser = argparse.ArgumentParser(description='Check for GPU Xid errors.')
     parser.add_argument('--dmesg_cmd', default='dmesg', help='Dmesg file to check. Default is dmesg.')
+    parser.add_argument('--time_interval', type=float, default=None, help='Only fail on Xids from the last N hours (default: since boot)')
+    parser.add_argument('-f', '--follow', action='store_true', help='Keep monitoring /dev/kmsg for new Xids')
     args = parser.parse_args()
 
 
     logger.debug(f"Using dmesg command: {args.dmesg_cmd}")
     
-    xc = XidChecker(dmesg_cmd=args.dmesg_cmd)
+    xc = XidChecker(dmesg_cmd=args.dmesg_cmd, time_interval=args.time_interval)
+    if args.follow:
+        try:
+            for _ in xc.monitor():
+                pass
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
     results = xc.check_gpu_xid()
     logger.debug("Status: {}, Results: {}".format(results["status"], results["results"]))
@@ -0,0 +1 @@
+../h100_health_checks/gpu_telemetry.py
\ No newline at end of file
@@ -1,11 +1,14 @@
 #!/bin/bash
 
+# Quick ib_write_bw run over all H100 rails between two hosts.
+# rail_bw_matrix.py runs the same test over a whole hostfile and parses the results.
+
 n1=$1
 n2=$2
 
-# Srv
-ssh $n1 "for x in 0 1 3 4 5 6 7 8 9 10 12 13 14 15 16 17;do ib_write_bw -a -d mlx5_${x} -F &";done
+# Srv: one port per device, otherwise every server after the first fails to bind
+ssh $n1 "for x in 0 1 3 4 5 6 7 8 9 10 12 13 14 15 16 17;do ib_write_bw -a -d mlx5_\${x} -F -p \$((18515+x)) &>/dev/null & done"
 
-# Client
+# Client: connect to the server host, all rails at once
 sleep 3
-ssh $n2 "for x in 0 1 3 4 5 6 7 8 9 10 12 13 14 15 16 17;do ib_write_bw -a -d mlx5_${x} -F $n2";sleep 3;done
+ssh $n2 "for x in 0 1 3 4 5 6 7 8 9 10 12 13 14 15 16 17;do ib_write_bw -a -d mlx5_\${x} -F -p \$((18515+x)) $n1 > ib_write_bw_mlx5_\${x}.out & done; wait"
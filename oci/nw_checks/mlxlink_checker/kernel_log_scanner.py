@@ -0,0 +1 @@
+../../h100_health_checks/kernel_log_scanner.py
\ No newline at end of file
@@ -18,6 +18,9 @@ import sys
 import os
 import re
 from glob import glob
+from rdma_topology import get_rdma_topology, netdev_to_ibdev
+from kernel_log_scanner import KernelLogScanner
+from result_store import make_result, record, DEFAULT_DB
 
 import logging.config
 import matplotlib.pyplot as plt
@@ -154,61 +157,41 @@ class MlxlinkInfo:
         date_str = output.stdout.strip()
         uptime_date = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
 
-        cmd = "chroot /host rdma link show"
-        output = subprocess.run(
-            cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
-        )
-        if output.returncode != 0:
-            cmd = "rdma link show"
-            output = subprocess.run(
-                cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
-            )
-            if output.returncode != 0:
-                return {}
-
-        pattern = r"(mlx5_\d+)/\d+ state (\w+) physical_state (\w+) netdev (\w+)"
-        rdma_dict = {}
-        for line in output.stdout.split("\n"):
-            match = re.search(pattern, line)
-            if match:
-                rdma_dict[match.group(4)] = match.group(1)
+        # netdev -> mlx5 map from sysfs (host sysfs is used when running under /host)
+        rdma_dict = netdev_to_ibdev(get_rdma_topology())
+        if not rdma_dict:
+            return {}
 
-        cmd = "chroot /host dmesg -T| grep -E 'mlx5_'"
-        output = subprocess.run(
-            cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
-        )
-        if output.returncode != 0:
-            cmd = "dmesg -T| grep -E 'mlx5_'"
-            output = subprocess.run(
-                cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+        # Link down events of this boot from the incremental kernel log index
+        try:
+            scanner = KernelLogScanner()
+            scanner.scan()
+            events = scanner.events(
+                types=["link_down"],
+                source="kmsg",
+                since=datetime.now().timestamp() - self.flap_duration_threshold,
+                current_boot=True,
             )
-            if output.returncode != 0:
-                return {}
+        except OSError as e:
+            logging.error(f"Error scanning kernel log for link flaps: {e}")
+            return {}
 
         link_dict = {}
-        for line in output.stdout.split("\n"):
-            if "mlx5_" in line and "link down" in line.lower():
-                pattern = (
-                    r"\[(\w{3} \w{3} {1,2}\d{1,2} \d{2}:\d{2}:\d{2} \d{4})\].*(rdma\d+): Link (\w+)"
-                )
-                match = re.search(pattern, line)
-                if match:
-                    link_flap_time = datetime.strptime(
-                        match.group(1), "%a %b %d %H:%M:%S %Y"
-                    )
-                    mlx_interface = match.group(2)
-                    mlx_interface = rdma_dict.get(mlx_interface, mlx_interface)
-
-                    if (datetime.now() - link_flap_time).total_seconds() < self.flap_duration_threshold:
-                        if (link_flap_time - uptime_date).total_seconds() > self.flap_startup_wait_time:
-                            if mlx_interface not in link_dict:
-                                link_dict[mlx_interface] = {
-                                    "last_flap_time": link_flap_time,
-                                    "flap_count": 1,
-                                }
-                            else:
-                                link_dict[mlx_interface]["flap_count"] += 1
-                                link_dict[mlx_interface]["last_flap_time"] = link_flap_time
+        for event in events:
+            if not re.match(r"rdma\d+$", event["device"]):
+                continue
+            link_flap_time = datetime.fromtimestamp(event["time"]).replace(microsecond=0)
+            mlx_interface = rdma_dict.get(event["device"], event["device"])
+
+            if (link_flap_time - uptime_date).total_seconds() > self.flap_startup_wait_time:
+                if mlx_interface not in link_dict:
+                    link_dict[mlx_interface] = {
+                        "last_flap_time": link_flap_time,
+                        "flap_count": 1,
+                    }
+                else:
+                    link_dict[mlx_interface]["flap_count"] += 1
+                    link_dict[mlx_interface]["last_flap_time"] = link_flap_time
 
         return link_dict
 
@@ -297,6 +280,22 @@ class MlxlinkInfo:
     def get_date_stamp(self):
         return self.date_stamp
 
+    # Per-port columns stored in the result database, each with the Status of its port
+    RESULT_METRICS = ["EffPhyErrs", "EffPhyBER", "RawPhyBER", "RawPhyErrStdev", "flap_count"] + [f"FecBin{i}" for i in range(16)]
+
+    def store_results(self, df):
+        rows = []
+        for row in df.to_dict("records"):
+            if row.get("mlx5_") in (None, "None"):
+                continue
+            status = str(row.get("Status", "Passed"))
+            for metric in self.RESULT_METRICS:
+                if metric in row:
+                    rows.append(make_result("mlxlink", metric, row[metric], status, component=row["mlx5_"],
+                                            host_serial=row.get("HostSerial"), hostname=row.get("hostname"),
+                                            detail=status if status != "Passed" else None))
+        record(rows, self.args.results_db)
+
     def check_mlxlink_info(self, df):
         # Normalize dtypes for numeric comparisons
         try:
@@ -828,6 +827,7 @@ class MlxlinkInfo:
             df = self.read_json_files()
 
         df = self.check_mlxlink_info(df)
+        self.store_results(df)
 
         df = df.sort_values(
             by=["hostname", "mlx5_"],
@@ -1300,6 +1300,11 @@ if __name__ == "__main__":
         type=str,
         help="Path to a previous failed_links_*.csv to compare against",
     )
+    parser.add_argument(
+        "--results_db",
+        default=DEFAULT_DB,
+        help="Result database to add the per-port results to, empty to disable (default: %(default)s)",
+    )
     parser.add_argument(
         "--recent-flap-hours",
         type=int,
@@ -1320,6 +1325,7 @@ if __name__ == "__main__":
 
     df = mlxlink_info.gather_mlxlink_info()
     df = mlxlink_info.check_mlxlink_info(df)
+    mlxlink_info.store_results(df)
 
     df.sort_values(by=["hostname", "mlx5_"])
 
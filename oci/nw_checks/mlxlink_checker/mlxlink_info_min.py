@@ -9,6 +9,9 @@ import argparse
 from datetime import datetime
 import urllib.request
 import urllib.error
+from nic_counters import EthtoolStatsReader, read_ib_port_counters
+from rdma_topology import get_rdma_topology, netdev_to_ibdev, pci_to_ibdev
+from kernel_log_scanner import KernelLogScanner
 
 flap_duration_threshold = 86400
 flap_startup_wait_time = 1800
@@ -22,7 +25,12 @@ parser.add_argument(
 parser.add_argument(
     "--debug",
     action="store_true",
-    help="Enable debug output for mst parsing and rdma link parsing",
+    help="Enable debug output for RDMA topology discovery",
+)
+parser.add_argument(
+    "--counters",
+    type=str,
+    help="Comma separated allowlist of ethtool/IB port counters to collect (default: all non per-queue counters)",
 )
 args = parser.parse_args()
 
@@ -91,114 +99,63 @@ except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError, ValueError,
 data["instance_id"] = instance_id
 dprint(f"[DEBUG] Instance ID: {instance_id}")
 
-# RDMA link info
-cmd = "rdma link"
-dprint(f"[DEBUG] Running: {cmd}")
-output = subprocess.run(
-    cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
-)
-if output.returncode != 0:
+# RDMA link info from sysfs (replaces parsing `rdma link`)
+topology = get_rdma_topology()
+if not topology:
     print("Error getting rdma info")
     sys.exit(1)
 
-dprint("[DEBUG] rdma link output:")
 if args.debug:
-    print(output.stdout)
-
-# Regex selection for rdma link
-if args.IB:
-    rdma_link_pat = re.compile(
-        r"""^link\s+
-            (?P<iface>mlx5_\d+/\d+)
-            (?:\s+subnet_prefix\s+(?P<subnet_prefix>[0-9A-Fa-f:]+)
-                \s+lid\s+(?P<lid>\d+)
-                \s+sm_lid\s+(?P<sm_lid>\d+)
-                \s+lmc\s+(?P<lmc>\d+)
-            )?
-            \s+state\s+(?P<state>\w+)
-            \s+physical_state\s+(?P<physical_state>\w+)
-            (?:\s+netdev\s+(?P<netdev>\S+))?
-            \s*$""",
-        re.X,
-    )
-    dprint("[DEBUG] Using IB rdma_link pattern")
-else:
-    rdma_link_pat = re.compile(
-        r"(mlx5_\d+)/\d+:? state (\w+) physical_state (\w+) netdev (\w+)"
-    )
-    dprint("[DEBUG] Using non-IB rdma_link pattern")
-
-rdma_dict = {}
-for line in output.stdout.splitlines():
-    if args.debug:
-        print(f"[DEBUG] rdma line: {line!r}")
-    m = rdma_link_pat.search(line)
-    if not m:
-        continue
+    print("[DEBUG] RDMA topology:")
+    print(json.dumps(topology, indent=4))
 
-    if args.IB:
-        iface = m.group("iface")
-        iface = iface.split("/")[0]
-        netdev = m.group("netdev")
-        lid = m.group("lid")
-        key = netdev if netdev else (f"lid_{lid}" if lid else None)
-        dprint(f"[DEBUG] rdma match IB: iface={iface}, netdev={netdev}, lid={lid}, key={key}")
-        if key:
-            rdma_dict[key] = iface
-    else:
-        iface = m.group(1)
-        netdev = m.group(4)
-        dprint(f"[DEBUG] rdma match non-IB: iface={iface}, netdev={netdev}")
-        rdma_dict[netdev] = iface
+# With --IB, ports without a netdev are keyed as lid_<lid>
+rdma_dict = netdev_to_ibdev(topology, ib=args.IB)
 
 print("=== RDMA LINK MAP ===")
 for k, v in rdma_dict.items():
     print(f"{k} -> {v}")
 data["rdma_link"] = rdma_dict
+data["rdma_topology"] = topology
 
-# Detect link flaps from dmesg
+# Detect link flaps from the incremental kernel log index (only new dmesg records are parsed)
 link_dict = {}
-cmd = "dmesg -T | grep -E 'mlx5_'"
-dprint(f"[DEBUG] Running: {cmd}")
-output = subprocess.run(
-    cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
-)
-for line in output.stdout.splitlines():
-    if "mlx5_" in line and "link down" in line.lower():
-        dprint(f"[DEBUG] dmesg link-down line: {line!r}")
-        dmesg_pat = re.compile(
-            r"\[(\w{3} \w{3}\s+\d{1,2} \d{2}:\d{2}:\d{2} \d{4})\].*?\b(\S+): Link (\w+)"
-        )
-        m = dmesg_pat.search(line)
-        if not m:
-            dprint("[DEBUG] dmesg pattern did not match this line")
-            continue
+try:
+    scanner = KernelLogScanner()
+    new_events = scanner.scan()
+    dprint(f"[DEBUG] Kernel log scan: {len(new_events)} new events, state in {scanner.state_dir}")
+    flap_events = scanner.events(
+        types=["link_down"],
+        source="kmsg",
+        since=datetime.now().timestamp() - flap_duration_threshold,
+        current_boot=True,
+    )
+except OSError as e:
+    print(f"Error scanning kernel log for link flaps: {e}")
+    flap_events = []
 
-        link_flap_time = datetime.strptime(m.group(1), "%a %b %d %H:%M:%S %Y")
-        netdev_name = m.group(2)
-        link_status = m.group(3)
-        dprint(
-            f"[DEBUG] Parsed dmesg: time={link_flap_time}, netdev={netdev_name}, status={link_status}"
-        )
+for event in flap_events:
+    link_flap_time = datetime.fromtimestamp(event["time"]).replace(microsecond=0)
+    netdev_name = event["device"]
+    dprint(f"[DEBUG] Link down event: time={link_flap_time}, netdev={netdev_name}")
 
-        if netdev_name not in rdma_dict:
-            dprint(f"[DEBUG] netdev {netdev_name} not in rdma_dict, skipping")
-            continue
+    if netdev_name not in rdma_dict:
+        dprint(f"[DEBUG] netdev {netdev_name} not in rdma_dict, skipping")
+        continue
 
-        mlx_interface = rdma_dict[netdev_name]
+    mlx_interface = rdma_dict[netdev_name]
 
-        if (datetime.now() - link_flap_time).total_seconds() < flap_duration_threshold:
-            if (link_flap_time - uptime_date).total_seconds() > flap_startup_wait_time:
-                if mlx_interface not in link_dict:
-                    link_dict[mlx_interface] = {
-                        "last_flap_time": link_flap_time.strftime("%Y-%m-%d %H:%M:%S"),
-                        "flap_count": 1,
-                    }
-                else:
-                    link_dict[mlx_interface]["flap_count"] += 1
-                    link_dict[mlx_interface]["last_flap_time"] = link_flap_time.strftime(
-                        "%Y-%m-%d %H:%M:%S"
-                    )
+    if (link_flap_time - uptime_date).total_seconds() > flap_startup_wait_time:
+        if mlx_interface not in link_dict:
+            link_dict[mlx_interface] = {
+                "last_flap_time": link_flap_time.strftime("%Y-%m-%d %H:%M:%S"),
+                "flap_count": 1,
+            }
+        else:
+            link_dict[mlx_interface]["flap_count"] += 1
+            link_dict[mlx_interface]["last_flap_time"] = link_flap_time.strftime(
+                "%Y-%m-%d %H:%M:%S"
+            )
 
 data["link_flaps"] = link_dict
 
@@ -211,53 +168,8 @@ output = subprocess.run(
 data["serial_number"] = output.stdout.strip()
 dprint(f"[DEBUG] Serial number: {data['serial_number']!r}")
 
-# MST status
-mst_cmd = "mst status -v"
-dprint(f"[DEBUG] Running: {mst_cmd}")
-mst_output = subprocess.run(
-    mst_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
-)
-
-if args.debug:
-    print("=== RAW MST STATUS -V OUTPUT ===")
-    print(mst_output.stdout)
-
-mst_dict = {}
-
-# Robust line-based parsing:
-#  - find mlx5_N on the line
-#  - to the left of it, find nearest PCI-like token:
-#      0c:00.0 or 0000:03:00.0
-pci_pattern = re.compile(r"(?:[0-9A-Fa-f]{4}:)?[0-9A-Fa-f]{2}:[0-9A-Fa-f]{2}\.[0-7]")
-rdma_pattern = re.compile(r"mlx5_\d+")
-
-for line in mst_output.stdout.splitlines():
-    if args.debug:
-        print(f"[DEBUG] MST line: {line!r}")
-
-    if "mlx5_" not in line:
-        dprint("[DEBUG]   -> no mlx5_ in line, skip")
-        continue
-
-    rdma_match = rdma_pattern.search(line)
-    if not rdma_match:
-        dprint("[DEBUG]   -> rdma_pattern did not match, skip")
-        continue
-    rdma = rdma_match.group(0)
-    dprint(f"[DEBUG]   -> rdma_match: {rdma!r} at [{rdma_match.start()}:{rdma_match.end()}]")
-
-    left_text = line[:rdma_match.start()]
-    pci_match = None
-    for m in pci_pattern.finditer(left_text):
-        pci_match = m
-    if not pci_match:
-        dprint("[DEBUG]   -> no PCI match to the left of rdma, skip")
-        continue
-
-    pci = pci_match.group(0)
-    dprint(f"[DEBUG]   -> pci_match: {pci!r} at [{pci_match.start()}:{pci_match.end()}]")
-
-    mst_dict[pci] = rdma
+# PCI -> mlx5 map of the physical functions (replaces parsing `mst status -v`)
+mst_dict = pci_to_ibdev(topology)
 
 print("=== MST STATUS MAP ===")
 for k, v in mst_dict.items():
@@ -282,29 +194,23 @@ for key in mst_dict:
         print(f"Error decoding json: {e}")
         print(f"Output: {output.stdout}")
 
-# ETHTOOL stats: skip IB lid_* entries
+# ETHTOOL stats: read through the SIOCETHTOOL ioctl, IB lid_* entries from sysfs port counters
 print("=== ETHTOOL COLLECTION ===")
-for netdev in rdma_dict:
-    print(f"Key: {netdev}, Value: {rdma_dict[netdev]}")
-    if netdev.startswith("lid_"):
-        print(f"Skipping ethtool for {netdev} (IB LID entry)")
-        continue
-    cmd = f"ethtool -S {netdev}"
-    dprint(f"[DEBUG] Running: {cmd}")
-    output = subprocess.run(
-        cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
-    )
-    if output.returncode != 0:
-        print(f"cmd: {cmd}, returncode: {output.returncode}")
-        print("Error getting ethtool info")
-        continue
-    ethtool_dict = {}
-    for line in output.stdout.splitlines():
-        if ":" in line:
-            k, v = line.split(":", 1)
-            if not re.match(r"^(tx[0-9]+_|rx[0-9]+_|ch[0-9]+_)", k.strip()):
-                ethtool_dict[k.strip()] = v.strip()
-    data[netdev] = ethtool_dict
+counter_allowlist = args.counters.split(",") if args.counters else None
+with EthtoolStatsReader(allowlist=counter_allowlist) as ethtool_reader:
+    for netdev in rdma_dict:
+        print(f"Key: {netdev}, Value: {rdma_dict[netdev]}")
+        try:
+            if netdev.startswith("lid_"):
+                dprint(f"[DEBUG] Reading IB port counters for {rdma_dict[netdev]} ({netdev})")
+                counters = read_ib_port_counters(rdma_dict[netdev], allowlist=counter_allowlist)
+            else:
+                dprint(f"[DEBUG] Reading ethtool stats for {netdev}")
+                counters = ethtool_reader.read(netdev)
+        except OSError as e:
+            print(f"Error getting ethtool info for {netdev}: {e}")
+            continue
+        data[netdev] = {k: str(v) for k, v in counters.items()}
 
 # Output JSON
 current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
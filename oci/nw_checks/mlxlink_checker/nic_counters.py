@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+# Read NIC counters without forking ethtool/perfquery for every device.
+#
+# Driver statistics (what `ethtool -S` prints) are read with the SIOCETHTOOL
+# ioctl, generic netdev statistics from /sys/class/net/<netdev>/statistics and
+# RDMA port counters from /sys/class/infiniband/<dev>/ports/<port>/{counters,hw_counters}.
+# All readers accept an allowlist so only the counters of interest are returned.
+
+import array
+import fcntl
+import os
+import re
+import socket
+import struct
+import sys
+
+SIOCETHTOOL = 0x8946
+ETHTOOL_GDRVINFO = 0x00000003
+ETHTOOL_GSTRINGS = 0x0000001b
+ETHTOOL_GSTATS = 0x0000001d
+ETH_SS_STATS = 1
+ETH_GSTRING_LEN = 32
+IFNAMSIZ = 16
+
+# struct ethtool_drvinfo: cmd + 5 x char[32] + reserved2[12] + n_priv_flags, then n_stats
+DRVINFO_SIZE = 196
+DRVINFO_N_STATS_OFFSET = 4 + 5 * 32 + 12 + 4
+
+# Per-queue/per-channel counters that `mlxlink_info_min.py` has always dropped
+PER_QUEUE_PATTERN = re.compile(r"^(tx[0-9]+_|rx[0-9]+_|ch[0-9]+_)")
+
+SYSFS_NET = "/sys/class/net"
+SYSFS_IB = "/sys/class/infiniband"
+
+
+def _ethtool_ioctl(sock, netdev, buf):
+    addr, _ = buf.buffer_info()
+    ifreq = struct.pack(f"{IFNAMSIZ}sP", netdev.encode(), addr)
+    ifreq += b"\x00" * (40 - len(ifreq))
+    fcntl.ioctl(sock.fileno(), SIOCETHTOOL, ifreq)
+
+
+class EthtoolStatsReader:
+    """
+    Read `ethtool -S` style driver statistics through the SIOCETHTOOL ioctl.
+
+    The stat names of a device never change while the driver is loaded, so they
+    are fetched once per netdev and the positions of the allowed counters are
+    cached. Each subsequent read is a single GSTATS ioctl, which makes
+    high-frequency sampling cheap.
+    """
+
+    def __init__(self, allowlist=None, exclude=PER_QUEUE_PATTERN):
+        self.allowlist = set(allowlist) if allowlist else None
+        self.exclude = exclude
+        self._layout = {}
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _n_stats(self, netdev):
+        buf = array.array("B", struct.pack("I", ETHTOOL_GDRVINFO) + b"\x00" * (DRVINFO_SIZE - 4))
+        _ethtool_ioctl(self._sock, netdev, buf)
+        return struct.unpack_from("I", buf, DRVINFO_N_STATS_OFFSET)[0]
+
+    def _stat_names(self, netdev, n_stats):
+        buf = array.array(
+            "B",
+            struct.pack("III", ETHTOOL_GSTRINGS, ETH_SS_STATS, n_stats) + b"\x00" * (n_stats * ETH_GSTRING_LEN),
+        )
+        _ethtool_ioctl(self._sock, netdev, buf)
+        count = struct.unpack_from("I", buf, 8)[0]
+        raw = buf.tobytes()[12:12 + count * ETH_GSTRING_LEN]
+        return [
+            raw[i * ETH_GSTRING_LEN:(i + 1) * ETH_GSTRING_LEN].split(b"\x00", 1)[0].decode()
+            for i in range(count)
+        ]
+
+    def _wanted(self, name):
+        if self.allowlist is not None:
+            return name in self.allowlist
+        return not (self.exclude and self.exclude.match(name))
+
+    def _get_layout(self, netdev):
+        n_stats = self._n_stats(netdev)
+        layout = self._layout.get(netdev)
+        if layout is None or layout[0] != n_stats:
+            names = self._stat_names(netdev, n_stats)
+            selected = [(i, name) for i, name in enumerate(names) if self._wanted(name)]
+            layout = (n_stats, selected)
+            self._layout[netdev] = layout
+        return layout
+
+    def read(self, netdev):
+        """Return {counter_name: int} for the allowed driver counters of netdev."""
+        n_stats, selected = self._get_layout(netdev)
+        buf = array.array("B", struct.pack("II", ETHTOOL_GSTATS, n_stats) + b"\x00" * (n_stats * 8))
+        _ethtool_ioctl(self._sock, netdev, buf)
+        values = struct.unpack_from(f"{n_stats}Q", buf, 8)
+        return {name: values[i] for i, name in selected}
+
+
+def read_ethtool_stats(netdev, allowlist=None):
+    """One-shot helper around EthtoolStatsReader."""
+    with EthtoolStatsReader(allowlist=allowlist) as reader:
+        return reader.read(netdev)
+
+
+def _read_counter_dir(path, allowlist=None):
+    counters = {}
+    try:
+        names = os.listdir(path) if allowlist is None else allowlist
+    except FileNotFoundError:
+        return counters
+    for name in names:
+        try:
+            with open(os.path.join(path, name), "r") as f:
+                counters[name] = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+    return counters
+
+
+def read_net_statistics(netdev, allowlist=None, sysfs_net=SYSFS_NET):
+    """Generic netdev counters from /sys/class/net/<netdev>/statistics."""
+    return _read_counter_dir(os.path.join(sysfs_net, netdev, "statistics"), allowlist)
+
+
+def read_ib_port_counters(ibdev, port=1, allowlist=None, sysfs_ib=SYSFS_IB):
+    """
+    RDMA port counters from /sys/class/infiniband/<ibdev>/ports/<port>.
+
+    Both the standard `counters` and the driver `hw_counters` directories are
+    read; hw_counters win on a name clash since they are the mlx5 extended set.
+    """
+    port_dir = os.path.join(sysfs_ib, ibdev, "ports", str(port))
+    counters = _read_counter_dir(os.path.join(port_dir, "counters"), allowlist)
+    counters.update(_read_counter_dir(os.path.join(port_dir, "hw_counters"), allowlist))
+    return counters
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Dump NIC counters without forking ethtool")
+    parser.add_argument("netdevs", nargs="+", help="netdev names (ethtool/net stats) or ibdev[/port] names with --ib")
+    parser.add_argument("--counters", type=str, help="comma separated allowlist of counter names")
+    parser.add_argument("--ib", action="store_true", help="read /sys/class/infiniband port counters instead")
+    parser.add_argument("--sysfs", action="store_true", help="read /sys/class/net/<netdev>/statistics instead of ethtool stats")
+    args = parser.parse_args()
+
+    allowlist = args.counters.split(",") if args.counters else None
+    out = {}
+    with EthtoolStatsReader(allowlist=allowlist) as reader:
+        for dev in args.netdevs:
+            try:
+                if args.ib:
+                    ibdev, _, port = dev.partition("/")
+                    out[dev] = read_ib_port_counters(ibdev, port or 1, allowlist)
+                elif args.sysfs:
+                    out[dev] = read_net_statistics(dev, allowlist)
+                else:
+                    out[dev] = reader.read(dev)
+            except OSError as e:
+                print(f"Error reading counters for {dev}: {e}", file=sys.stderr)
+    json.dump(out, sys.stdout, indent=4)
+    sys.stdout.write("\n")
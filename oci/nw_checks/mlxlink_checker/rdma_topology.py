@@ -0,0 +1 @@
+../../h100_health_checks/rdma_topology.py
\ No newline at end of file
@@ -18,6 +18,10 @@ logging.config.fileConfig('logging.conf')
 # create logger
 logger = logging.getLogger('simpleExample')
 
+# Modules mlxlink_info.py and mlxlink_info_min.py import on the remote host.
+# Some are symlinks to ../../h100_health_checks, scp copies the files they point to
+SUPPORT_FILES = ["nic_counters.py", "rdma_topology.py", "kernel_log_scanner.py", "result_store.py"]
+
 class run_mlxlink_info:
     def __init__(self, args):
         self.status_df = pd.DataFrame()
@@ -92,8 +96,9 @@ class run_mlxlink_info:
             return {'host': host, 'cmd': ['setup_python_on_host'], 'status': 'Pass', 'output': output.stdout}
     
     def distribute_file_to_host(self, host):
-        logging.debug(f'Distributing {self.exe_file} to {host}')
-        cmd = f'scp -P {self.port} {self.exe_file} {self.user}@{host}:{self.script_directory}'
+        files = " ".join([self.exe_file] + SUPPORT_FILES)
+        logging.debug(f'Distributing {files} to {host}')
+        cmd = f'scp -P {self.port} {files} {self.user}@{host}:{self.script_directory}'
         logging.debug(cmd)
         output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
         if output.returncode != 0:
@@ -2,36 +2,33 @@
 
 import subprocess
 import logging
+from gpu_telemetry import get_gpu_count, get_nvlink_status
 
 logging.basicConfig(level=logging.DEBUG)
 
 def check_nvlink_status():
     # Check if nvlink is enabled
-    num_gpus = int(subprocess.check_output(['nvidia-smi', '--list-gpus']).count(b'\n'))
+    num_gpus = get_gpu_count()
 
+    # One nvidia-smi call for the link state of every GPU
     try:
-        nvlink_status = subprocess.check_output(['nvidia-smi', 'nvlink', '--status'], universal_newlines=True)
+        nvlink_status = get_nvlink_status()
     except subprocess.CalledProcessError as e:
         logging.error(f"Failed to get NVLINK status with error code {e.returncode}")
         return
 
-    if not nvlink_status:
+    if not any(nvlink_status.values()):
         logging.info("NVLINK is not enabled")
         return
 
-    for i in range(num_gpus):
-        gpu_id = i
-        # Run nvlink command
-        try:
-            nvlink_output = subprocess.check_output(['nvidia-smi', 'nvlink', '-s', '-i', str(gpu_id)], universal_newlines=True)
-        except subprocess.CalledProcessError as e:
-            logging.error(f"Failed to get NVLINK status with error code {e.returncode}")
-            return
+    for gpu_id in range(num_gpus):
+        links = nvlink_status.get(gpu_id, {})
 
         # Check for inactive links
-        if "inactive" in nvlink_output:
+        inactive = [link for link, state in links.items() if state == "inactive"]
+        if inactive:
             # Extract and display the information about inactive links
-            inactive_links = "\n".join([line.replace("<inactive>", "Inactive") for line in nvlink_output.split("\n") if "Link" in line and "<inactive>" in line])
+            inactive_links = "\n".join([f"Link {link}: Inactive" for link in inactive])
             logging.error(f"GPU {gpu_id} has nvlinks inactive: {inactive_links}")
         else:
             logging.debug(f"GPU {gpu_id} has all nvlinks active.")
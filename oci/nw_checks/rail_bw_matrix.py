@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+# Host x rail bandwidth matrix with ib_write_bw.
+#
+# The bandwidth counterpart of rail_latency_matrix.py. For every test an
+# ib_write_bw server is started on the first host and a client on the second,
+# both over ssh. Tests of one round share no (host, device) port and run at
+# the same time; every server in a round listens on its own TCP port. The
+# per-size table of the client is parsed and the peak average bandwidth of
+# every rail is compared against the line rate of the shape.
+
+import argparse
+import datetime
+import logging
+import re
+import shlex
+import subprocess
+import time
+
+import rail_matrix
+
+BASE_PORT = 18515
+
+# " 65536      5000           196.45             196.40               0.374620"
+BW_ROW_PATTERN = re.compile(r"^\s*(\d+)\s+(\d+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s*$", flags=re.MULTILINE)
+
+
+def parse_ib_write_bw(output):
+    """{size: {"peak", "average", "msg_rate"}} from an ib_write_bw -a --report_gbits table."""
+    table = {}
+    for m in BW_ROW_PATTERN.finditer(output):
+        table[int(m.group(1))] = {"peak": float(m.group(3)), "average": float(m.group(4)), "msg_rate": float(m.group(5))}
+    return table
+
+
+class BandwidthMatrix:
+    def __init__(self, shape, ssh="ssh", gid_index=None, min_fraction=0.9, line_rate=None, timeout=120, retries=3):
+        self.shape = shape
+        self.ssh = ssh
+        self.gid_index = gid_index
+        self.min_fraction = min_fraction
+        self.line_rate = line_rate if line_rate is not None else shape["line_rate"]
+        self.timeout = timeout
+        self.retries = retries
+
+    def ib_write_bw(self, device, port, timeout, server=None):
+        cmd = f"ib_write_bw -a -F --report_gbits -d mlx5_{device} -p {port}"
+        if self.gid_index is not None:
+            cmd += f" -x {self.gid_index}"
+        # The remote side is bounded by timeout(1), so a lost ssh connection can
+        # not leave ib_write_bw holding the device and port for the next round
+        cmd = f"timeout -k 5 {timeout} numactl -N {rail_matrix.numa_node(self.shape, device)} {cmd}"
+        if server:
+            cmd += f" {server}"
+        return cmd
+
+    def run_test(self, test):
+        port = BASE_PORT + test["slot"]
+        # The server has to outlive every client attempt
+        server_timeout = sum(1 + attempt + self.timeout for attempt in range(self.retries))
+        # -tt gives the server a terminal, so killing the local ssh hangs up the
+        # remote ib_write_bw instead of leaving it listening
+        server_cmd = shlex.split(self.ssh) + ["-tt", test["host_a"], self.ib_write_bw(test["dev_a"], port, server_timeout)]
+        client_cmd = shlex.split(self.ssh) + [test["host_b"], self.ib_write_bw(test["dev_b"], port, self.timeout, server=test["host_a"])]
+        test.update({"port": port, "peak_bw": None, "peak_size": None, "status": "Failed", "error": ""})
+        logging.debug(" ".join(server_cmd))
+        server = subprocess.Popen(server_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                  universal_newlines=True)
+        try:
+            # The client fails to connect until the server listens, so retry
+            # instead of sleeping a fixed time first
+            for attempt in range(self.retries):
+                time.sleep(1 + attempt)
+                logging.debug(" ".join(client_cmd))
+                try:
+                    p = subprocess.run(client_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       universal_newlines=True, timeout=self.timeout + 10)
+                except subprocess.TimeoutExpired:
+                    test["error"] = f"timed out after {self.timeout}s"
+                    return test
+                table = parse_ib_write_bw(p.stdout)
+                if p.returncode == 0 and table:
+                    break
+                test["error"] = (p.stderr.strip() or p.stdout.strip())[-500:] or f"exit status {p.returncode}"
+                if server.poll() is not None:
+                    test["error"] = f"server exited: {server.stdout.read().strip()[-500:]}"
+                    return test
+            else:
+                return test
+        finally:
+            if server.poll() is None:
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+                    server.wait()
+
+        size, row = max(table.items(), key=lambda kv: kv[1]["average"])
+        test.update({"peak_bw": row["average"], "peak_size": size, "error": "",
+                     "line_rate_pct": round(row["average"] / self.line_rate * 100, 1),
+                     "bw_by_size": {s: r["average"] for s, r in table.items()}})
+        test["status"] = "Passed" if not self.is_bad(test) else "Failed"
+        return test
+
+    def is_bad(self, result):
+        return result["peak_bw"] is None or result["peak_bw"] < self.min_fraction * self.line_rate
+
+
+def assign_slots(rounds):
+    # Servers of one round on the same host need distinct TCP ports
+    for round_tests in rounds:
+        slots = {}
+        for test in round_tests:
+            test["slot"] = slots.get(test["host_a"], 0)
+            slots[test["host_a"]] = test["slot"] + 1
+    return rounds
+
+
+def main(args):
+    shape = rail_matrix.get_shape(args.shape)
+    hosts = args.hosts or rail_matrix.read_hostfile(args.hostfile)
+    pairs = rail_matrix.host_pairs(hosts, args.pairs)
+    if not pairs:
+        logging.error("Need at least two hosts")
+        return []
+    bm = BandwidthMatrix(shape, args.ssh, args.gid_index, args.min_fraction, args.line_rate, args.timeout)
+    rounds = assign_slots(rail_matrix.schedule_rounds(rail_matrix.rail_tests(shape, pairs)))
+    logging.info(f"Shape: {args.shape}, {len(hosts)} hosts, {len(pairs)} host pairs, "
+                 f"{sum(len(r) for r in rounds)} tests in {len(rounds)} rounds")
+
+    results = rail_matrix.run_rounds(rounds, bm.run_test, args.max_workers, logging)
+
+    devices = rail_matrix.shape_devices(shape)
+    matrix = rail_matrix.host_rail_matrix(results, "peak_bw", best=max)
+    cutoff = bm.min_fraction * bm.line_rate
+    print(f"Best peak bandwidth (Gb/s) per host and rail across partners, * < {cutoff:g} ({bm.min_fraction:.0%} of {bm.line_rate} Gb/s)")
+    print(rail_matrix.format_matrix(matrix, devices, lambda v: v < cutoff, fmt="{:.1f}"))
+
+    for result in sorted(results, key=lambda r: (r["host_a"], r["dev_a"], r["dev_b"])):
+        if result["status"] != "Passed":
+            value = f"{result['peak_bw']:.1f} Gb/s" if result["peak_bw"] is not None else result["error"]
+            logging.warning(f"{result['host_a']} mlx5_{result['dev_a']} -> {result['host_b']} mlx5_{result['dev_b']}: {value}")
+    for port in rail_matrix.find_bad_ports(results, bm.is_bad):
+        logging.error(f"{port['host']} mlx5_{port['device']}: {port['verdict']}, failed {port['failed']}/{port['tests']} tests")
+
+    rail_matrix.write_results(results, f"rail_bw_{args.date_stamp}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the ib_write_bw bandwidth of every rail between pairs of hosts")
+    parser.add_argument("hosts", nargs="*", help="Hosts to test (default: read --hostfile)")
+    parser.add_argument("--hostfile", default="hostfile.txt", help="File with one host per line (default: %(default)s)")
+    parser.add_argument("--shape", default="H100", help=f"Shape: {', '.join(sorted(rail_matrix.SHAPES) + sorted(rail_matrix.SHAPE_ALIASES))} (default: %(default)s)")
+    parser.add_argument("--pairs", choices=["ring", "pairs", "all"], default="ring", help="Host pairs to test (default: %(default)s)")
+    parser.add_argument("--line_rate", type=float, default=None, help="Expected port line rate in Gb/s (default: the shape's)")
+    parser.add_argument("--min_fraction", type=float, default=0.9, help="Fraction of the line rate a rail must reach (default: %(default)s)")
+    parser.add_argument("--gid_index", type=int, default=None, help="GID index for RoCE (ib_write_bw -x)")
+    parser.add_argument("--ssh", default="ssh", help="Remote shell command (default: %(default)s)")
+    parser.add_argument("--timeout", type=int, default=120, help="Seconds before a test is abandoned (default: %(default)s)")
+    parser.add_argument("--max_workers", type=int, default=64, help="Maximum tests in flight (default: %(default)s)")
+    parser.add_argument("--date_stamp", default=datetime.datetime.now().strftime("%Y%m%d%H%M%S"), help="Date stamp of the output files")
+    parser.add_argument("-l", "--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], default="INFO", help="Set the logging level default: INFO")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format="%(asctime)s - %(levelname)s - %(message)s")
+    main(args)
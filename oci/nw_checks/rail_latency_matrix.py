@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Host x rail latency matrix with osu_latency.
+#
+# Replaces the one-mpirun-at-a-time loops of run_rail_tests.py,
+# h100_latency_check.py and a100_latency_check.py. Host pairs come from a
+# hostfile, every rail of every pair is tested, and all tests that share no
+# (host, device) port run at the same time (see rail_matrix.py).
+#
+# Load HPC-X first (module load hpcx) or pass --hpcx_module.
+
+import argparse
+import datetime
+import logging
+import os
+import re
+import subprocess
+
+import rail_matrix
+
+CMD = ("mpirun -n 1 --host {host_a} -x UCX_NET_DEVICES=mlx5_{dev_a}:1 --map-by node -x LD_LIBRARY_PATH "
+       "numactl -N {numa_a} {osu_path}/osu_latency -m {msg_size}:{msg_size} : "
+       "-n 1 --host {host_b} -x UCX_NET_DEVICES=mlx5_{dev_b}:1 --map-by node -x LD_LIBRARY_PATH "
+       "numactl -N {numa_b} {osu_path}/osu_latency -m {msg_size}:{msg_size}")
+
+
+def load_hpcx(modulefile, modules_init="/usr/share/modules/init/python.py"):
+    if not os.path.exists(modules_init):
+        modules_init = "/usr/share/Modules/init/python.py"
+    env = {}
+    exec(open(modules_init).read(), env)
+    env["module"]("purge")
+    env["module"]("load", modulefile)
+
+
+class LatencyMatrix:
+    def __init__(self, shape, osu_path, msg_size=8, timeout=120, lat_cutoff=None):
+        self.shape = shape
+        self.osu_path = osu_path
+        self.msg_size = msg_size
+        self.timeout = timeout
+        self.lat_cutoff = lat_cutoff if lat_cutoff is not None else shape["lat_cutoff"]
+        self.pattern = re.compile(rf"^{msg_size}\s+([\d.]+)", flags=re.MULTILINE)
+
+    def get_command(self, test):
+        return CMD.format(osu_path=self.osu_path, msg_size=self.msg_size,
+                          numa_a=rail_matrix.numa_node(self.shape, test["dev_a"]),
+                          numa_b=rail_matrix.numa_node(self.shape, test["dev_b"]), **test)
+
+    def run_test(self, test):
+        cmd = self.get_command(test)
+        logging.debug(cmd)
+        test.update({"latency": None, "status": "Failed", "error": ""})
+        try:
+            p = subprocess.run(cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            test["error"] = f"timed out after {self.timeout}s"
+            return test
+        result = self.pattern.search(p.stdout)
+        if p.returncode != 0 or not result:
+            test["error"] = p.stderr.strip()[-500:] or f"exit status {p.returncode}"
+            return test
+        test["latency"] = float(result.group(1))
+        test["status"] = "Passed" if test["latency"] <= self.lat_cutoff else "Failed"
+        return test
+
+    def is_bad(self, result):
+        return result["latency"] is None or result["latency"] > self.lat_cutoff
+
+
+def main(args):
+    shape = rail_matrix.get_shape(args.shape)
+    if args.hpcx_module:
+        load_hpcx(args.hpcx_module)
+    osu_path = args.osu_path or os.environ.get("HPCX_OSU_CUDA_DIR")
+    if not osu_path:
+        logging.error("osu_latency not found: load HPC-X, or pass --osu_path or --hpcx_module")
+        return []
+
+    hosts = args.hosts or rail_matrix.read_hostfile(args.hostfile)
+    pairs = rail_matrix.host_pairs(hosts, args.pairs)
+    if not pairs:
+        logging.error("Need at least two hosts")
+        return []
+    lm = LatencyMatrix(shape, osu_path, args.msg_size, args.timeout, args.lat_cutoff)
+    rounds = rail_matrix.schedule_rounds(rail_matrix.rail_tests(shape, pairs))
+    logging.info(f"Shape: {args.shape}, {len(hosts)} hosts, {len(pairs)} host pairs, "
+                 f"{sum(len(r) for r in rounds)} tests in {len(rounds)} rounds")
+
+    results = rail_matrix.run_rounds(rounds, lm.run_test, args.max_workers, logging)
+
+    devices = rail_matrix.shape_devices(shape)
+    matrix = rail_matrix.host_rail_matrix(results, "latency", best=min)
+    print(f"Best {args.msg_size} byte latency (us) per host and rail across partners, * > {lm.lat_cutoff}")
+    print(rail_matrix.format_matrix(matrix, devices, lambda v: v > lm.lat_cutoff))
+
+    for result in sorted(results, key=lambda r: (r["host_a"], r["dev_a"], r["dev_b"])):
+        if result["status"] != "Passed":
+            value = f"{result['latency']:.2f} us" if result["latency"] is not None else result["error"]
+            logging.warning(f"{result['host_a']} mlx5_{result['dev_a']} -> {result['host_b']} mlx5_{result['dev_b']}: {value}")
+    for port in rail_matrix.find_bad_ports(results, lm.is_bad):
+        logging.error(f"{port['host']} mlx5_{port['device']}: {port['verdict']}, failed {port['failed']}/{port['tests']} tests")
+
+    rail_matrix.write_results(results, f"rail_latency_{args.date_stamp}")
+    return results
+
+
+def get_parser(shape="H100"):
+    parser = argparse.ArgumentParser(description="Measure the latency of every rail between pairs of hosts")
+    parser.add_argument("hosts", nargs="*", help="Hosts to test (default: read --hostfile)")
+    parser.add_argument("--hostfile", default="hostfile.txt", help="File with one host per line (default: %(default)s)")
+    parser.add_argument("--shape", default=shape, help=f"Shape: {', '.join(sorted(rail_matrix.SHAPES) + sorted(rail_matrix.SHAPE_ALIASES))} (default: %(default)s)")
+    parser.add_argument("--pairs", choices=["ring", "pairs", "all"], default="ring", help="Host pairs to test (default: %(default)s)")
+    parser.add_argument("--msg_size", type=int, default=8, help="Message size in bytes (default: %(default)s)")
+    parser.add_argument("--lat_cutoff", type=float, default=None, help="Latency cutoff in us (default: the shape's)")
+    parser.add_argument("--osu_path", default=None, help="Directory with osu_latency (default: $HPCX_OSU_CUDA_DIR)")
+    parser.add_argument("--hpcx_module", default=None, help="HPC-X modulefile to load")
+    parser.add_argument("--timeout", type=int, default=120, help="Seconds before a test is abandoned (default: %(default)s)")
+    parser.add_argument("--max_workers", type=int, default=64, help="Maximum tests in flight (default: %(default)s)")
+    parser.add_argument("--date_stamp", default=datetime.datetime.now().strftime("%Y%m%d%H%M%S"), help="Date stamp of the output files")
+    parser.add_argument("-l", "--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], default="INFO", help="Set the logging level default: INFO")
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    logging.basicConfig(level=args.log_level, format="%(asctime)s - %(levelname)s - %(message)s")
+    main(args)
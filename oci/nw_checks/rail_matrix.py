@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# Shared engine for the per-rail network tests (latency and bandwidth).
+#
+# A test connects one RDMA device on one host with one device on another
+# host. Every test claims the two (host, device) ports it uses and tests are
+# packed first-fit into rounds in which no port is used twice, so a round
+# runs all of its tests at once without two tests sharing a rail end point.
+# With a ring of host pairs and 16 rails that validates a whole cluster in a
+# handful of rounds instead of one mpirun at a time.
+
+import concurrent.futures
+import csv
+import itertools
+import json
+
+# Per shape: the RDMA devices that carry GPU traffic, grouped in the pairs
+# that share a rail (both devices of a pair are tested against each other as
+# well), the NUMA node of each device, the latency cutoff (us) and the port
+# line rate (Gb/s)
+SHAPES = {
+    "H100": {
+        "rail_opt": True,
+        "subnet": "single",
+        "rail_pairs": [[0, 1], [3, 4], [5, 6], [7, 8], [9, 10], [12, 13], [14, 15], [16, 17]],
+        "inter_numa": {"0": [0, 1, 3, 4, 5, 6, 7, 8], "1": [9, 10, 12, 13, 14, 15, 16, 17]},
+        "lat_cutoff": 3.2,
+        "line_rate": 200,
+    },
+    "A100": {
+        "rail_opt": False,
+        "subnet": "multiple",
+        "rail_pairs": [[1], [2], [3], [4], [5], [6], [7], [8], [9], [10], [11], [12], [14], [15], [16], [17]],
+        "inter_numa": {"0": [1, 2], "1": [3, 4], "2": [5, 6], "3": [7, 8], "4": [9, 10], "5": [11, 12], "6": [14, 15], "7": [16, 17]},
+        "lat_cutoff": 3.2,
+        "line_rate": 100,
+    },
+}
+
+# OCI shape names for the entries above
+SHAPE_ALIASES = {
+    "BM.GPU.H100.8": "H100",
+    "BM.GPU4.8": "A100",
+    "BM.GPU.A100-v2.8": "A100",
+}
+
+
+def get_shape(name):
+    name = SHAPE_ALIASES.get(name, name)
+    if name not in SHAPES:
+        raise ValueError(f"Unknown shape {name}, expected one of {sorted(SHAPES) + sorted(SHAPE_ALIASES)}")
+    return SHAPES[name]
+
+
+def read_hostfile(hostfile):
+    with open(hostfile, "r") as f:
+        return [x.split()[0] for x in f.readlines() if x.strip() and not x.startswith("#")]
+
+
+def numa_node(shape, device):
+    for nid, devices in shape["inter_numa"].items():
+        if device in devices:
+            return nid
+    return "0"
+
+
+def shape_devices(shape):
+    return [device for pair in shape["rail_pairs"] for device in pair]
+
+
+def host_pairs(hosts, pattern="ring"):
+    """
+    The host pairs to test:
+      ring  - every host against its neighbour (last wraps to first), so every
+              host is measured with two different partners
+      pairs - consecutive hostfile entries, h0-h1, h2-h3, ...
+      all   - every pair of hosts
+    """
+    if pattern == "pairs":
+        return [(hosts[i], hosts[i + 1]) for i in range(0, len(hosts) - 1, 2)]
+    if pattern == "all":
+        return list(itertools.combinations(hosts, 2))
+    if len(hosts) < 3:
+        return [tuple(hosts)] if len(hosts) == 2 else []
+    return [(hosts[i], hosts[(i + 1) % len(hosts)]) for i in range(len(hosts))]
+
+
+def rail_tests(shape, pairs):
+    """
+    One test per host pair and device combination: every device against the
+    same device on the other host, plus the first device of each rail pair
+    against the second. Each test is {"host_a", "dev_a", "host_b", "dev_b"}.
+    """
+    tests = []
+    for host_a, host_b in pairs:
+        for devices in shape["rail_pairs"]:
+            combos = [(d, d) for d in devices]
+            if len(devices) == 2:
+                combos.append((devices[0], devices[1]))
+            for dev_a, dev_b in combos:
+                tests.append({"host_a": host_a, "dev_a": dev_a, "host_b": host_b, "dev_b": dev_b})
+    return tests
+
+
+def schedule_rounds(tests):
+    """
+    Pack tests first-fit into rounds in which no (host, device) port is used
+    by more than one test.
+    """
+    rounds = []
+    for test in tests:
+        ports = {(test["host_a"], test["dev_a"]), (test["host_b"], test["dev_b"])}
+        for busy, round_tests in rounds:
+            if not busy & ports:
+                busy |= ports
+                round_tests.append(test)
+                break
+        else:
+            rounds.append((set(ports), [test]))
+    return [round_tests for _, round_tests in rounds]
+
+
+def run_rounds(rounds, func, max_workers=64, logger=None):
+    """
+    Run func(test) for every test, the tests of a round concurrently and the
+    rounds one after another. func returns the test dict updated with its
+    result.
+    """
+    results = []
+    for i, round_tests in enumerate(rounds):
+        if logger:
+            logger.info(f"Round {i + 1}/{len(rounds)}: {len(round_tests)} tests")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(func, dict(test, round=i)) for test in round_tests]
+            for future in concurrent.futures.as_completed(futures):
+                results.append(future.result())
+    return results
+
+
+def host_rail_matrix(results, metric, best=min):
+    """
+    {host: {device: value}} from the same-device tests, keeping the best
+    value seen for a host and device across all of its partners: a port that
+    is only slow next to one bad partner still shows up healthy, a port that
+    is slow with every partner does not.
+    """
+    matrix = {}
+    for result in results:
+        if result["dev_a"] != result["dev_b"] or result.get(metric) is None:
+            continue
+        for host in (result["host_a"], result["host_b"]):
+            row = matrix.setdefault(host, {})
+            value = result[metric]
+            row[result["dev_a"]] = value if result["dev_a"] not in row else best(row[result["dev_a"]], value)
+    return matrix
+
+
+def find_bad_ports(results, is_bad):
+    """
+    Attribute failing tests to ports. A (host, device) whose tests failed
+    with every partner is "bad" when that was two or more partner hosts and
+    "suspect" with only one (either end could be at fault).
+    Returns [{"host", "device", "failed", "tests", "verdict"}].
+    """
+    tests = {}
+    failed = {}
+    partners = {}
+    for result in results:
+        bad = is_bad(result)
+        ends = ((result["host_a"], result["dev_a"], result["host_b"]), (result["host_b"], result["dev_b"], result["host_a"]))
+        for host, device, partner in ends:
+            tests[(host, device)] = tests.get((host, device), 0) + 1
+            if bad:
+                failed[(host, device)] = failed.get((host, device), 0) + 1
+                partners.setdefault((host, device), set()).add(partner)
+    ports = []
+    for (host, device), count in sorted(failed.items()):
+        if count < tests[(host, device)]:
+            continue
+        ports.append({"host": host, "device": device, "failed": count, "tests": tests[(host, device)],
+                      "verdict": "bad" if len(partners[(host, device)]) > 1 else "suspect"})
+    return ports
+
+
+def format_matrix(matrix, devices, is_bad, fmt="{:.2f}"):
+    """Plain text host x rail table, values failing is_bad marked with *."""
+    header = ["host"] + [f"mlx5_{d}" for d in devices]
+    rows = []
+    for host in sorted(matrix):
+        row = [host]
+        for d in devices:
+            value = matrix[host].get(d)
+            if value is None:
+                row.append("-")
+            else:
+                row.append(fmt.format(value) + ("*" if is_bad(value) else ""))
+        rows.append(row)
+    widths = [max(len(str(r[i])) for r in [header] + rows) for i in range(len(header))]
+    lines = ["  ".join(str(c).rjust(w) for c, w in zip(r, widths)) for r in [header] + rows]
+    return "\n".join(lines)
+
+
+def write_results(results, prefix):
+    keys = []
+    for result in results:
+        keys.extend(k for k in result if k not in keys)
+    with open(f"{prefix}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=keys)
+        writer.writeheader()
+        writer.writerows(results)
+    with open(f"{prefix}.json", "w") as f:
+        json.dump(results, f, indent=2)
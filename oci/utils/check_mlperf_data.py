@@ -1,63 +1,81 @@
 #!/usr/bin/env python3
+import argparse
+import csv
+import functools
 import json
+import os
 import re
+import statistics
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+COLUMNS = ['filename', 'num_nodes', 'logf', 'learning_rate', 'start_ms', 'stop_ms', 'duration_min']
+
+# Extra columns of the run table with the full MLLOG extraction
+FULL_COLUMNS = COLUMNS + ['status', 'nodelist', 'epochs', 'epoch_s_median', 'samples_per_sec_median',
+                          'eval_accuracy', 'duration_vs_median', 'slow']
+
+# One row per MLLOG event: numeric values in value, any other value as JSON
+# in text, and the metadata fields that place the event in the run as
+# columns of their own
+EVENT_COLUMNS = ['time_ms', 'event_type', 'key', 'value', 'text', 'epoch_num', 'first_epoch_num',
+                 'epoch_count', 'samples_count', 'step', 'status']
+EVENT_METADATA = EVENT_COLUMNS[5:]
+
+TIMELINE_COLUMNS = ['filename', 'num_nodes', 'unit', 'num', 'start_ms', 'stop_ms', 'seconds',
+                    'samples', 'samples_per_sec', 'reported_throughput', 'eval_accuracy']
+
+# "SLURM_JOB_NODELIST=gpu-[1-4]" or "nodelist: gpu-[1-4]" as printed by the run scripts
+NODELIST_PATTERN = re.compile(r'(?:SLURM_JOB_NODELIST|SLURM_NODELIST|nodelist)\s*[=:]\s*(\S+)', re.IGNORECASE)
+
+
+def mllog_json(line: str):
+    """The JSON payload of a :::MLLOG line, None if it does not parse."""
+    try:
+        return json.loads(line.split('MLLOG', 1)[1].strip())
+    except (IndexError, json.JSONDecodeError):
+        return None
+
 
 def process_log_file(log_path: Path):
     """
-    Process a single SLURM log file:
+    Process a single SLURM log file in one streaming pass:
     - Extract MLLOG run_start and run_stop times (time_ms)
     - Extract number_of_nodes from :::SYSJSON line
     - Calculate duration in minutes
     - Pull compliance-invoked log filename and learning rate
+    Reading stops as soon as all of them were found.
     Returns a dict of extracted values or None if entries missing.
     """
-    lines = log_path.read_text().splitlines()
+    start_ms = stop_ms = num_nodes = logf = lr = None
+    found_nodes = found_logf = found_lr = False
 
-    # Extract MLLOG start and stop lines
-    start_line = next((l for l in lines if 'run_start' in l), None)
-    stop_line = next((l for l in lines if 'run_stop' in l), None)
-    if not start_line or not stop_line:
-        return None
+    with open(log_path, errors='replace') as f:
+        for l in f:
+            if start_ms is None and 'run_start' in l and 'MLLOG' in l:
+                start_ms = (mllog_json(l) or {}).get('time_ms', 0)
+            elif stop_ms is None and 'run_stop' in l and 'MLLOG' in l:
+                stop_ms = (mllog_json(l) or {}).get('time_ms', 0)
+            elif not found_nodes and l.startswith(':::SYSJSON'):
+                found_nodes = True
+                try:
+                    data = json.loads(l.split(':::SYSJSON', 1)[1].strip())
+                    num_nodes = int(data.get('number_of_nodes', 0))
+                except (json.JSONDecodeError, ValueError):
+                    num_nodes = None
+            elif not found_logf and 'INFO - Running compliance on file:' in l:
+                found_logf = True
+                # compliance-invoked log filename (basename only)
+                logf = Path(l.split('file:')[-1].strip()).name
+            elif not found_lr and 'opt_base_learning_rate' in l:
+                found_lr = True
+                lr = (mllog_json(l) or {}).get('value')
+            if start_ms is not None and stop_ms is not None and found_nodes and found_logf and found_lr:
+                break
 
-    def extract_time_ms(line: str) -> int:
-        json_part = line.split('MLLOG', 1)[1].strip()
-        return json.loads(json_part).get('time_ms', 0)
-
-    start_ms = extract_time_ms(start_line)
-    stop_ms = extract_time_ms(stop_line)
-    duration_min = (stop_ms - start_ms) / 60000.0
-
-    # number_of_nodes from SYSJSON
-    num_nodes = None
-    for l in lines:
-        if l.startswith(':::SYSJSON'):
-            try:
-                json_part = l.split(':::SYSJSON', 1)[1].strip()
-                data = json.loads(json_part)
-                num_nodes = int(data.get('number_of_nodes', 0))
-            except (json.JSONDecodeError, ValueError):
-                num_nodes = None
-            break
-
-    # compliance-invoked log filename (basename only)
-    logf = None
-    for l in lines:
-        if 'INFO - Running compliance on file:' in l:
-            logf = Path(l.split('file:')[-1].strip()).name
-            break
-
-    # learning rate
-    lr = None
-    for l in lines:
-        if 'opt_base_learning_rate' in l:
-            try:
-                json_part = l.split('MLLOG', 1)[1].strip()
-                lr = json.loads(json_part).get('value')
-            except json.JSONDecodeError:
-                lr = None
-            break
+    if start_ms is None or stop_ms is None:
+        return None
 
     return {
         'filename': log_path.name,
@@ -66,39 +84,261 @@ def process_log_file(log_path: Path):
         'learning_rate': lr,
         'start_ms': start_ms,
         'stop_ms': stop_ms,
-        'duration_min': duration_min,
+        'duration_min': (stop_ms - start_ms) / 60000.0,
+    }
+
+
+def read_mllog(log_path: Path):
+    """
+    Read every :::MLLOG event of a SLURM log in one streaming pass.
+    Returns (events, info): events as {column: [values]} with EVENT_COLUMNS,
+    info with num_nodes, logf and nodelist from the non-MLLOG lines.
+    """
+    events = {c: [] for c in EVENT_COLUMNS}
+    info = {'num_nodes': None, 'logf': None, 'nodelist': None}
+    with open(log_path, errors='replace') as f:
+        for l in f:
+            if ':::MLLOG' in l:
+                event = mllog_json(l)
+                if not event:
+                    continue
+                metadata = event.get('metadata') or {}
+                value = event.get('value')
+                events['time_ms'].append(event.get('time_ms'))
+                events['event_type'].append(event.get('event_type'))
+                events['key'].append(event.get('key'))
+                numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+                events['value'].append(value if numeric else None)
+                events['text'].append(None if numeric or value is None else json.dumps(value))
+                for c in EVENT_METADATA:
+                    events[c].append(metadata.get(c))
+            elif info['num_nodes'] is None and l.startswith(':::SYSJSON'):
+                try:
+                    info['num_nodes'] = int(json.loads(l.split(':::SYSJSON', 1)[1].strip()).get('number_of_nodes', 0))
+                except (json.JSONDecodeError, ValueError):
+                    pass
+            elif info['logf'] is None and 'INFO - Running compliance on file:' in l:
+                info['logf'] = Path(l.split('file:')[-1].strip()).name
+            elif info['nodelist'] is None:
+                m = NODELIST_PATTERN.search(l)
+                if m:
+                    info['nodelist'] = m.group(1)
+    return events, info
+
+
+def first_value(events, key, field='value'):
+    for k, v in zip(events['key'], events[field]):
+        if k == key:
+            return v
+    return None
+
+
+def epoch_timeline(events):
+    """
+    One row per epoch (epoch_start/epoch_stop) and per block
+    (block_start/block_stop) with its time, samples and samples/sec.
+    Samples come from the samples_count metadata of the stop event, else
+    from train_samples times the epochs covered. The throughput events and
+    tracked_stats of the epoch or block are averaged as reported_throughput,
+    the eval_accuracy at its end is added.
+    """
+    train_samples = first_value(events, 'train_samples')
+    starts = {}
+    rows = []
+    throughput = []
+    accuracy = {}
+    for i, key in enumerate(events['key']):
+        value = events['value'][i]
+        if key == 'throughput' and isinstance(value, (int, float)):
+            throughput.append((events['time_ms'][i], value))
+        elif key == 'tracked_stats' and events['text'][i]:
+            stats = json.loads(events['text'][i])
+            if isinstance(stats, dict) and isinstance(stats.get('throughput'), (int, float)):
+                throughput.append((events['time_ms'][i], stats['throughput']))
+        elif key == 'eval_accuracy' and events['epoch_num'][i] is not None:
+            accuracy[events['epoch_num'][i]] = value
+        unit, _, edge = (key or '').partition('_')
+        if unit not in ('epoch', 'block') or edge not in ('start', 'stop'):
+            continue
+        num = events['epoch_num'][i] if unit == 'epoch' else events['first_epoch_num'][i]
+        if edge == 'start':
+            starts[(unit, num)] = i
+            continue
+        if (unit, num) not in starts:
+            continue
+        j = starts.pop((unit, num))
+        start_ms, stop_ms = events['time_ms'][j], events['time_ms'][i]
+        seconds = (stop_ms - start_ms) / 1000.0
+        epoch_count = (events['epoch_count'][i] or events['epoch_count'][j] or 1) if unit == 'block' else 1
+        samples = events['samples_count'][i]
+        if samples is None and train_samples is not None:
+            samples = train_samples * epoch_count
+        rows.append({'unit': unit, 'num': num, 'start_ms': start_ms, 'stop_ms': stop_ms, 'seconds': seconds,
+                     'samples': samples, 'samples_per_sec': samples / seconds if samples and seconds > 0 else None,
+                     'last_epoch': num + epoch_count - 1 if num is not None else None})
+
+    for row in rows:
+        reported = [v for t, v in throughput if row['start_ms'] <= t <= row['stop_ms']]
+        row['reported_throughput'] = statistics.mean(reported) if reported else None
+        row['eval_accuracy'] = accuracy.get(row.pop('last_epoch'))
+    return rows
+
+
+def analyze_log_file(log_path: Path, events_dir=None):
+    """
+    Full MLLOG extraction of one log: the process_log_file() columns plus
+    the run status, nodelist, epoch count, median epoch time and samples/sec
+    and last eval_accuracy, and the epoch timeline. With events_dir the
+    event table is written there as <log>.events.parquet (or .csv without
+    pandas). Returns {"run": {...}, "timeline": [...]} or None.
+    """
+    events, info = read_mllog(log_path)
+    start_ms = first_value(events, 'run_start', 'time_ms')
+    stop_ms = first_value(events, 'run_stop', 'time_ms')
+    if start_ms is None or stop_ms is None:
+        return None
+    if events_dir:
+        write_table(events, os.path.join(events_dir, f"{log_path.name}.events.parquet"), EVENT_COLUMNS, csv_fallback=True)
+
+    timeline = epoch_timeline(events)
+    # Blocks include the epochs they span; report epochs when a run logs both
+    units = [r for r in timeline if r['unit'] == 'epoch'] or timeline
+    # Measured samples/sec, else what the benchmark reported
+    rates = [r['samples_per_sec'] or r['reported_throughput'] for r in units if r['samples_per_sec'] or r['reported_throughput']]
+    accuracy = [r['eval_accuracy'] for r in units if r['eval_accuracy'] is not None]
+    run = {
+        'filename': log_path.name,
+        'num_nodes': info['num_nodes'],
+        'logf': info['logf'],
+        'learning_rate': first_value(events, 'opt_base_learning_rate'),
+        'start_ms': start_ms,
+        'stop_ms': stop_ms,
+        'duration_min': (stop_ms - start_ms) / 60000.0,
+        'status': first_value(events, 'run_stop', 'status'),
+        'nodelist': info['nodelist'],
+        'epochs': len(units),
+        'epoch_s_median': statistics.median(r['seconds'] for r in units) if units else None,
+        'samples_per_sec_median': statistics.median(rates) if rates else None,
+        'eval_accuracy': accuracy[-1] if accuracy else None,
     }
+    for row in timeline:
+        row.update(filename=log_path.name, num_nodes=info['num_nodes'])
+    return {'run': run, 'timeline': timeline}
+
+
+def compare_runs(runs, tolerance=0.1):
+    """
+    Compare every run with the median of the runs at the same node count.
+    Sets duration_vs_median (1.0 = median) and slow, True when the run took
+    more than (1 + tolerance) times the median or its median samples/sec is
+    below (1 - tolerance) times the group's.
+    """
+    groups = {}
+    for run in runs:
+        groups.setdefault(run['num_nodes'], []).append(run)
+    for group in groups.values():
+        duration = statistics.median(r['duration_min'] for r in group)
+        rates = [r['samples_per_sec_median'] for r in group if r['samples_per_sec_median']]
+        rate = statistics.median(rates) if rates else None
+        for run in group:
+            run['duration_vs_median'] = run['duration_min'] / duration if duration else None
+            run['slow'] = len(group) > 1 and (
+                (run['duration_vs_median'] or 0) > 1 + tolerance or
+                (rate is not None and run['samples_per_sec_median'] is not None and
+                 run['samples_per_sec_median'] < (1 - tolerance) * rate))
+    return runs
+
+
+def process_compliance_file(comp: Path, full=False, events_dir=None):
+    """
+    Check one compliance_*.out and, if it passed, process the log it names
+    (first line, basename only). Returns the process_log_file() dict, with
+    full the analyze_log_file() dict, or None.
+    """
+    with open(comp, errors='replace') as f:
+        first = f.readline()
+        if 'INFO - SUCCESS' not in first and not any('INFO - SUCCESS' in l for l in f):
+            return None
+    log_path = comp.parent / Path(first.strip()).name
+    if not log_path.exists():
+        print(f"Warning: log file {log_path.name} for {comp.name} not found.", file=sys.stderr)
+        return None
+    if full:
+        return analyze_log_file(log_path, events_dir)
+    return process_log_file(log_path)
+
+
+def write_table(data, path, columns, csv_fallback=False):
+    """
+    Write rows (a list of dicts) or a {column: [values]} table to path,
+    Parquet for *.parquet, otherwise CSV. With csv_fallback a *.parquet path
+    is written as *.csv when pandas is not installed.
+    """
+    if path.endswith('.parquet'):
+        try:
+            import pandas as pd
+            pd.DataFrame(data, columns=columns).to_parquet(path, index=False)
+            return path
+        except ImportError:
+            if not csv_fallback:
+                raise
+            path = path[:-len('.parquet')] + '.csv'
+    rows = data if isinstance(data, list) else (dict(zip(columns, values)) for values in zip(*(data[c] for c in columns)))
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
 
 
 def main():
-    # Locate compliance files in current directory
-    compliance_files = sorted(Path('.').glob('compliance_*.out'))
-    results = []
-
-    for comp in compliance_files:
-        lines = comp.read_text().splitlines()
-        if any('INFO - SUCCESS' in l for l in lines):
-            # First line contains log filename; basename only
-            basename = Path(lines[0].strip()).name
-            log_path = comp.parent / basename
-            if log_path.exists():
-                result = process_log_file(log_path)
-                if result:
-                    results.append(result)
-            else:
-                print(f"Warning: log file {basename} for {comp.name} not found.")
+    parser = argparse.ArgumentParser(description="Summarize the MLPerf runs whose compliance check passed.")
+    parser.add_argument('-d', '--dir', default='.', help="Directory with the compliance_*.out files and logs (default: .)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="Logs processed in parallel (default: CPU count)")
+    parser.add_argument('-o', '--output', default=None, help="Also write the table to this .csv or .parquet file")
+    parser.add_argument('-t', '--timeline', default=None,
+                        help="Extract every MLLOG event and write the per epoch/block timeline of all runs to this .csv or .parquet file")
+    parser.add_argument('-e', '--events', default=None,
+                        help="Extract every MLLOG event and write one <log>.events.parquet (or .csv) table per run to this directory")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="A run is slow when it is this fraction slower than the median run with the same node count (default: 0.1)")
+    args = parser.parse_args()
+
+    full = bool(args.timeline or args.events)
+    if args.events:
+        os.makedirs(args.events, exist_ok=True)
+
+    # Locate compliance files
+    compliance_files = sorted(Path(args.dir).glob('compliance_*.out'))
+    worker = functools.partial(process_compliance_file, full=full, events_dir=args.events)
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        results = [r for r in pool.map(worker, compliance_files, chunksize=4) if r]
+
+    columns = COLUMNS
+    if full:
+        timeline = [row for r in results for row in r['timeline']]
+        results = compare_runs([r['run'] for r in results], args.tolerance)
+        columns = FULL_COLUMNS
 
     # Sort results by number of nodes
-    results_sorted = sorted(results, key=lambda x: (x['num_nodes'] is None, x['num_nodes']))
+    results_sorted = sorted(results, key=lambda x: (x['num_nodes'] is None, x['num_nodes'] or 0, x['filename']))
 
     # Print header
-    print("filename\tnum_nodes\tlogf\tlearning_rate\tstart_ms\tstop_ms\tduration_min")
+    print("\t".join(columns))
     for r in results_sorted:
-        print("\t".join(str(r[k]) for k in [
-            'filename', 'num_nodes', 'logf', 'learning_rate',
-            'start_ms', 'stop_ms', 'duration_min'
-        ]))
+        print("\t".join(str(r[k]) for k in columns))
+
+    if full:
+        for r in results_sorted:
+            if r['slow']:
+                rate = f", {r['samples_per_sec_median']:.1f} samples/s" if r['samples_per_sec_median'] else ""
+                print(f"Slow run: {r['filename']} ({r['num_nodes']} nodes, {r['duration_vs_median']:.2f}x the median time{rate}"
+                      f"{', nodes ' + r['nodelist'] if r['nodelist'] else ''})", file=sys.stderr)
+        if args.timeline:
+            write_table(timeline, args.timeline, TIMELINE_COLUMNS)
+    if args.output:
+        write_table(results_sorted, args.output, columns)
+
 
 if __name__ == '__main__':
     main()
-
@@ -6,12 +6,79 @@ import subprocess
 import tempfile
 import socket
 import sys
+import getpass
+import hashlib
+import heapq
+import shlex
+import re
+import threading
+import collections
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def rsync_chunk(source_dir, rel_paths, remote_user, target_ip, local_ip, dest_dir):
+import rail_transfer
+from transfer_progress import TransferStats, format_bytes
+
+# Bytes read per write to the ssh pipe when sending a file range
+RANGE_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Manifest of the sent files, kept in the source and every destination directory
+MANIFEST_NAME = '.dist_manifest.json'
+# Run with python3 on a node: print its manifest, keeping only the entries
+# whose file still has the size and mtime it had when the manifest was stored
+REMOTE_MANIFEST_CHECK = '''
+import json, os, sys
+dest_dir, path = sys.argv[1:3]
+try:
+    with open(path) as f:
+        manifest = json.load(f)
+except (OSError, ValueError):
+    manifest = {}
+valid = {}
+for rel, entry in manifest.items():
+    try:
+        st = os.stat(os.path.join(dest_dir, rel))
+    except OSError:
+        continue
+    if entry.pop('stored', [entry.get('size'), entry.get('mtime_ns')]) == [st.st_size, st.st_mtime_ns]:
+        valid[rel] = entry
+json.dump(valid, sys.stdout)
+'''
+# Run with python3 on a node: store the manifest read from stdin, with the
+# size and mtime each file has on the node (byte ranges do not keep the
+# source mtime)
+REMOTE_MANIFEST_STORE = '''
+import json, os, sys
+dest_dir, path = sys.argv[1:3]
+manifest = json.load(sys.stdin)
+for rel, entry in manifest.items():
+    try:
+        st = os.stat(os.path.join(dest_dir, rel))
+        entry['stored'] = [st.st_size, st.st_mtime_ns]
+    except OSError:
+        pass
+with open(path + '.tmp', 'w') as f:
+    json.dump(manifest, f)
+os.replace(path + '.tmp', path)
+'''
+# Bytes hashed at the start, middle and end of a file with --hash sample
+HASH_SAMPLE_SIZE = 1024 * 1024
+
+# A rail sends its chunk in batches of at most this many bytes or files, so
+# an idle rail can take over the batches a slow rail has not started yet
+BATCH_BYTES = 1 << 30
+BATCH_MAX_FILES = 10000
+
+# rsync --info=progress2 line: "  1,234,567  45%  12.34MB/s    0:00:10"
+RSYNC_PROGRESS = re.compile(r'^\s*([\d,]+)\s+\d+%')
+
+# Where a relay node keeps its copy of this script and the config (--mode tree)
+RELAY_DIR = '/tmp/dist_files_over_rdma'
+
+def rsync_chunk(source_dir, rel_paths, remote_user, target_ip, local_ip, dest_dir, progress=None):
     """
     Rsync a list of relative paths to a single remote IP,
-    binding the ssh socket to local_ip.
+    binding the ssh socket to local_ip. progress(nbytes) is called as
+    rsync reports the bytes it moved.
     """
     # write the list of relative paths to a temp file
     with tempfile.NamedTemporaryFile(mode='w', delete=False) as tf:
@@ -23,28 +90,572 @@ def rsync_chunk(source_dir, rel_paths, remote_user, target_ip, local_ip, dest_di
     cmd = [
         'rsync',
         '-av',
+        '--info=progress2',
         '-e', ssh_cmd,
         '--files-from=' + listfile,
         source_dir.rstrip('/') + '/',
         f'{remote_user}@{target_ip}:{dest_dir.rstrip("/")}/'
     ]
     print(f"[{target_ip} ← {local_ip}] Starting rsync of {len(rel_paths)} files…")
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if proc.returncode != 0:
-        print(f"[{target_ip}] ERROR: {proc.stderr.strip()}")
+    with tempfile.TemporaryFile() as errfile:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errfile)
+        # progress2 rewrites its line with \r, so split on both line ends
+        reported = 0
+        buf = b''
+        for data in iter(lambda: proc.stdout.read1(65536), b''):
+            *lines, buf = re.split(rb'[\r\n]', buf + data)
+            for line in lines:
+                m = RSYNC_PROGRESS.match(line.decode(errors='replace'))
+                if m and progress:
+                    moved = int(m.group(1).replace(',', ''))
+                    progress(moved - reported)
+                    reported = moved
+        returncode = proc.wait()
+        errfile.seek(0)
+        stderr = errfile.read().decode(errors='replace')
+    if returncode != 0:
+        print(f"[{target_ip}] ERROR: {stderr.strip()}")
     else:
         print(f"[{target_ip}] Done.")
     os.unlink(listfile)
+    return returncode == 0
+
+def send_range(source_dir, rel_path, offset, length, size, remote_user, target_ip, local_ip, dest_dir, progress=None):
+    """
+    Write bytes [offset, offset+length) of one file into the same place of the
+    remote copy, so several streams can fill in one large file at once.
+    """
+    remote_path = os.path.join(dest_dir, rel_path)
+    remote = (f"mkdir -p {shlex.quote(os.path.dirname(remote_path))} && "
+              f"dd of={shlex.quote(remote_path)} bs=4M oflag=seek_bytes seek={offset} conv=notrunc status=none && "
+              f"truncate -s {size} {shlex.quote(remote_path)}")
+    cmd = ['ssh', '-b', local_ip, f'{remote_user}@{target_ip}', remote]
+    with tempfile.TemporaryFile() as errfile:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=errfile)
+        error = None
+        try:
+            with open(os.path.join(source_dir, rel_path), 'rb') as f:
+                f.seek(offset)
+                remaining = length
+                while remaining > 0:
+                    block = f.read(min(RANGE_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    proc.stdin.write(block)
+                    remaining -= len(block)
+                    if progress:
+                        progress(len(block))
+        except OSError as e:
+            # BrokenPipeError when ssh or dd exits early; report it like any other failure
+            error = e
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        returncode = proc.wait()
+        errfile.seek(0)
+        stderr = errfile.read().decode(errors='replace').strip()
+    if returncode != 0 or error:
+        print(f"[{target_ip}] ERROR: {rel_path} [{offset}:{offset + length}]: {stderr or error}")
+        return False
+    return True
+
+def transfer_chunk(source_dir, chunk, remote_user, target_ip, local_ip, dest_dir, progress=None):
+    """
+    Send one chunk from split_into_chunks(): its whole files with rsync and
+    its byte ranges with send_range().
+    """
+    ok = True
+    if chunk['files']:
+        ok = rsync_chunk(source_dir, chunk['files'], remote_user, target_ip, local_ip, dest_dir, progress)
+    for rel, offset, length, size in chunk['ranges']:
+        ok = send_range(source_dir, rel, offset, length, size, remote_user, target_ip, local_ip, dest_dir, progress) and ok
+    return ok
+
+def transfer_chunk_tcp(source_dir, chunk, target_ip, local_ip, args, progress=None):
+    """
+    Send one chunk over args.streams_per_rail plain TCP connections to the
+    rail_transfer server of the target node.
+    """
+    items = []
+    for rel in chunk['files']:
+        st = os.stat(os.path.join(source_dir, rel))
+        items.append((rel, 0, st.st_size, st.st_size, st.st_mtime_ns))
+    for rel, offset, length, size in chunk['ranges']:
+        items.append((rel, offset, length, size, None))
+    groups = rail_transfer.balance(items, args.streams_per_rail)
+    print(f"[{target_ip} ← {local_ip}] Starting {len(groups)} TCP streams for {len(items)} files/ranges…")
+    with ThreadPoolExecutor(max_workers=len(groups) or 1) as pool:
+        errors = [e for errs in pool.map(lambda g: rail_transfer.send_items(
+            source_dir, g, local_ip, target_ip, args.port, not args.no_verify, progress), groups) for e in errs]
+    for error in errors:
+        print(f"[{target_ip}] ERROR: {error}")
+    if not errors:
+        print(f"[{target_ip}] Done.")
+    return not errors
+
+def start_tcp_server(node, args):
+    """
+    Start the rail_transfer receiver on a node's rail IPs. It runs until the
+    returned ssh process' stdin is closed.
+    """
+    remote = ' '.join(shlex.quote(a) for a in [
+        'python3', os.path.join(RELAY_DIR, 'rail_transfer.py'), 'serve',
+        '--dest', args.dest_dir, '--bind', ','.join(node['ips']), '--port', str(args.port)])
+    proc = subprocess.Popen(['ssh', f'{args.remote_user}@{node["hostname"]}', remote],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if proc.stdout.readline().strip() != 'READY':
+        proc.stdin.close()
+        print(f"[{node['hostname']}] ERROR: receiver did not start: {proc.stderr.read().strip()}", file=sys.stderr)
+        proc.wait()
+        return None
+    return proc
+
+def stop_tcp_server(proc):
+    proc.stdin.close()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+def collect_files(source_dir):
+    """
+    Walk source_dir once and return [(relative path, size, mtime_ns)].
+    """
+    all_files = []
+    for root, _, files in os.walk(source_dir):
+        for fn in files:
+            full = os.path.join(root, fn)
+            rel = os.path.relpath(full, source_dir)
+            if rel == MANIFEST_NAME:
+                continue
+            st = os.stat(full)
+            all_files.append((rel, st.st_size, st.st_mtime_ns))
+    return all_files
+
+def file_hash(path, size, hash_mode):
+    """
+    blake2b of the whole file (full) or of its size and first, middle and
+    last MiB (sample).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        if hash_mode == 'full':
+            for block in iter(lambda: f.read(RANGE_BLOCK_SIZE), b''):
+                h.update(block)
+        else:
+            h.update(str(size).encode())
+            for offset in sorted({0, max(0, size // 2 - HASH_SAMPLE_SIZE // 2), max(0, size - HASH_SAMPLE_SIZE)}):
+                f.seek(offset)
+                h.update(f.read(HASH_SAMPLE_SIZE))
+    return h.hexdigest()
 
-def split_into_chunks(all_paths, n_chunks):
+def build_manifest(source_dir, all_files, hash_mode='none', previous=None, max_workers=None):
     """
-    Distribute file paths into n nearly‐equal chunks.
+    {path: {"size", "mtime_ns"[, "hash"]}} for all_files. Hashes of files
+    whose size and mtime match the previous manifest are reused.
     """
-    chunks = [[] for _ in range(n_chunks)]
-    for idx, p in enumerate(all_paths):
-        chunks[idx % n_chunks].append(p)
+    previous = previous or {}
+    manifest = {}
+    to_hash = []
+    for rel, size, mtime_ns in all_files:
+        entry = {'size': size, 'mtime_ns': mtime_ns}
+        if hash_mode != 'none':
+            old = previous.get(rel, {})
+            if old.get('size') == size and old.get('mtime_ns') == mtime_ns and old.get('hash_mode') == hash_mode:
+                entry['hash'] = old['hash']
+            else:
+                to_hash.append((rel, size))
+            entry['hash_mode'] = hash_mode
+        manifest[rel] = entry
+    if to_hash:
+        print(f"Hashing {len(to_hash)} files…")
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            hashes = pool.map(lambda item: file_hash(os.path.join(source_dir, item[0]), item[1], hash_mode), to_hash)
+            for (rel, _), digest in zip(to_hash, hashes):
+                manifest[rel]['hash'] = digest
+    return manifest
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # A relay's copy also has the node side size and mtime of push_manifest
+    for entry in manifest.values():
+        entry.pop('stored', None)
+    return manifest
+
+def fetch_remote_manifest(hostname, args):
+    """
+    The manifest stored with the data on a node, {} if it has none.
+    Files deleted or changed on the node since the manifest was stored are
+    left out (checked in the same ssh call), so they are sent again.
+    """
+    path = os.path.join(args.dest_dir, MANIFEST_NAME)
+    remote = ' '.join(shlex.quote(a) for a in ['python3', '-c', REMOTE_MANIFEST_CHECK, args.dest_dir, path])
+    proc = subprocess.run(['ssh', f'{args.remote_user}@{hostname}', remote],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        return json.loads(proc.stdout) if proc.stdout.strip() else {}
+    except ValueError:
+        return {}
+
+def push_manifest(hostname, manifest, args):
+    path = os.path.join(args.dest_dir, MANIFEST_NAME)
+    remote = (f'mkdir -p {shlex.quote(args.dest_dir)} && ' +
+              ' '.join(shlex.quote(a) for a in ['python3', '-c', REMOTE_MANIFEST_STORE, args.dest_dir, path]))
+    proc = subprocess.run(['ssh', f'{args.remote_user}@{hostname}', remote],
+                          input=json.dumps(manifest), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        print(f"[{hostname}] WARNING: cannot store manifest: {proc.stderr.strip()}", file=sys.stderr)
+
+def changed_files(all_files, manifest, remote_manifest):
+    """
+    The files whose manifest entry differs from (or is missing in) the
+    remote manifest.
+    """
+    return [f for f in all_files if remote_manifest.get(f[0]) != manifest[f[0]]]
+
+def split_into_chunks(all_files, n_chunks, split_threshold=None):
+    """
+    Distribute (path, size, ...) tuples into n chunks of nearly equal total bytes.
+
+    Largest first, every item goes to the chunk with the fewest bytes so far.
+    Files bigger than split_threshold are first cut into up to n_chunks byte
+    ranges, so one large shard is spread over several rails instead of
+    pinning one rail while the others idle.
+
+    Returns [{"files": [path], "sizes": [size], "ranges": [(path, offset, length, size)], "bytes": n}].
+    """
+    items = []
+    for rel, size, *_ in all_files:
+        if split_threshold and size > split_threshold and n_chunks > 1:
+            pieces = min(n_chunks, -(-size // split_threshold))
+            step = -(-size // pieces)
+            for offset in range(0, size, step):
+                items.append((min(step, size - offset), rel, offset, size))
+        else:
+            items.append((size, rel, None, size))
+    items.sort(key=lambda item: item[0], reverse=True)
+
+    chunks = [{'files': [], 'sizes': [], 'ranges': [], 'bytes': 0} for _ in range(n_chunks)]
+    heap = [(0, i) for i in range(n_chunks)]
+    for length, rel, offset, size in items:
+        load, i = heapq.heappop(heap)
+        if offset is None:
+            chunks[i]['files'].append(rel)
+            chunks[i]['sizes'].append(size)
+        else:
+            chunks[i]['ranges'].append((rel, offset, length, size))
+        chunks[i]['bytes'] += length
+        heapq.heappush(heap, (load + length, i))
     return chunks
 
+def rail_groups(node, key):
+    """
+    {rail id: [IPs]} of a config node. key is "subnet" or "netdev" (needs
+    the "rails" fetch_rdma_to_json.py writes) or "index" (position in "ips").
+    """
+    groups = {}
+    if key == 'index':
+        for idx, ip in enumerate(node.get('ips', [])):
+            groups.setdefault(f"ips[{idx}]", []).append(ip)
+    else:
+        for rail in node['rails']:
+            groups.setdefault(rail[key], []).append(rail['ip'])
+    return groups
+
+def rail_key(local_node, remote_node):
+    """
+    How to tell which IPs of two nodes share a rail: by subnet when every
+    rail has its own subnet, by netdev name when all rails share one subnet
+    (rail-optimized fabrics such as H100), by list position when the config
+    has no "rails".
+    """
+    if not local_node.get('rails') or not remote_node.get('rails'):
+        return 'index'
+    for node in (local_node, remote_node):
+        subnets = [r['subnet'] for r in node['rails']]
+        if len(set(subnets)) < len(subnets):
+            return 'netdev'
+    return 'subnet'
+
+def match_rails(local_node, remote_node):
+    """
+    Pair every remote IP with a local IP on the same rail. The remote IPs of
+    a rail are spread round robin over the local IPs of that rail, so every
+    NIC carries the same number of streams.
+    Returns ([(remote IP, local IP)], unmatched remote rails, unmatched local rails).
+    """
+    key = rail_key(local_node, remote_node)
+    local = rail_groups(local_node, key)
+    remote = rail_groups(remote_node, key)
+    pairs = []
+    for rail, rips in remote.items():
+        lips = local.get(rail, [])
+        for i, rip in enumerate(rips):
+            if lips:
+                pairs.append((rip, lips[i % len(lips)]))
+    unmatched_remote = [f"{rail} ({','.join(ips)})" for rail, ips in remote.items() if rail not in local]
+    unmatched_local = [f"{rail} ({','.join(ips)})" for rail, ips in local.items() if rail not in remote]
+    return pairs, unmatched_remote, unmatched_local
+
+def build_tasks(targets, local_node, all_files, split_threshold, files_by_host=None):
+    """
+    One (hostname, remote IP, local IP, chunk) stream per matched rail of
+    every target node. files_by_host overrides all_files per node.
+    Returns the tasks and the nodes that share no rail with this one.
+    """
+    tasks = []
+    unreachable = []
+    for node in targets:
+        if not node.get('ips'):
+            continue
+        pairs, unmatched_remote, unmatched_local = match_rails(local_node, node)
+        if unmatched_remote:
+            print(f"[{node['hostname']}] WARNING: no local rail for {', '.join(unmatched_remote)}", file=sys.stderr)
+        if unmatched_local:
+            print(f"[{node['hostname']}] WARNING: no remote rail for local {', '.join(unmatched_local)}", file=sys.stderr)
+        if not pairs:
+            print(f"[{node['hostname']}] ERROR: no rail in common with {local_node['hostname']}", file=sys.stderr)
+            unreachable.append(node['hostname'])
+            continue
+
+        files = files_by_host[node['hostname']] if files_by_host is not None else all_files
+        chunks = split_into_chunks(files, len(pairs), split_threshold)
+        for (rip, lip), chunk in zip(pairs, chunks):
+            if not chunk['bytes'] and not chunk['files']:
+                continue
+            tasks.append((node['hostname'], rip, lip, chunk))
+    return tasks, unreachable
+
+def split_batches(chunk, batch_bytes=BATCH_BYTES, max_files=BATCH_MAX_FILES):
+    """
+    Cut a chunk into chunks of at most batch_bytes and max_files, keeping
+    its largest-first order. An item larger than batch_bytes is a batch of
+    its own.
+    """
+    batches = []
+    batch = None
+    items = [(rel, size, None) for rel, size in zip(chunk['files'], chunk['sizes'])]
+    items += [(rng[0], rng[2], rng) for rng in chunk['ranges']]
+    for rel, length, rng in items:
+        if batch is None or (batch['bytes'] and batch['bytes'] + length > batch_bytes) \
+                or len(batch['files']) + len(batch['ranges']) >= max_files:
+            batch = {'files': [], 'sizes': [], 'ranges': [], 'bytes': 0}
+            batches.append(batch)
+        if rng is None:
+            batch['files'].append(rel)
+            batch['sizes'].append(length)
+        else:
+            batch['ranges'].append(rng)
+        batch['bytes'] += length
+    return batches
+
+def rail_name(rip, lip):
+    return f"{lip}->{rip}"
+
+class RailQueue:
+    """
+    The batches every rail still has to send. A rail that runs out of work
+    takes the last batch of the rail of the same node with the most bytes
+    left, so the files a slow rail has not started yet move to the fast
+    rails instead of holding up the node.
+    """
+    def __init__(self, tasks, stats, batch_bytes=BATCH_BYTES):
+        self.lock = threading.Lock()
+        self.stats = stats
+        self.queues = {}
+        for hostname, rip, lip, chunk in tasks:
+            self.queues[(hostname, rip, lip)] = collections.deque(split_batches(chunk, batch_bytes))
+            stats.plan(hostname, rail_name(rip, lip), chunk['bytes'])
+
+    def take(self, hostname, rip, lip):
+        """The next batch for a rail, None when its node has nothing left to send."""
+        with self.lock:
+            own = self.queues[(hostname, rip, lip)]
+            if own:
+                return own.popleft()
+            left = [(sum(b['bytes'] for b in q), key) for key, q in self.queues.items() if key[0] == hostname and q]
+            if not left:
+                return None
+            _, (_, slow_rip, slow_lip) = max(left)
+            batch = self.queues[(hostname, slow_rip, slow_lip)].pop()
+        slow, fast = rail_name(slow_rip, slow_lip), rail_name(rip, lip)
+        print(f"[{hostname}] Reassigning {len(batch['files']) + len(batch['ranges'])} files/ranges "
+              f"({format_bytes(batch['bytes'])}) from rail {slow} ({format_bytes(self.stats.rate(hostname, slow))}/s) "
+              f"to {fast} ({format_bytes(self.stats.rate(hostname, fast))}/s)")
+        self.stats.reassign(hostname, slow, fast, batch['bytes'])
+        return batch
+
+def run_rail(hostname, rip, lip, queue, stats, args):
+    """
+    Send batches over one rail until its node has nothing left.
+    """
+    rail = rail_name(rip, lip)
+    progress = stats.progress(hostname, rail)
+    stats.started(hostname, rail)
+    ok = True
+    while True:
+        batch = queue.take(hostname, rip, lip)
+        if batch is None:
+            break
+        if args.engine == 'tcp':
+            ok = transfer_chunk_tcp(args.source_dir, batch, rip, lip, args, progress) and ok
+        else:
+            ok = transfer_chunk(args.source_dir, batch, args.remote_user, rip, lip, args.dest_dir, progress) and ok
+    stats.finished(hostname, rail, ok)
+    return ok
+
+def run_tasks(tasks, args, stats):
+    """
+    Run all streams in parallel, return {hostname: True if all its streams succeeded}.
+    """
+    status = {hostname: True for hostname, *_ in tasks}
+    if not tasks:
+        return status
+    queue = RailQueue(tasks, stats, args.batch_bytes)
+    max_workers = args.max_workers or len(tasks)
+    print(f"Spawning up to {max_workers} {args.engine} jobs across {len(tasks)} streams…")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for hostname, rip, lip, chunk in tasks:
+            future = pool.submit(run_rail, hostname, rip, lip, queue, stats, args)
+            futures[future] = hostname
+        for f in as_completed(futures):
+            status[futures[f]] = f.result() and status[futures[f]]
+    return status
+
+def send_to_nodes(targets, local_node, all_files, args, manifest=None, stats=None):
+    """
+    Send the data to targets from this node. With a manifest only the files
+    that differ from each node's stored manifest are sent, and the manifest
+    is stored on every node that received everything. The bytes sent are
+    counted in stats.
+    Returns {hostname: ok}.
+    """
+    stats = stats or TransferStats()
+    files_by_host = None
+    if manifest is not None:
+        with ThreadPoolExecutor(max_workers=args.max_workers or len(targets)) as pool:
+            remote = dict(zip((n['hostname'] for n in targets),
+                              pool.map(lambda n: fetch_remote_manifest(n['hostname'], args), targets)))
+        files_by_host = {}
+        for node in targets:
+            files = changed_files(all_files, manifest, remote[node['hostname']])
+            files_by_host[node['hostname']] = files
+            print(f"[{node['hostname']}] {len(files)} of {len(all_files)} files to send "
+                  f"({sum(f[1] for f in files)} bytes)")
+
+    tasks, unreachable = build_tasks(targets, local_node, all_files, args.split_threshold, files_by_host)
+    servers = {}
+    if args.engine == 'tcp':
+        busy = [n for n in targets if any(t[0] == n['hostname'] for t in tasks)]
+        with ThreadPoolExecutor(max_workers=args.max_workers or len(busy) or 1) as pool:
+            staged = dict(zip((n['hostname'] for n in busy), pool.map(lambda n: stage_relay(n['hostname'], args), busy)))
+            servers = dict(zip((n['hostname'] for n in busy),
+                               pool.map(lambda n: start_tcp_server(n, args) if staged[n['hostname']] else None, busy)))
+        tasks = [t for t in tasks if servers.get(t[0])]
+    try:
+        status = run_tasks(tasks, args, stats)
+    finally:
+        for proc in servers.values():
+            if proc:
+                stop_tcp_server(proc)
+    for hostname, proc in servers.items():
+        if proc is None:
+            status[hostname] = False
+    for hostname in unreachable:
+        status[hostname] = False
+    for node in targets:
+        status.setdefault(node['hostname'], True)
+    if manifest is not None:
+        for hostname, ok in status.items():
+            if ok and remote[hostname] != manifest:
+                push_manifest(hostname, manifest, args)
+    return status
+
+def stage_relay(hostname, args):
+    """
+    Copy this script, its modules and the config to a node so it can
+    forward the data or receive it over --engine tcp.
+    """
+    ok = True
+    modules = [os.path.join(os.path.dirname(os.path.abspath(__file__)), m) for m in ('rail_transfer.py', 'transfer_progress.py')]
+    for local_path in [os.path.abspath(__file__)] + modules + [args.config]:
+        remote_path = os.path.join(RELAY_DIR, os.path.basename(local_path))
+        with open(local_path, 'rb') as f:
+            proc = subprocess.run(['ssh', f'{args.remote_user}@{hostname}',
+                                   f'mkdir -p {RELAY_DIR} && cat > {remote_path}'],
+                                  stdin=f, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            print(f"[{hostname}] ERROR: cannot stage relay: {proc.stderr.strip()}", file=sys.stderr)
+            ok = False
+    return ok
+
+def relay(sender, receiver, args):
+    """
+    Have sender, which already holds the data in dest-dir, push it to
+    receiver over its own rails.
+    """
+    remote = ' '.join(shlex.quote(a) for a in [
+        'python3', os.path.join(RELAY_DIR, os.path.basename(__file__)),
+        '-c', os.path.join(RELAY_DIR, os.path.basename(args.config)),
+        '-s', args.dest_dir, '-d', args.dest_dir, '-u', args.remote_user,
+        '--split-threshold', str(args.split_threshold), '--batch-bytes', str(args.batch_bytes),
+        '--progress-interval', '0',
+        '--local-host', sender, '--targets', receiver,
+        '--engine', args.engine, '--streams-per-rail', str(args.streams_per_rail), '--port', str(args.port)] +
+        (['--no-verify'] if args.no_verify else []) +
+        (['--incremental', '--hash', args.hash, '--trust-manifest'] if args.incremental else []))
+    print(f"[{receiver} ← {sender}] Relaying…")
+    proc = subprocess.run(['ssh', f'{args.remote_user}@{sender}', remote],
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if proc.returncode != 0:
+        print(f"[{receiver} ← {sender}] ERROR: {proc.stdout.strip()[-2000:]}", file=sys.stderr)
+    return proc.returncode == 0
+
+def broadcast_tree(local_entry, targets, all_files, args, manifest=None, stats=None):
+    """
+    Binomial broadcast: in every round each node that has the data sends it
+    to one node that does not, so N nodes are reached in about log2(N)
+    rounds and the source's rails stop being the bottleneck. Only the sends
+    of this node are counted in stats. Returns the nodes that could not be
+    reached.
+    """
+    by_name = {node['hostname']: node for node in targets}
+    pending = [node['hostname'] for node in targets]
+    holders = [local_entry['hostname']]
+    failed = []
+
+    # Every target may become a sender, stage the script on all of them up front
+    with ThreadPoolExecutor(max_workers=args.max_workers or len(pending) or 1) as pool:
+        staged = dict(zip(pending, pool.map(lambda h: stage_relay(h, args), pending)))
+
+    rnd = 0
+    while pending:
+        rnd += 1
+        pairs = list(zip(holders, pending))
+        pending = pending[len(pairs):]
+        print(f"Round {rnd}: " + ", ".join(f"{s} → {r}" for s, r in pairs))
+
+        def send(pair):
+            sender, receiver = pair
+            if sender == local_entry['hostname']:
+                return all(send_to_nodes([by_name[receiver]], local_entry, all_files, args, manifest, stats).values())
+            return relay(sender, receiver, args)
+
+        with ThreadPoolExecutor(max_workers=len(pairs)) as pool:
+            for (sender, receiver), ok in zip(pairs, pool.map(send, pairs)):
+                if ok and staged.get(receiver):
+                    holders.append(receiver)
+                elif not ok:
+                    failed.append(receiver)
+    return failed
+
 def main():
     parser = argparse.ArgumentParser(
         description="Parallel directory copy over multi‐rail RDMA with explicit binding."
@@ -55,10 +666,38 @@ def main():
                         help="Local directory to copy.")
     parser.add_argument('-d', '--dest-dir', required=True,
                         help="Destination directory on remote nodes.")
-    parser.add_argument('-u', '--remote-user', default=os.getlogin(),
+    parser.add_argument('-u', '--remote-user', default=getpass.getuser(),
                         help="SSH user.")
     parser.add_argument('-w', '--max-workers', type=int, default=None,
                         help="Max parallel rsync tasks.")
+    parser.add_argument('--split-threshold', type=int, default=1 << 30,
+                        help="Send files larger than this many bytes as byte ranges over several rails (default: 1 GiB, 0 disables).")
+    parser.add_argument('--batch-bytes', type=int, default=BATCH_BYTES,
+                        help="Bytes per batch a rail sends at once; batches a slow rail has not started move to idle rails (default: 1 GiB).")
+    parser.add_argument('--progress-interval', type=float, default=10,
+                        help="Seconds between progress lines with the bytes, rate and ETA per node (default: 10, 0 disables).")
+    parser.add_argument('--report', default=None,
+                        help="Write the per node and per rail byte counts, rates and errors to this JSON file.")
+    parser.add_argument('-m', '--mode', choices=['direct', 'tree'], default='direct',
+                        help="direct: this node sends to every node; tree: nodes that have the data forward it (binomial broadcast).")
+    parser.add_argument('--targets', default=None,
+                        help="Comma separated hostnames to send to (default: every other node in the config).")
+    parser.add_argument('--local-host', default=None,
+                        help="Hostname of this node in the config (default: detected).")
+    parser.add_argument('-e', '--engine', choices=['rsync', 'tcp'], default='rsync',
+                        help="rsync over ssh, or plain TCP with sendfile and checksums (trusted RDMA network only).")
+    parser.add_argument('--streams-per-rail', type=int, default=4,
+                        help="TCP connections per rail with --engine tcp (default: 4).")
+    parser.add_argument('--port', type=int, default=rail_transfer.DEFAULT_PORT,
+                        help=f"TCP port of the receivers with --engine tcp (default: {rail_transfer.DEFAULT_PORT}).")
+    parser.add_argument('--no-verify', action='store_true',
+                        help="Skip the checksum comparison of --engine tcp.")
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help=f"Only send files that differ from the {MANIFEST_NAME} manifest stored on each node.")
+    parser.add_argument('--hash', choices=['none', 'sample', 'full'], default='none',
+                        help="Content hash in the manifest besides size and mtime (default: none).")
+    parser.add_argument('--trust-manifest', action='store_true',
+                        help="Take the file list from the manifest in the source directory instead of scanning it (used by relays).")
     args = parser.parse_args()
 
     # load config
@@ -70,76 +709,63 @@ def main():
         sys.exit(1)
 
     # figure out which host this is, so we can get its local IP list
-    local_hostnames = {socket.gethostname(), socket.getfqdn()}
+    local_hostnames = {args.local_host} if args.local_host else {socket.gethostname(), socket.getfqdn()}
     local_entry = next((n for n in nodes
                         if n['hostname'] in local_hostnames), None)
     if not local_entry:
         print("ERROR: this host not found in config; cannot bind locally", file=sys.stderr)
         sys.exit(1)
-    local_ips = local_entry.get('ips', [])
-    if not local_ips:
+    if not local_entry.get('ips'):
         print("ERROR: no local IPs listed for this host in config", file=sys.stderr)
         sys.exit(1)
 
     # collect files
-    all_files = []
-    for root, _, files in os.walk(args.source_dir):
-        for fn in files:
-            full = os.path.join(root, fn)
-            rel = os.path.relpath(full, args.source_dir)
-            all_files.append(rel)
+    manifest = None
+    manifest_path = os.path.join(args.source_dir, MANIFEST_NAME)
+    if args.incremental and args.trust_manifest and os.path.exists(manifest_path):
+        # A relay holds exactly what its sender's manifest lists
+        manifest = load_manifest(manifest_path)
+        all_files = [(rel, e['size'], e['mtime_ns']) for rel, e in manifest.items()]
+    else:
+        all_files = collect_files(args.source_dir)
+        if args.incremental:
+            manifest = build_manifest(args.source_dir, all_files, args.hash, load_manifest(manifest_path), args.max_workers)
+            try:
+                with open(manifest_path, 'w') as f:
+                    json.dump(manifest, f)
+            except OSError as e:
+                print(f"WARNING: cannot cache the manifest in the source directory: {e}", file=sys.stderr)
     if not all_files:
         print("ERROR: no files under", args.source_dir, file=sys.stderr)
         sys.exit(1)
 
-    # build task list
-    tasks = []
-    for node in nodes:
-        hostname = node['hostname']
-        # skip sending to self
-        if hostname in local_hostnames:
-            continue
-
-        remote_ips = node.get('ips', [])
-        if not remote_ips:
-            continue
-
-        chunks = split_into_chunks(all_files, len(remote_ips))
-        for idx, (rip, chunk) in enumerate(zip(remote_ips, chunks)):
-            if not chunk:
-                continue
-            # pick the corresponding local IP
-            if idx < len(local_ips):
-                lip = local_ips[idx]
-            else:
-                # fallback if counts mismatch
-                lip = local_ips[0]
-                print(f"WARNING: fewer local IPs than remote; binding all extras to {lip}",
-                      file=sys.stderr)
-
-            tasks.append((rip, lip, chunk))
-
-    if not tasks:
+    # skip sending to self
+    targets = [n for n in nodes if n['hostname'] not in local_hostnames and n.get('ips')]
+    if args.targets:
+        wanted = set(args.targets.split(','))
+        targets = [n for n in targets if n['hostname'] in wanted]
+    if not targets:
         print("No work to do; all hosts skipped.", file=sys.stderr)
         sys.exit(0)
 
-    max_workers = args.max_workers or len(tasks)
-    print(f"Spawning up to {max_workers} rsync jobs across {len(tasks)} streams…")
-
-    with ThreadPoolExecutor(max_workers=max_workers) as pool:
-        futures = []
-        for rip, lip, chunk in tasks:
-            futures.append(pool.submit(
-                rsync_chunk,
-                args.source_dir,
-                chunk,
-                args.remote_user,
-                rip,
-                lip,
-                args.dest_dir
-            ))
-        for f in as_completed(futures):
-            f.result()
+    stats = TransferStats()
+    if args.progress_interval > 0:
+        stats.report_every(args.progress_interval)
+    try:
+        if args.mode == 'tree':
+            failed = broadcast_tree(local_entry, targets, all_files, args, manifest, stats)
+        else:
+            status = send_to_nodes(targets, local_entry, all_files, args, manifest, stats)
+            failed = [h for h, ok in status.items() if not ok]
+    finally:
+        stats.stop()
+    if stats.rails:
+        print(stats.summary_table())
+    if args.report:
+        stats.write_report(args.report, mode=args.mode, engine=args.engine, failed=failed)
+    if failed:
+        print(f"ERROR: failed to send to {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
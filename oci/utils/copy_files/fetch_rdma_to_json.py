@@ -5,32 +5,99 @@ import sys
 import json
 import re
 import os
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def get_rdma_ips(node, user=None, ssh_key=None):
+# Discovered nodes, reused by later runs unless --refresh is given
+DEFAULT_CACHE = os.path.expanduser("~/.cache/fetch_rdma_to_json.json")
+
+# One line per rdma* interface: "<netdev> <ip>/<prefix> <mlx5 device>"
+REMOTE_CMD = r"""ip -o -4 addr show | awk '/ rdma[0-9]+ / {print $2, $4}' | while read dev addr; do echo "$dev $addr $(ls /sys/class/net/$dev/device/infiniband 2>/dev/null | head -1)"; done"""
+
+def get_rdma_rails(node, user=None, ssh_key=None, timeout=30):
     """
-    SSH to `node` and return a list of IPv4 addresses (no CIDR) for all rdma[0-9]* interfaces.
+    SSH to `node` and return one {"netdev", "ip", "subnet", "device"} per
+    rdma[0-9]* interface, sorted by netdev. None if the node could not be
+    reached within timeout seconds.
     """
     ssh_target = f"{user+'@' if user else ''}{node}"
-    ssh_cmd = ["ssh", "-o", "BatchMode=yes"]
+    ssh_cmd = ["ssh", "-o", "BatchMode=yes", "-o", f"ConnectTimeout={timeout}"]
     if ssh_key:
         ssh_cmd += ["-i", ssh_key]
     ssh_cmd.append(ssh_target)
+    ssh_cmd.append(REMOTE_CMD)
 
-    # ask remote for rdma* IPv4 addrs
-    remote = r"""ip -o -4 addr show | awk '/ rdma[0-9]+ / {print $4}'"""
-    ssh_cmd.append(remote)
-
-    proc = subprocess.run(ssh_cmd,
-                          stdout=subprocess.PIPE,
-                          stderr=subprocess.PIPE,
-                          text=True)
+    try:
+        proc = subprocess.run(ssh_cmd,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE,
+                              text=True,
+                              timeout=timeout)
+    except subprocess.TimeoutExpired:
+        print(f"WARNING: {node}: no answer within {timeout}s", file=sys.stderr)
+        return None
     if proc.returncode != 0:
         print(f"WARNING: {node}: SSH error: {proc.stderr.strip()}", file=sys.stderr)
-        return []
+        return None
+
+    rails = []
+    for line in proc.stdout.splitlines():
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+        iface = ipaddress.ip_interface(fields[1])
+        rails.append({
+            "netdev": fields[0],
+            "ip": str(iface.ip),
+            "subnet": str(iface.network),
+            "device": fields[2] if len(fields) > 2 else None,
+        })
+    return sorted(rails, key=lambda r: natural_key(r["netdev"]))
+
+def get_rdma_ips(node, user=None, ssh_key=None, timeout=30):
+    """
+    SSH to `node` and return a list of IPv4 addresses (no CIDR) for all rdma[0-9]* interfaces.
+    """
+    return [r["ip"] for r in get_rdma_rails(node, user, ssh_key, timeout) or []]
+
+def natural_key(name):
+    return [int(t) if t.isdigit() else t for t in re.split(r'(\d+)', name)]
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    # strip off any /mask
-    addrs = [line.split('/')[0] for line in proc.stdout.splitlines() if line.strip()]
-    return addrs
+def save_cache(path, cache):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, path)
+
+def discover(nodes, user=None, ssh_key=None, timeout=30, max_workers=32, cache=None):
+    """
+    Query all nodes not in cache concurrently, at most max_workers ssh
+    sessions at a time. Returns {node: rails or None}; cache is updated with
+    every node that answered with at least one rail.
+    """
+    cache = {} if cache is None else cache
+    found = {node: cache[node] for node in nodes if cache.get(node)}
+    todo = [node for node in nodes if node not in found]
+    if found:
+        print(f"{len(found)} nodes from the cache, discovering {len(todo)}", file=sys.stderr)
+    if not todo:
+        return found
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(get_rdma_rails, node, user, ssh_key, timeout): node for node in todo}
+        for future in as_completed(futures):
+            node = futures[future]
+            found[node] = future.result()
+            if found[node]:
+                cache[node] = found[node]
+    return found
 
 def parse_pattern(pattern):
     """
@@ -81,6 +148,22 @@ def main():
         "-i", "--ssh-key",
         help="SSH private key (if needed)."
     )
+    parser.add_argument(
+        "-w", "--max-workers", type=int, default=32,
+        help="Nodes queried at the same time (default: 32)."
+    )
+    parser.add_argument(
+        "-t", "--timeout", type=int, default=30,
+        help="Seconds to wait for a node (default: 30)."
+    )
+    parser.add_argument(
+        "--cache", default=DEFAULT_CACHE,
+        help=f"File of already discovered nodes (default: {DEFAULT_CACHE}, empty string disables)."
+    )
+    parser.add_argument(
+        "--refresh", action="store_true",
+        help="Query every node again instead of using the cache."
+    )
     args = parser.parse_args()
 
     # build list of nodes from file or pattern
@@ -102,13 +185,31 @@ def main():
         print("ERROR: No nodes to process.", file=sys.stderr)
         sys.exit(1)
 
+    cache = load_cache(args.cache) if args.cache else {}
+    if args.refresh:
+        for node in nodes:
+            cache.pop(node, None)
+    found = discover(nodes, user=args.user, ssh_key=args.ssh_key, timeout=args.timeout,
+                     max_workers=args.max_workers, cache=cache)
+    if args.cache:
+        try:
+            save_cache(args.cache, cache)
+        except OSError as e:
+            print(f"WARNING: cannot write cache {args.cache}: {e}", file=sys.stderr)
+
+    # "ips" stays the plain list older configs had, "rails" adds the subnet
+    # and device of every IP so the rails can be matched by subnet
     output = {"nodes": []}
     for node in nodes:
-        ips = get_rdma_ips(node, user=args.user, ssh_key=args.ssh_key)
+        rails = found.get(node) or []
         output["nodes"].append({
             "hostname": node,
-            "ips": ips
+            "ips": [r["ip"] for r in rails],
+            "rails": rails
         })
+    missing = [node for node in nodes if not found.get(node)]
+    if missing:
+        print(f"WARNING: no RDMA IPs for {len(missing)} nodes: {','.join(missing)}", file=sys.stderr)
 
     # emit JSON on stdout
     json.dump(output, sys.stdout, indent=2)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# Plain TCP file transfer over the RDMA rails, the --engine tcp of
+# dist_files_over_rdma.py.
+#
+# rsync over ssh encrypts every byte and runs its delta algorithm, which caps
+# a stream at a few GB/s even on trusted rails. Here the receiving node runs
+# `rail_transfer.py serve`, listening on its rail IPs only, and the sender opens
+# several connections per rail bound to the matching local IP. File ranges are
+# sent with os.sendfile (zero copy from the page cache) and written with
+# os.pwrite, so ranges of one file can arrive over different streams. The
+# receiver answers every range with its blake2b, which the sender compares
+# against its own copy.
+#
+# Only use this on the private RDMA network: the data is not encrypted.
+#
+# The server exits when its stdin closes, i.e. when the ssh session that
+# started it ends.
+import argparse
+import hashlib
+import heapq
+import json
+import os
+import socket
+import sys
+import threading
+
+BLOCK_SIZE = 8 * 1024 * 1024
+DEFAULT_PORT = 18600
+
+
+def range_hash(path, offset, length):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            block = f.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            h.update(block)
+            remaining -= len(block)
+    return h.hexdigest()
+
+
+def balance(items, n):
+    """
+    Split (path, offset, length, size, mtime_ns) items into n lists of
+    nearly equal bytes, largest first onto the lightest list.
+    """
+    groups = [[] for _ in range(n)]
+    heap = [(0, i) for i in range(n)]
+    for item in sorted(items, key=lambda item: item[2], reverse=True):
+        load, i = heapq.heappop(heap)
+        groups[i].append(item)
+        heapq.heappush(heap, (load + item[2], i))
+    return [g for g in groups if g]
+
+
+class TransferServer:
+    def __init__(self, dest_dir, bind_ips, port=DEFAULT_PORT):
+        self.dest_dir = os.path.realpath(dest_dir)
+        self.bind_ips = bind_ips
+        self.port = port
+        self.listeners = []
+
+    def _target(self, rel_path):
+        path = os.path.realpath(os.path.join(self.dest_dir, rel_path))
+        if not path.startswith(self.dest_dir + os.sep):
+            raise ValueError(f"path outside the destination: {rel_path}")
+        return path
+
+    def receive(self, rfile, item):
+        path = self._target(item['path'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        h = hashlib.blake2b(digest_size=16)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            offset = item['offset']
+            remaining = item['length']
+            while remaining > 0:
+                block = rfile.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    raise ConnectionError(f"connection closed with {remaining} bytes of {item['path']} left")
+                os.pwrite(fd, block, offset)
+                h.update(block)
+                offset += len(block)
+                remaining -= len(block)
+            # Every range sets the full size, so a stale longer file cannot keep its tail
+            os.ftruncate(fd, item['size'])
+        finally:
+            os.close(fd)
+        if item.get('mtime_ns') is not None:
+            os.utime(path, ns=(item['mtime_ns'], item['mtime_ns']))
+        return h.hexdigest()
+
+    def handle(self, conn):
+        with conn, conn.makefile('rb') as rfile:
+            for line in rfile:
+                try:
+                    digest = self.receive(rfile, json.loads(line))
+                    conn.sendall(f"OK {digest}\n".encode())
+                except (OSError, ValueError) as e:
+                    conn.sendall(f"ERROR {e}\n".encode())
+                    return
+
+    def _accept(self, listener):
+        while True:
+            conn, _ = listener.accept()
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def start(self):
+        for ip in self.bind_ips:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((ip, self.port))
+            listener.listen(64)
+            self.listeners.append(listener)
+            threading.Thread(target=self._accept, args=(listener,), daemon=True).start()
+
+
+def send_items(source_dir, items, local_ip, remote_ip, port=DEFAULT_PORT, verify=True, progress=None):
+    """
+    Send (path, offset, length, size, mtime_ns) items over one connection
+    bound to local_ip. progress(nbytes) is called as the bytes are sent.
+    Returns a list of error strings, empty on success.
+    """
+    errors = []
+    try:
+        _send_items(source_dir, items, local_ip, remote_ip, port, verify, progress, errors)
+    except OSError as e:
+        errors.append(f"{remote_ip}: {e}")
+    return errors
+
+
+def _send_items(source_dir, items, local_ip, remote_ip, port, verify, progress, errors):
+    with socket.create_connection((remote_ip, port), source_address=(local_ip, 0)) as sock, \
+            sock.makefile('rb') as rfile:
+        for rel, offset, length, size, mtime_ns in items:
+            header = {'path': rel, 'offset': offset, 'length': length, 'size': size, 'mtime_ns': mtime_ns}
+            sock.sendall((json.dumps(header) + "\n").encode())
+            path = os.path.join(source_dir, rel)
+            with open(path, 'rb') as f:
+                sent = 0
+                while sent < length:
+                    n = os.sendfile(sock.fileno(), f.fileno(), offset + sent, length - sent)
+                    if n == 0:
+                        raise ConnectionError(f"{rel} shrank while sending")
+                    sent += n
+                    if progress:
+                        progress(n)
+            reply = rfile.readline().decode().split(maxsplit=1)
+            if not reply or reply[0] != 'OK':
+                errors.append(f"{rel} [{offset}:{offset + length}]: {reply[1].strip() if len(reply) > 1 else 'connection lost'}")
+                break
+            if verify and reply[1].strip() != range_hash(path, offset, length):
+                errors.append(f"{rel} [{offset}:{offset + length}]: checksum mismatch")
+
+
+def serve(args):
+    server = TransferServer(args.dest, args.bind.split(','), args.port)
+    server.start()
+    print("READY", flush=True)
+    # Live as long as the ssh session that started us
+    sys.stdin.read()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Receive files over plain TCP on the RDMA rails.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('serve', help="Receive into a directory until stdin closes.")
+    p.add_argument('--dest', required=True, help="Destination directory.")
+    p.add_argument('--bind', required=True, help="Comma separated IPs to listen on.")
+    p.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT}).")
+    args = parser.parse_args()
+    serve(args)
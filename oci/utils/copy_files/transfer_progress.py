@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# Byte accounting for dist_files_over_rdma.py.
+#
+# Every stream reports the bytes it moved through a callback; TransferStats
+# keeps the planned and transferred bytes of every (destination, rail), and
+# prints the rate and ETA of each destination at a fixed interval. Rails that
+# run well below the median rate of their destination are marked as slow.
+# At the end it prints a summary table and can write the same numbers as a
+# JSON report.
+import json
+import statistics
+import threading
+import time
+
+# A rail running for at least SLOW_AFTER seconds below SLOW_FRACTION of the
+# median rate of its node's rails is reported as slow
+SLOW_FRACTION = 0.5
+SLOW_AFTER = 5.0
+
+
+class TransferStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rails = {}
+        self.start_time = time.time()
+        self.end_time = None
+
+    def _rail(self, host, rail):
+        if (host, rail) not in self.rails:
+            self.rails[(host, rail)] = {'host': host, 'rail': rail, 'planned': 0, 'done': 0, 'start': None,
+                                        'end': None, 'errors': 0, 'reassigned_in': 0, 'reassigned_out': 0}
+        return self.rails[(host, rail)]
+
+    def plan(self, host, rail, nbytes):
+        with self.lock:
+            self._rail(host, rail)['planned'] += nbytes
+
+    def started(self, host, rail):
+        with self.lock:
+            r = self._rail(host, rail)
+            r['start'] = r['start'] or time.time()
+
+    def finished(self, host, rail, ok=True):
+        with self.lock:
+            r = self._rail(host, rail)
+            r['end'] = time.time()
+            if not ok:
+                r['errors'] += 1
+
+    def progress(self, host, rail):
+        """Callback adding transferred bytes to one rail."""
+        def add(nbytes):
+            with self.lock:
+                self.rails[(host, rail)]['done'] += nbytes
+        return add
+
+    def reassign(self, host, from_rail, to_rail, nbytes):
+        with self.lock:
+            self._rail(host, from_rail)['planned'] -= nbytes
+            self._rail(host, from_rail)['reassigned_out'] += nbytes
+            self._rail(host, to_rail)['planned'] += nbytes
+            self._rail(host, to_rail)['reassigned_in'] += nbytes
+
+    def rate(self, host, rail):
+        """Bytes per second of a rail since it started."""
+        r = self.rails[(host, rail)]
+        if not r['start']:
+            return 0.0
+        elapsed = (r['end'] or time.time()) - r['start']
+        return r['done'] / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self):
+        """
+        {"hosts": [{host, planned, done, rate, eta}], "rails": [{..., rate, slow}],
+        "elapsed", "planned", "done", "rate"}
+        """
+        with self.lock:
+            now = self.end_time or time.time()
+            rails = []
+            for (host, rail), r in sorted(self.rails.items()):
+                rails.append(dict(r, rate=self.rate(host, rail), slow=False))
+        hosts = {}
+        for r in rails:
+            h = hosts.setdefault(r['host'], {'host': r['host'], 'planned': 0, 'done': 0, 'rails': []})
+            h['planned'] += r['planned']
+            h['done'] += r['done']
+            h['rails'].append(r)
+        for h in hosts.values():
+            started = [r for r in h['rails'] if r['start']]
+            if started:
+                end = max(r['end'] or now for r in started) if all(r['end'] for r in h['rails']) else now
+                elapsed = end - min(r['start'] for r in started)
+                h['rate'] = h['done'] / elapsed if elapsed > 0 else 0.0
+            else:
+                h['rate'] = 0.0
+            # Rails that are still busy but well below their siblings
+            busy = [r for r in started if not r['end'] and now - r['start'] >= SLOW_AFTER]
+            if len(started) > 1:
+                median = statistics.median(r['rate'] for r in started)
+                for r in busy:
+                    r['slow'] = r['rate'] < SLOW_FRACTION * median
+            remaining = h['planned'] - h['done']
+            h['eta'] = remaining / h['rate'] if h['rate'] > 0 and remaining > 0 else 0.0
+            del h['rails']
+        elapsed = now - self.start_time
+        done = sum(r['done'] for r in rails)
+        return {'elapsed': elapsed, 'planned': sum(r['planned'] for r in rails), 'done': done,
+                'rate': done / elapsed if elapsed > 0 else 0.0,
+                'hosts': list(hosts.values()), 'rails': rails}
+
+    def print_progress(self):
+        snap = self.snapshot()
+        for h in snap['hosts']:
+            if h['done'] >= h['planned']:
+                continue
+            pct = h['done'] / h['planned'] * 100 if h['planned'] else 100.0
+            print(f"[{h['host']}] {format_bytes(h['done'])}/{format_bytes(h['planned'])} ({pct:.0f}%) "
+                  f"{format_bytes(h['rate'])}/s ETA {h['eta']:.0f}s")
+        for r in snap['rails']:
+            if r['slow']:
+                print(f"[{r['host']}] WARNING: rail {r['rail']} is slow: {format_bytes(r['rate'])}/s")
+
+    def report_every(self, interval):
+        """Print progress every interval seconds until stop() is called."""
+        self._stop = threading.Event()
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.print_progress()
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.end_time = time.time()
+        if getattr(self, '_stop', None):
+            self._stop.set()
+            self._thread.join()
+
+    def summary_table(self):
+        snap = self.snapshot()
+        header = ['host', 'rail', 'bytes', 'seconds', 'rate/s', 'moved in', 'moved out', 'errors']
+        rows = []
+        for r in snap['rails']:
+            seconds = (r['end'] or time.time()) - r['start'] if r['start'] else 0.0
+            rows.append([r['host'], r['rail'], format_bytes(r['done']), f"{seconds:.1f}", format_bytes(r['rate']),
+                         format_bytes(r['reassigned_in']), format_bytes(r['reassigned_out']), str(r['errors'])])
+        rows.append(['total', '', format_bytes(snap['done']), f"{snap['elapsed']:.1f}", format_bytes(snap['rate']), '', '', ''])
+        widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+        return "\n".join("  ".join(c.ljust(w) for c, w in zip(row, widths)) for row in [header] + rows)
+
+    def write_report(self, path, **extra):
+        with open(path, 'w') as f:
+            json.dump(dict(self.snapshot(), **extra), f, indent=2)
+
+
+def format_bytes(n):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
@@ -0,0 +1 @@
+../../h100_health_checks/result_store.py
\ No newline at end of file
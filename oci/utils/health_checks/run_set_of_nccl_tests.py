@@ -18,6 +18,7 @@ import sys
 from datetime import datetime
 import os
 from collections import Counter
+from result_store import make_result, record, DEFAULT_DB
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
@@ -131,6 +132,17 @@ def _hosts_from_file(path):
         logging.warning(f"Could not read hostfile {path}: {e}")
         return []
 
+def nccl_results(df, run_type):
+    """Result database rows: the Avg BW of every run, once for each host of its HostSet."""
+    rows = []
+    for row in df.to_dict('records'):
+        status = str(row.get('Status'))
+        component = f"{run_type} {row.get('Nodes')}n {row.get('algo')}/{row.get('proto')}"
+        for host in _hosts_from_file(row['HostSet']):
+            rows.append(make_result("nccl", "avg_busbw", row.get('Avg BW'), status, component=component,
+                                    hostname=host.split()[0], detail=f"{row['HostSet']}: {status}"))
+    return rows
+
 def _write_pruned_hostfile(hosts, args):
     """Write current in-memory hosts list to a pruned hostfile path."""
     pruned_path = args.pruned_hostfile or f"{os.path.splitext(args.hostfile)[0]}_pruned.txt"
@@ -803,6 +815,7 @@ def execute_command_in_sets_of_hosts_with_mpirun(args, dargs, date_stamp):
         all_results_df.to_csv(os.path.join(args.output_dir, report_name), index=False)
     else:
         all_results_df.to_csv(report_name, index=False)
+    record(nccl_results(all_results_df, run_type), args.results_db)
 
     tmp_results_df = all_results_df.loc[:, ~all_results_df.columns.str.startswith('time_')]
 
@@ -880,6 +893,7 @@ if __name__ == "__main__":
     parser.add_argument('--good_hosts', type=str, help='List of good hosts')
     parser.add_argument('--nccl_qps_per_connection', type=int, required=False, help='NCCL IB QPS per connection')
     parser.add_argument('--output_dir', type=str, required=False, help='Output directory for the results')
+    parser.add_argument('--results_db', type=str, default=DEFAULT_DB, help='Result database to add the per host Avg BW to, empty to disable (default: %(default)s)')
     parser.add_argument('--node_shape', type=str, required=False, default='h100', help='Node shape (h100, h200, b200, mi300x)')
     parser.add_argument('--net_plugin', type=str, required=False, default='none', help='path to the NCCL net plugin to use')
     parser.add_argument('--timeout', type=int, required=False, default=300, help='Timeout for the command in seconds')